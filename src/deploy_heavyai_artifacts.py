@@ -11,29 +11,266 @@ Requires heavydb >= 7.0
 """
 
 import argparse
+import atexit
+import json
 import os
 import re
 import sys
 
 from dotenv import load_dotenv
-from heavyai import connect
 from io import StringIO as IO
 
 #debug
 import traceback
-from icecream import ic
+# from icecream import ic (slow to import, so only when debugging)
 
+from deployment import profile
 from deployment.constants import *
 from deployment.validate import validate
-from deployment.plan import generate_plan, generate_ddl
+from deployment.plan import dashboard_process_pool, generate_plan, generate_ddl
+from deployment.planfile import load_plan, save_plan
+from deployment.profile import span
 from deployment.apply import apply_ddl
-from deployment.util import get_file_content, obfuscate_secrets
+from deployment.fleet import Instance, apply_instances, plan_instances, read_connection_urls, summarize
+from deployment.graph import OperationGraph
+from deployment.journal import Journal
+from deployment.state import State
+from deployment.target import parse_target
+from deployment.util import FileCache, SessionPool, get_env_var_names, get_file_content, obfuscate_secrets, share_file_contents, use_file_cache
 
 
 PROGNAME = os.path.basename(__file__)
 PROGDIR = os.path.dirname(os.path.abspath(__file__))
 
 
+def positive_int(value: str) -> int:
+    """An argparse type for counts that must be at least 1."""
+
+    try:
+        n = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'invalid int value: {value!r}')
+
+    if n < 1:
+        raise argparse.ArgumentTypeError(f'must be at least 1: {n}')
+
+    return n
+
+
+def write_profile(profiler: profile.Profiler, args: argparse.Namespace) -> None:
+    if args.trace:
+        profiler.write_trace(args.trace)
+        print(f'Trace written to "{args.trace}".')
+
+    if args.profile_out:
+        with open(args.profile_out, 'w') as f:
+            json.dump(profiler.report(), f, indent=2)
+
+        print(f'Profile written to "{args.profile_out}".')
+
+    elif args.profile:
+        for line in profile.format_report(profiler.report()):
+            print(line)
+
+
+def print_ddls(graph: OperationGraph, verbose: bool) -> None:
+    for ddl in graph.ddls():
+        ddl = obfuscate_secrets(ddl)
+        if not verbose and len(ddl) > VERBOSE_WIDTH:
+            ddl = ddl[:VERBOSE_WIDTH] + '...'
+        
+        if ddl.startswith('-- ('):
+            print(f'  {COLORS.HEADER}{ddl}{COLORS.END}')
+        else:
+            print(f'    {ddl}')
+
+
+def main_fleet(args: argparse.Namespace, conf: dict, targets: list[tuple]) -> None:
+    """Plans and applies the artifacts file on every server in the --servers list, concurrently."""
+
+    try:
+        instances = [ Instance(url) for url in read_connection_urls(args.servers) ]
+    except Exception as e:
+        print(f'{PROGNAME}: {e}')
+        sys.exit(1)
+
+    # log out of every server's sessions however the run ends.
+    #
+    try:
+        print(f'{"Resuming" if args.resume else "Planning"} {len(instances)} servers ...')
+        process_executor = dashboard_process_pool(args.plan_processes)
+
+        with span('phase', 'plan'):
+            plan_instances(instances, conf, args.server_workers, args.plan_workers, args.state, args.journal,
+                           args.incremental, targets, args.resume, args.command == 'apply', process_executor)
+
+        if process_executor is not None:
+            process_executor.shutdown()
+
+        for inst in instances:
+            print(f'{COLORS.HEADER}== {inst.server} =={COLORS.END}')
+            if inst.error is not None:
+                print(inst.error)
+            elif inst.graph is not None:
+                print_ddls(inst.graph, args.verbose)
+            else:
+                print(f'  {inst.status.capitalize()}.')
+
+        print('Summary:')
+        for line in summarize(instances):
+            print(f'  {line}')
+
+        if args.command == 'plan' or not any(i.status == 'planned' for i in instances):
+            sys.exit(0 if all(i.error is None for i in instances) else 1)
+
+        print('Execute DDL statements on the planned servers? [y/N] ', end='')
+        accept = input()
+        if accept.lower() != 'y':
+            print('Aborting.')
+            sys.exit(0)
+
+        print('Applying DDL ...')
+        with span('phase', 'apply'):
+            apply_instances(instances, args.server_workers, get_env_var_names(get_file_content(args.file)),
+                            args.parallelism, args.import_concurrency, args.state, args.journal)
+
+        for inst in instances:
+            if inst.error is not None:
+                print(f'{COLORS.HEADER}== {inst.server} =={COLORS.END}')
+                print(inst.error)
+
+        print('Summary:')
+        for line in summarize(instances):
+            print(f'  {line}')
+
+        if any(i.status.endswith('failed') for i in instances):
+            print(f'Run "apply --resume" with the same --servers to retry the statements that did not complete.')
+            sys.exit(1)
+
+        print('DDL statements applied successfully.')
+
+    finally:
+        for inst in instances:
+            inst.pool.close()
+
+
+def main_server(args: argparse.Namespace, conf: dict, targets: list[tuple], pool: SessionPool) -> None:
+    """Plans and applies the artifacts file on the server in the artifacts file."""
+
+    journal = None
+    state = None
+
+    if args.resume:
+        # the server has changed since the journaled plan was made, so it
+        # can't be planned again. pick up the journaled DDL instead.
+        #
+        print(f'Resuming from journal "{args.journal}" ...')
+        try:
+            journal, graph = Journal.resume(args.journal)
+        except Exception as e:
+            print(e)
+            sys.exit(1)
+
+        done = len([ op for op in graph.ops if op.state == OPERATION_STATES.DONE ])
+        print(f'{done} of {len(graph.ops)} DDL statements already applied and will be skipped. Journaled DDL statements:')
+
+    elif args.plan_file:
+        # the plan was reviewed when it was made, so apply it as it is, as
+        # long as nothing it was planned from has changed since.
+        #
+        print(f'Checking plan file "{args.plan_file}" ...')
+        try:
+            with span('phase', 'check_plan'):
+                plan, graph = load_plan(args.plan_file, conf, pool)
+            state = State.load(args.state, pool.server)
+        except Exception as e:
+            print(e)
+            sys.exit(1)
+
+        print('DDL statements in the plan file:')
+
+    else:
+        if args.command == 'apply' and Journal.unfinished(args.journal):
+            print(f'{COLORS.FAIL}An unfinished apply was journaled in "{args.journal}". '
+                  f'Run "apply --resume" to finish it, or remove the file to start over.{COLORS.END}')
+            sys.exit(1)
+
+        print('Generating plan ...')
+        try:
+            state = State.load(args.state, pool.server)
+            process_executor = dashboard_process_pool(args.plan_processes)
+
+            with span('phase', 'plan'):
+                plan = generate_plan(conf, pool, args.plan_workers, state, args.incremental, targets, process_executor)
+
+            if process_executor is not None:
+                process_executor.shutdown()
+        except Exception as e:
+            print(e)
+
+            # for debugging
+            #print(traceback.format_exc())
+
+            sys.exit(1)
+
+        print('Plan generation successful.')
+        #ic(plan)
+
+        print('Generating DDL ...')
+        with span('phase', 'generate_ddl'):
+            graph = generate_ddl(plan)
+        print('DDL statements generated for the plan:')
+
+    print_ddls(graph, args.verbose)
+
+    if args.command == 'plan':
+        if args.out:
+            try:
+                save_plan(args.out, plan, graph, pool.server, get_env_var_names(get_file_content(args.file)), len(targets) != 0)
+            except Exception as e:
+                print(f'{PROGNAME}: Unable to save the plan: {e}')
+                sys.exit(1)
+
+            print(f'Plan saved to "{args.out}". Apply it with "apply --plan-file {args.out}".')
+
+        sys.exit(0)
+    
+    print('Execute DDL statements? [y/N] ', end='')
+    accept = input()
+    if accept.lower() != 'y':
+        print('Aborting.')
+        sys.exit(0)
+
+    print('Applying DDL ...')
+    try:
+        if not args.resume:
+            journal = Journal.create(args.journal, graph, get_env_var_names(get_file_content(args.file)))
+
+        with span('phase', 'apply'):
+            apply_ddl(pool, graph, args.verbose, args.parallelism, args.import_concurrency, journal)
+    except Exception as e:
+        print(e)
+        print(f'Run "apply --resume" to retry the statements that did not complete (see "{args.journal}").')
+        sys.exit(1)
+    finally:
+        if journal is not None:
+            journal.close()
+
+        # record whatever was applied, even if not everything was. (a resumed
+        # apply has no plan to record. the state from before is left as it
+        # is; it's checked against the server when it's used anyway.)
+        #
+        if state is not None:
+            try:
+                with span('phase', 'save_state'):
+                    state.update(plan, graph, pool)
+                    state.save(args.state)
+            except Exception as e:
+                print(f'{COLORS.WARNING}Unable to save the state to "{args.state}": {e}{COLORS.END}')
+    
+    print('DDL statements applied successfully.')
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description='Apply initial settings or updates to heavydb instance of the HeavyEco environment in the input JSON doc file.')
     parser.add_argument('command', choices=['validate', 'plan', 'apply'])
@@ -41,14 +278,55 @@ def main() -> None:
                         help='The JSON file containing the expected finished environment state.')
     parser.add_argument('--env', metavar='<Path or URI to an env file>',
                         help='The file containing environment variables to use in the JSON file. (Optional)')
+    parser.add_argument('--servers', metavar='<Path or URI to a list of connection URLs>',
+                        help='Deploy to every server in the file (one connection URL per line) instead of the one in the JSON file. (Optional)')
+    parser.add_argument('--server-workers', metavar='N', type=int, default=4,
+                        help='Number of servers to plan and apply concurrently with --servers. (Optional, default 4)')
     parser.add_argument('--verbose', '-v', action='store_true',
                         help='Print full DDL statements. (Optional)')
-    # not in the initial implementation
-    # parser.add_argument('--target', metavar='<artifact or artifact grouping>', nargs='*',
-    #                     help='Only apply changes to this artifact or artifact grouping.')
+    parser.add_argument('--plan-workers', metavar='N', type=int, default=1,
+                        help='Number of concurrent workers used to inspect the server and artifact files while planning. (Optional, default 1)')
+    parser.add_argument('--plan-processes', metavar='N', type=int, default=0,
+                        help='Number of processes to compare dashboards with the server copies and find their tables in while planning, '
+                             'to spread the CPU-bound work across cores. (Optional, default 0: in the planner threads)')
+    parser.add_argument('--parallelism', metavar='N', type=int, default=1,
+                        help='Number of independent DDL statements to apply concurrently. (Optional, default 1)')
+    parser.add_argument('--import-concurrency', metavar='N', type=positive_int,
+                        help='Number of table imports (largest first) to run concurrently, in addition to the --parallelism statements. (Optional, by default imports count towards --parallelism)')
+    parser.add_argument('--journal', metavar='<Path to a journal file>', default=DEFAULT_JOURNAL_FILE,
+                        help=f'The file apply records its progress in. (Optional, default "{DEFAULT_JOURNAL_FILE}")')
+    parser.add_argument('--state', metavar='<Path to a state file>', default=DEFAULT_STATE_FILE,
+                        help=f'The file recording what was last applied to the server, used to skip comparing unchanged dashboards while planning. (Optional, default "{DEFAULT_STATE_FILE}")')
+    parser.add_argument('--cache-dir', metavar='<Path to a directory>', default=DEFAULT_CACHE_DIR,
+                        help=f'Where to keep downloaded DDL and dashboard files, so later runs only download the ones that changed. (Optional, default "{DEFAULT_CACHE_DIR}")')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Download every remote DDL and dashboard file, without using or updating the --cache-dir. (Optional)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only plan the artifacts whose configuration or files changed since they were last applied (according to the state file), and what depends on them. (Optional)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Resume the unfinished apply recorded in the journal, skipping the statements that completed. (Optional, apply only)')
+    parser.add_argument('--out', metavar='<Path to a plan file>',
+                        help='Save the plan to the file, to apply later with "apply --plan-file". (Optional, plan only)')
+    parser.add_argument('--plan-file', metavar='<Path to a plan file>',
+                        help='Apply the plan saved by "plan --out" instead of planning again, unless it has gone stale. (Optional, apply only)')
+    parser.add_argument('--profile', action='store_true',
+                        help='Time the phases of the run, the planning and applying of each artifact, the Thrift calls and the file accesses, '
+                             'and print a report at the end. (Optional)')
+    parser.add_argument('--profile-out', metavar='<Path to a JSON report>',
+                        help='Write the --profile report to the file as JSON instead of printing it. (Optional)')
+    parser.add_argument('--trace', metavar='<Path to a trace file>',
+                        help='Write a timeline of the run (planners, file accesses, Thrift calls and DDL statements, by thread) '
+                             'to the file in Chrome trace event format, for Perfetto or chrome://tracing. (Optional)')
+    parser.add_argument('--target', metavar='<artifact or artifact grouping>', nargs='*',
+                        help='Only plan and apply changes to this artifact or artifact grouping (and what recreating it loses, e.g. '
+                             'the grants and policies of a role), creating the artifacts it depends on if they don\'t exist, '
+                             'e.g. dashboards.heavyai."My Dashboard" or static_tables.heavyai.*. (Optional)')
 
     args = parser.parse_args()
 
+    if args.profile or args.profile_out or args.trace:
+        atexit.register(write_profile, profile.enable(), args)
+
     # ic(args)
     if args.env:
         try:
@@ -59,7 +337,8 @@ def main() -> None:
 
     print('Validating ...')
     try:
-        conf = validate(args.file)
+        with span('phase', 'validate'):
+            conf = validate(args.file)
     except Exception as e:
         print(f'{PROGNAME}: {e}')
         sys.exit(1)
@@ -70,54 +349,66 @@ def main() -> None:
     if args.command == 'validate':
         sys.exit(0)
 
-    print('Generating plan ...')
-    try:
-        url = conf['connection_url']
-        print(f'  Connecting to server with {re.sub(RE_OBFUSCATE_DB_URL_PW, RE_OBFUSCATE_DB_URL_PW_REPL, url)}')
-        con = connect(url)
+    # read (or download) each DDL and dashboard file once for the whole run:
+    # planning checks and compares them, applying imports them, and with
+    # --servers every instance uses the same ones.
+    #
+    share_file_contents()
 
-        plan = generate_plan(conf, con)
-    except Exception as e:
-        print(e)
+    if not args.no_cache:
+        use_file_cache(FileCache(os.path.expanduser(args.cache_dir)))
+
+    if args.resume and args.command != 'apply':
+        print(f'{PROGNAME}: --resume only applies to the "apply" command.')
+        sys.exit(1)
 
-        # for debugging
-        #print(traceback.format_exc())
+    if args.out and args.command != 'plan':
+        print(f'{PROGNAME}: --out only applies to the "plan" command.')
+        sys.exit(1)
 
+    if args.plan_file and (args.command != 'apply' or args.resume or args.incremental or args.target):
+        print(f'{PROGNAME}: --plan-file only applies to the "apply" command, without --resume, --incremental or --target.')
         sys.exit(1)
 
-    print('Plan generation successful.')
-    #ic(plan)
+    if args.servers and (args.out or args.plan_file):
+        print(f'{PROGNAME}: --out and --plan-file only apply to a single server.')
+        sys.exit(1)
 
-    print('Generating DDL ...')
-    ddls = generate_ddl(plan)
-    print('DDL statements generated for the plan:')
-    for ddl in ddls:
-        ddl = obfuscate_secrets(ddl)
-        if not args.verbose and len(ddl) > VERBOSE_WIDTH:
-            ddl = ddl[:VERBOSE_WIDTH] + '...'
-        
-        if ddl.startswith('-- ('):
-            print(f'  {COLORS.HEADER}{ddl}{COLORS.END}')
-        else:
-            print(f'    {ddl}')
+    try:
+        targets = [ parse_target(t) for t in args.target or [] ]
+    except Exception as e:
+        print(f'{PROGNAME}: {e}')
+        sys.exit(1)
 
-    if args.command == 'plan':
-        sys.exit(0)
-    
-    print('Execute DDL statements? [y/N] ', end='')
-    accept = input()
-    if accept.lower() != 'y':
-        print('Aborting.')
+    if args.servers:
+        main_fleet(args, conf, targets)
         sys.exit(0)
 
-    print('Applying DDL ...')
     try:
-        apply_ddl(con, ddls, args.verbose)
+        url = conf['connection_url']
+        print(f'  Connecting to server with {re.sub(RE_OBFUSCATE_DB_URL_PW, RE_OBFUSCATE_DB_URL_PW_REPL, url)}')
+        pool = SessionPool(url)
     except Exception as e:
         print(e)
         sys.exit(1)
-    
-    print('DDL statements applied successfully.')
+
+    # there's a session per planner or apply thread and database, so log them
+    # all out however the run ends.
+    #
+    try:
+        # open the connection to the default database right away so a bad URL
+        # or password fails here rather than part way through planning.
+        #
+        try:
+            with span('phase', 'connect'):
+                pool.get()
+        except Exception as e:
+            print(e)
+            sys.exit(1)
+
+        main_server(args, conf, targets, pool)
+    finally:
+        pool.close()
 
 
 if __name__ == '__main__':
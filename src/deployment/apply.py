@@ -1,61 +1,358 @@
-from heavyai import Connection
-from icecream import ic
+import heapq
+import threading
+import time
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
 
 from .constants import *
-from .util import exec_dash_ddl, get_dash_id_from_name, obfuscate_secrets
-
-def apply_ddl(con: Connection, ddls: list[str], verbose = False) -> None:
-    db = None
-    prev_success = False
-
-    for ddl in ddls:
-        
-        if ddl.startswith('--'):
-            if ddl.startswith('-- ('):
-                print(f'  {COLORS.HEADER}{ddl}{COLORS.END}')
-            else:
-                print(f'    {ddl}')
-            continue
+from .graph import Operation, OperationGraph
+from .journal import Journal
+from .profile import span
+from .util import SessionPool, exec_dash_ddl, get_dash_id_from_name, get_file_size, get_s3_client, obfuscate_secrets
 
-        if ddl.startswith('\\db '):
-            db = ddl.split()[1]
-            print(f'    -- Switching to database "{db}" --')
-            con._client.switch_database(con._session, db)
-            continue
 
-        if m := re.match(RE_IS_GRANT_ON_DASH_ID_TBD_DDL, ddl):
-            full_quoted_dash = m.group(1)
-            dash_name = m.group(2).replace("\\'", "'")
-            dash_id = get_dash_id_from_name(con, db, dash_name)
-            ddl = re.sub(full_quoted_dash, str(dash_id), ddl)
-
-        if re.match(RE_IS_DROP_TABLE_DDL, ddl) and not prev_success:
-            # skip dropping the backup table if the previous command (a "copy
-            # ... from" or "restore table") errored out.
-            #
-            print(f'    -- {COLORS.WARNING}Previous import command failed. Skipping {ddl}{COLORS.END}')
-            continue
+# worker threads print whole lines, one at a time. a label (i.e. the server,
+# when several are applied at once) is put in front of every line.
+#
+_print_lock = threading.Lock()
 
-        
-        pr_ddl = obfuscate_secrets(ddl)
-        if not verbose and len(pr_ddl) > VERBOSE_WIDTH:
-            print(f'    {pr_ddl[:VERBOSE_WIDTH]} ...')
-        else:
-            print(f'    {pr_ddl}')
+def _print(msg: str, label: str = None) -> None:
+    if label is not None:
+        msg = '\n'.join(f'[{label}] {line}' for line in msg.split('\n'))
+
+    with _print_lock:
+        print(msg)
+
+
+class ImportScheduler:
+    """
+    Picks the next ready operation to run.
+
+    Imports (RESTORE TABLE and COPY ... FROM) are the long poles of an apply, so
+    the largest ready import is always started first, and at most
+    "import_concurrency" of them run at a time. By default imports share the
+    "parallelism" slots with the other operations; with an import concurrency
+    they get slots of their own. Other operations run in plan order.
+
+    The scheduler also keeps the timings of the imports for progress reports.
+    """
+
+    def __init__(self, graph: OperationGraph, parallelism: int = 1, import_concurrency: int = None, sizes: dict = None,
+                 label: str = None):
+        self._ops = graph.ops
+        self.label = label # printed in front of the progress lines
+        self.parallelism = max(parallelism, 1)
+        self.import_concurrency = import_concurrency
+        self.sizes: dict[int, int] = sizes if sizes is not None else {} # import op id -> source size (None if unknown)
+
+        self._ready_imports: list[tuple] = [] # heap of (-size, op id)
+        self._ready_other: list[int] = []     # heap of op ids
+        self._running_other = 0
+        self._running_imports: dict[int, float] = {} # op id -> start time
+
+        self._lock = threading.Lock()
+        self.start_time = time.monotonic()
+        self.imports_done = 0
+        self.imported_bytes = 0
 
-        if re.match(RE_IS_DASH_MGMT_DDL, ddl):
-            exec_dash_ddl(con, ddl)
+    @property
+    def max_workers(self) -> int:
+        return self.parallelism + (self.import_concurrency or 0)
+
+    def is_import(self, op: Operation) -> bool:
+        return op.op_id in self.sizes
+
+    def push(self, op: Operation) -> None:
+        if self.is_import(op):
+            heapq.heappush(self._ready_imports, (-(self.sizes[op.op_id] or 0), op.op_id))
         else:
-            try:
-                con.execute(ddl)
-                prev_success = True
-            except Exception as e:
-                if re.match(RE_IS_IMPORT_DDL, ddl):
-                    # ignore import errors but note the failure for the next
-                    # ddl command (which might be a "drop table" ddl)
-                    #
-                    print(f'    {COLORS.FAIL}-- Import failure: {e}{COLORS.END}')
-                    prev_success = False
-                else:
-                    print(f'    {COLORS.FAIL}-- Error: {e}{COLORS.END}')
-                    raise e
+            heapq.heappush(self._ready_other, op.op_id)
+
+    def pop(self) -> Operation:
+        """Returns the next operation to start, or None if nothing can start right now."""
+
+        running_imports = len(self._running_imports)
+        import_cap = self.import_concurrency or self.parallelism
+        shared = self.import_concurrency is None
+
+        if self._ready_imports and running_imports < import_cap and \
+           (not shared or running_imports + self._running_other < self.parallelism):
+
+            op = self._ops[heapq.heappop(self._ready_imports)[1]]
+            with self._lock:
+                self._running_imports[op.op_id] = time.monotonic()
+
+            return op
+
+        if self._ready_other and \
+           self._running_other + (running_imports if shared else 0) < self.parallelism:
+
+            self._running_other += 1
+            return self._ops[heapq.heappop(self._ready_other)]
+
+        return None
+
+    def finished(self, op: Operation, success: bool) -> None:
+        if not self.is_import(op):
+            self._running_other -= 1
+            return
+
+        with self._lock:
+            elapsed = time.monotonic() - self._running_imports.pop(op.op_id)
+            size = self.sizes[op.op_id]
+
+            if success:
+                self.imports_done += 1
+                self.imported_bytes += size or 0
+
+        if success:
+            _print(f'    [{op.db}] -- Imported {_import_table(op)}: {_format_size(size)} in {_format_time(elapsed)} ({_format_rate(size, elapsed)})', self.label)
+
+    def report(self) -> None:
+        """Prints the elapsed time of the running imports and the overall throughput."""
+
+        now = time.monotonic()
+        with self._lock:
+            running = sorted(self._running_imports.items(), key=lambda i: i[1])
+            done = self.imports_done
+            imported = self.imported_bytes
+
+        if not running:
+            return
+
+        total = sum(s or 0 for s in self.sizes.values())
+        lines = [ f'    -- Imports: {done} of {len(self.sizes)} done, {_format_size(imported)} of {_format_size(total)} '
+                  f'({_format_rate(imported, now - self.start_time)} overall)' ]
+
+        for op_id, start in running:
+            op = self._ops[op_id]
+            lines.append(f'    --   [{op.db}] {_import_table(op)}: {_format_size(self.sizes[op_id])}, running for {_format_time(now - start)}')
+
+        _print('\n'.join(lines), self.label)
+
+
+def get_import_sizes(graph: OperationGraph, workers: int = 8) -> dict[int, int]:
+    """
+    Looks up the size of the source of every import in the graph, by op id.
+    Sources that can't be found (e.g. files local to the server) have a size
+    of None.
+    """
+
+    imports = {}
+    for op in graph.ops:
+        if op.state != OPERATION_STATES.PENDING:
+            continue
+
+        if m := re.match(RE_IMPORT_TABLE_AND_SOURCE, op.ddl):
+            imports[op.op_id] = m.group(2)
+
+    if len(imports) == 0:
+        return {}
+
+    s3_client = get_s3_client() if any(uri.startswith('s3://') for uri in imports.values()) else None
+
+    def size(uri: str) -> int:
+        try:
+            return get_file_size(uri, s3_client)
+        except Exception:
+            return None
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='import_size') as executor:
+        return dict(zip(imports, executor.map(size, imports.values())))
+
+
+def apply_ddl(pool: SessionPool, graph: OperationGraph, verbose = False, parallelism: int = 1, import_concurrency: int = None,
+              journal: Journal = None, label: str = None) -> None:
+    """
+    Runs the operations in the graph, up to "parallelism" at a time, each one
+    as soon as everything it depends on has been applied. See ImportScheduler
+    for how imports are ordered and limited.
+
+    A failed operation only stops the operations downstream of it; the other
+    branches of the graph are still applied. Import failures are reported but
+    don't fail the apply. Any other failure raises a RuntimeError once
+    everything that can run has run.
+
+    Operations already marked done (i.e. by a resumed journal) are not run
+    again. If a journal is given, every operation is recorded in it. If a
+    label is given, every line printed starts with it.
+    """
+
+    if not graph.resolved:
+        graph.resolve()
+
+    ops = graph.ops
+    dependents = graph.dependents()
+    remaining = { op.op_id: len([ d for d in op.deps if ops[d].state != OPERATION_STATES.DONE ]) for op in ops }
+
+    scheduler = ImportScheduler(graph, parallelism, import_concurrency, get_import_sizes(graph), label)
+    if len(scheduler.sizes) != 0:
+        total = sum(s or 0 for s in scheduler.sizes.values())
+        _print(f'    -- {len(scheduler.sizes)} imports, {_format_size(total)} in total. Largest first, '
+               f'{scheduler.import_concurrency or scheduler.parallelism} at a time.', label)
+
+    for op in ops:
+        if remaining[op.op_id] == 0 and op.state == OPERATION_STATES.PENDING:
+            scheduler.push(op)
+
+    failed: list[Operation] = []
+    skipped: list[Operation] = []
+
+    # report on the running imports every so often, since they can run for a
+    # long time without any other output.
+    #
+    stop_reports = threading.Event()
+    def report() -> None:
+        while not stop_reports.wait(IMPORT_PROGRESS_INTERVAL):
+            scheduler.report()
+
+    reporter = threading.Thread(target=report, name='import_progress', daemon=True)
+    reporter.start()
+
+    try:
+        with ThreadPoolExecutor(max_workers=scheduler.max_workers, thread_name_prefix='apply') as executor:
+            running = {}
+
+            while True:
+                while (op := scheduler.pop()) is not None:
+                    running[executor.submit(_apply_op, pool, op, verbose, journal, label)] = op
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+                for f in done:
+                    op = running.pop(f)
+                    e = f.exception()
+                    scheduler.finished(op, e is None)
+
+                    if e is None:
+                        op.state = OPERATION_STATES.DONE
+
+                        for d in dependents[op.op_id]:
+                            remaining[d] -= 1
+                            if remaining[d] == 0 and ops[d].state == OPERATION_STATES.PENDING:
+                                scheduler.push(ops[d])
+
+                        continue
+
+                    op.state = OPERATION_STATES.FAILED
+                    failed.append(op)
+
+                    if re.match(RE_IS_IMPORT_DDL, op.ddl):
+                        _print(f'    {COLORS.FAIL}[{op.db}] -- Import failure: {e}{COLORS.END}', label)
+                    else:
+                        _print(f'    {COLORS.FAIL}[{op.db}] -- Error: {e}{COLORS.END}', label)
+
+                    for d in graph.downstream(op):
+                        if d.state != OPERATION_STATES.PENDING:
+                            continue
+
+                        d.state = OPERATION_STATES.SKIPPED
+                        if journal is not None:
+                            journal.skipped(d)
+
+                        if d.is_note:
+                            continue
+
+                        skipped.append(d)
+                        _print(f'    {COLORS.WARNING}[{d.db}] -- Skipping {_short_ddl(d.ddl, verbose)} (depends on a failed statement){COLORS.END}', label)
+    finally:
+        stop_reports.set()
+        reporter.join()
+
+    # failed imports are reported but don't fail the apply (the tables are
+    # there, just not all their data), so they don't leave it unfinished.
+    #
+    errors = [ op for op in failed if not re.match(RE_IS_IMPORT_DDL, op.ddl) ]
+
+    if journal is not None:
+        journal.end(len(errors) == 0)
+
+    if len(failed) != 0:
+        _print(f'  {len(failed)} statement(s) failed, {len(skipped)} skipped.', label)
+
+    if len(errors) != 0:
+        raise RuntimeError(f'{COLORS.FAIL}Failed to apply:\n' +
+                           '\n'.join(f'    [{op.db}] {_short_ddl(op.ddl, verbose)}' for op in errors) +
+                           f'{COLORS.END}')
+
+
+def _apply_op(pool: SessionPool, op: Operation, verbose: bool, journal: Journal = None, label: str = None) -> None:
+    with span('ddl', ' '.join(op.ddl.split()[:2]), op.db, op.artifact):
+        _journal_op(pool, op, verbose, journal, label)
+
+
+def _journal_op(pool: SessionPool, op: Operation, verbose: bool, journal: Journal = None, label: str = None) -> None:
+    if journal is None:
+        return _exec_op(pool, op, verbose, label)
+
+    journal.started(op)
+    start = time.monotonic()
+
+    try:
+        _exec_op(pool, op, verbose, label)
+    except Exception as e:
+        journal.finished(op, time.monotonic() - start, e)
+        raise
+
+    journal.finished(op, time.monotonic() - start)
+
+
+def _exec_op(pool: SessionPool, op: Operation, verbose: bool, label: str = None) -> None:
+    if op.is_note:
+        _print(f'    [{op.db}] {op.ddl}', label)
+        return
+
+    ddl = op.ddl
+
+    if m := re.match(RE_IS_GRANT_ON_DASH_ID_TBD_DDL, ddl):
+        full_quoted_dash = m.group(1)
+        dash_name = m.group(2).replace("\\'", "'")
+        dash_id = get_dash_id_from_name(pool, op.db, dash_name)
+        ddl = re.sub(full_quoted_dash, str(dash_id), ddl)
+
+    _print(f'    [{op.db}] {_short_ddl(ddl, verbose)}', label)
+
+    if re.match(RE_IS_DASH_MGMT_DDL, ddl):
+        exec_dash_ddl(pool, op.db, ddl)
+    else:
+        pool.get(op.db).execute(ddl)
+
+
+def _short_ddl(ddl: str, verbose: bool) -> str:
+    pr_ddl = obfuscate_secrets(ddl)
+    if not verbose and len(pr_ddl) > VERBOSE_WIDTH:
+        return f'{pr_ddl[:VERBOSE_WIDTH]} ...'
+
+    return pr_ddl
+
+
+def _import_table(op: Operation) -> str:
+    m = re.match(RE_IMPORT_TABLE_AND_SOURCE, op.ddl)
+    return m.group(1) if m else op.ddl
+
+
+def _format_size(size: int) -> str:
+    if size is None:
+        return '? bytes'
+
+    for unit in ('bytes', 'KB', 'MB', 'GB'):
+        if size < 1024:
+            return f'{size:.0f} {unit}' if unit == 'bytes' else f'{size:.1f} {unit}'
+        size /= 1024
+
+    return f'{size:.1f} TB'
+
+
+def _format_time(secs: float) -> str:
+    return str(timedelta(seconds=int(secs)))
+
+
+def _format_rate(size: int, secs: float) -> str:
+    if size is None or secs <= 0:
+        return '? bytes/s'
+
+    return f'{_format_size(size / secs)}/s'
@@ -0,0 +1,174 @@
+import hashlib
+import json
+
+from concurrent.futures import Executor
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from heavyai import Connection
+
+from .constants import *
+from .profile import span
+from .util import SessionPool
+
+
+class CatalogSnapshot:
+    """
+    A point-in-time view of the server catalog, built once at the start of
+    planning and shared by every planner.
+
+    Everything that can be fetched with a single query is fetched in bulk from
+    the "information_schema" database. The per-database lookups (servers,
+    column details, policies and dashboard update times) are only made for the
+    databases, tables, users/roles and dashboards referenced in the artifacts
+    file. Given an executor, those
+    databases are loaded concurrently, each on its own session.
+
+    All lookups are indexed by database name (and then by object name) so the
+    planners never have to scan a result set.
+    """
+
+    def __init__(self, pool: SessionPool, server_conf: dict, executor: Executor = None):
+        self.databases: set[str] = set()
+        self.tables: dict[str, set[str]] = {}          # db -> table names
+        self.dashboards: dict[str, dict[str, int]] = {} # db -> dashboard name -> id
+        self.roles: set[str] = set()
+        self.users: set[str] = set()
+        self.servers: dict[str, dict[str, dict]] = {}  # db -> server name -> SHOW SERVERS row
+        self.columns: dict[str, dict[str, list]] = {}  # db -> table name -> column details
+        self.policies: dict[str, dict[str, set[str]]] = {} # db -> user/role -> 'TAB.COL' (upper case)
+        self.dashboard_times: dict[str, dict[str, str]] = {} # db -> dashboard name -> last update time
+
+        self._load_global(pool.get('information_schema'))
+        self._load_per_database(pool, server_conf, executor)
+
+    def _load_global(self, con: 'Connection') -> None:
+        self.databases = { d.db_name for d in con._client.get_databases(con._session) }
+
+        for db, tab in _query(con, "SELECT database_name, table_name FROM tables"):
+            self.tables.setdefault(db, set()).add(tab)
+
+        for db, dash, dash_id in _query(con, "SELECT database_name, dashboard_name, dashboard_id FROM dashboards"):
+            self.dashboards.setdefault(db, {})[dash] = dash_id
+
+        self.roles = { r for r, in _query(con, "SELECT role_name FROM roles") }
+        self.users = { u for u, in _query(con, "SELECT user_name FROM users") }
+
+    def _load_per_database(self, pool: SessionPool, server_conf: dict, executor: Executor = None) -> None:
+        server_dbs = set(server_conf.get('foreign_servers', {})) | set(server_conf.get('foreign_tables', {}))
+        policy_dbs = set(server_conf.get('policies', {}))
+        dash_dbs = set(server_conf.get('dashboards', {}))
+        dbs = sorted((server_dbs | policy_dbs | dash_dbs) & self.databases)
+
+        def load(db: str) -> None:
+            con = pool.get(db)
+
+            if db in server_dbs:
+                self.servers[db] = { row['server_name']: row for row in _query_records(con, "SHOW SERVERS") }
+
+            if db in policy_dbs:
+                self._load_policy_facts(con, db, server_conf['policies'][db])
+
+            if db in dash_dbs:
+                self._load_dashboard_times(pool, db, server_conf['dashboards'][db])
+
+        # each database only writes its own keys, so the loads can overlap.
+        #
+        if executor is None:
+            for db in dbs:
+                load(db)
+        else:
+            list(executor.map(load, dbs))
+
+    def _load_policy_facts(self, con: 'Connection', db: str, db_policies: dict) -> None:
+        self.columns[db] = {}
+        self.policies[db] = {}
+
+        for tab in db_policies:
+            if tab in self.tables.get(db, ()):
+                self.columns[db][tab] = con.get_column_details(tab)
+
+            for col in db_policies[tab]:
+                for ur in db_policies[tab][col]:
+                    if ur in self.policies[db] or (ur not in self.users and ur not in self.roles):
+                        continue
+
+                    rows = _query_records(con, f'SHOW POLICIES {ur}', 'SHOW POLICIES')
+                    self.policies[db][ur] = { str(row['COLUMN']).upper() for row in rows }
+
+    def _load_dashboard_times(self, pool: SessionPool, db: str, db_dashboards: dict) -> None:
+        self.dashboard_times[db] = {}
+
+        for dash in db_dashboards:
+            dash_id = self.get_dashboard_id(db, dash)
+            if dash_id != -1:
+                self.dashboard_times[db][dash] = pool.dashboards.get_update_time(db, dash_id)
+
+    def fingerprint(self) -> str:
+        """
+        Returns a hash of everything in the snapshot: the server-wide facts
+        (databases, tables, dashboards, roles and users) and the per-database
+        ones (servers, columns, policies and dashboard update times), to tell
+        cheaply whether any of them changed since.
+        """
+
+        facts = {
+            'databases': sorted(self.databases),
+            'tables': { db: sorted(tabs) for db, tabs in self.tables.items() },
+            'dashboards': { db: { d: int(i) for d, i in dashes.items() } for db, dashes in self.dashboards.items() },
+            'roles': sorted(self.roles),
+            'users': sorted(self.users),
+            'servers': self.servers,
+            'columns': self.columns,
+            'policies': { db: { ur: sorted(cols) for ur, cols in urs.items() } for db, urs in self.policies.items() },
+            'dashboard_times': self.dashboard_times
+        }
+
+        return hashlib.md5(json.dumps(facts, sort_keys=True, default=str).encode()).hexdigest()
+
+    def has_database(self, db: str) -> bool:
+        return db in self.databases
+
+    def has_table(self, db: str, tab: str) -> bool:
+        return tab in self.tables.get(db, ())
+
+    def has_server(self, db: str, fs: str) -> bool:
+        return fs in self.servers.get(db, {})
+
+    def get_dashboard_id(self, db: str, dash: str) -> int:
+        return self.dashboards.get(db, {}).get(dash, -1)
+
+    def has_artifact(self, artifact: tuple) -> bool:
+        """Returns whether an artifact (e.g. ('static_tables', db, name)) exists on the server."""
+
+        match artifact[0]:
+            case 'databases':
+                return self.has_database(artifact[1])
+            case 'static_tables' | 'foreign_tables':
+                return self.has_table(artifact[1], artifact[2])
+            case 'foreign_servers':
+                return self.has_server(artifact[1], artifact[2])
+            case 'dashboards':
+                return self.get_dashboard_id(artifact[1], artifact[2]) != -1
+            case 'roles':
+                return artifact[1] in self.roles
+            case 'users':
+                return artifact[1] in self.users
+
+        return False
+
+
+def _query(con: 'Connection', query: str, name: str = None) -> list[tuple]:
+    """Runs a catalog query on the connection's cursor, returning the rows as tuples."""
+
+    with span('query', name or query):
+        return [ tuple(row) for row in con.execute(query) ]
+
+
+def _query_records(con: 'Connection', query: str, name: str = None) -> list[dict]:
+    """Runs a catalog query, returning the rows as dicts keyed by column name."""
+
+    with span('query', name or query):
+        cursor = con.execute(query)
+        columns = [ d[0] for d in cursor.description or () ]
+        return [ dict(zip(columns, row)) for row in cursor ]
@@ -3,6 +3,11 @@ import re
 from enum import Enum
 
 VERBOSE_WIDTH = 80 # width of verbose output
+IMPORT_PROGRESS_INTERVAL = 30 # seconds between progress reports on running imports
+DEFAULT_JOURNAL_FILE = 'heavyai_deploy.journal' # where apply records its progress (JSON lines)
+DEFAULT_STATE_FILE = 'heavyai_deploy.state.json' # what was last applied, to shortcut planning
+DEFAULT_CACHE_DIR = '~/.cache/heavyai_deploy' # downloaded DDL and dashboard files, with their ETags
+DEFAULT_CACHE_SIZE = 1024 * 1024 * 1024 # bytes of downloaded files to keep
 
 class COLORS:
     MAGENTA = '\033[95m'
@@ -26,6 +31,12 @@ class RESOURCE_STATES(Enum):
     NEEDS_DELETION = 4
     SKIP = 5
 
+class OPERATION_STATES(Enum):
+    PENDING = 0
+    DONE = 1
+    FAILED = 2
+    SKIPPED = 3
+
 class ARG_PARSE_STATES(Enum):
     SPACE = 0
     WORD = 1
@@ -134,13 +145,14 @@ RE_PRIVS_DASHBOARD = re.compile('(?i)^(' + '|'.join(PRIVS_DASHBOARD) + ')$')
 RE_IS_VALID_NAME = re.compile(r'^[a-zA-Z][a-zA-Z0-9\$_]*$')
 RE_IS_VALID_DASHED_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9\$_\-]*$')
 RE_IS_VALID_EMAIL = re.compile(r'^([^\s\"]+|\".+\")@[A-Za-z0-9][A-Za-z0-9\-\.]*\.[A-Za-z]+$')
-RE_IS_DASH_MGMT_DDL = re.compile(r'(?i)^\s*\\(drop|rename|import)_dashboard\s+')
+RE_IS_DASH_MGMT_DDL = re.compile(r'(?i)^\s*\\(drop|rename|duplicate|import|replace)_dashboard\s+')
 RE_IS_GRANT_ON_DASH_ID_TBD_DDL = re.compile(r"(?i)^\s*grant\s+.*?\s+on\s+dashboard\s+('" + DASH_ID_TBD_PREFIX + r"(.+?)') to \w+$")
 RE_IS_CREATE_STATIC_TABLE_DDL = r'(?i)^\s*CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?[a-zA-Z][a-zA-Z0-9\$_]*'
 RE_IS_CREATE_FOREIGN_TABLE_DDL = r'(?i)^\s*CREATE\s+FOREIGN\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?[a-zA-Z][a-zA-Z0-9\$_]*'
 RE_IS_FOREIGN_SERVER_CLAUSE = re.compile(r'(?i)\)\s+SERVER\s+([a-zA-Z][a-zA-Z0-9\$_]*)\s+')
 RE_IS_WITH_CLAUSE = re.compile(r'(?i)\s+(?:WITH\s+\((.+)\)|XXWITH_CLAUSEXX);?$')
 RE_IS_IMPORT_DDL = re.compile(r'(?i)^\s*(?:RESTORE\s+TABLE|COPY)\s+')
+RE_IMPORT_TABLE_AND_SOURCE = re.compile(r"(?i)^\s*(?:RESTORE\s+TABLE|COPY)\s+(\w+)\s+FROM\s+'([^']+)'")
 RE_IS_DROP_TABLE_DDL = re.compile(r'(?i)^\s*DROP\s+(?:FOREIGN\s+)?TABLE\s+')
 RE_IS_TAB_COLUMN = re.compile('(?i)([a-zA-Z][a-zA-Z0-9\$_]*)\s+(' + '|'.join(COLUMN_DATATYPES.__members__.keys()) + ')')
 
@@ -171,9 +183,10 @@ DEFAULT_FOREIGN_TABLE_IF_EXISTS = RESOURCE_IF_EXISTS_ACTIONS.SKIP
 #
 DEFAULT_SERVER_IF_EXISTS = RESOURCE_IF_EXISTS_ACTIONS.SKIP
 
-# dashboard definition defaults
+# dashboard definition defaults. a changed dashboard is replaced in place,
+# keeping its id and grants. "rename" keeps a copy of the old version too.
 #
-DEFAULT_DASHBOARD_IF_EXISTS = RESOURCE_IF_EXISTS_ACTIONS.RENAME
+DEFAULT_DASHBOARD_IF_EXISTS = RESOURCE_IF_EXISTS_ACTIONS.REPLACE
 
 # user definition defaults
 #
@@ -0,0 +1,339 @@
+import hashlib
+import json
+import mmap
+import re
+
+from functools import cached_property
+
+# orjson decodes JSON several times faster than the json module, straight from
+# bytes, but it's optional.
+#
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class DashboardExport:
+    """
+    A dashboard export file: the dashboard name, its metadata and its view
+    state, one per line.
+
+    The export wraps the bytes of the file (or a memory map of a local file)
+    and only indexes where the lines start and end, so a multi-megabyte view
+    state isn't copied until it's decoded, and can be hashed or uploaded
+    straight from the buffer.
+
+    close() (or using the export as a context manager) releases the buffer,
+    unmapping a memory-mapped file right away rather than whenever the export
+    is garbage collected.
+    """
+
+    def __init__(self, buffer: bytes, uri: str = None):
+        self.uri = uri
+        self._buffer = buffer
+        self._view = memoryview(buffer)
+
+        nl1 = buffer.find(b'\n')
+        nl2 = buffer.find(b'\n', nl1 + 1) if nl1 != -1 else -1
+
+        if nl2 == -1:
+            raise RuntimeError(f'{uri or "The file"} is not a dashboard export (name, metadata and view state lines.)')
+
+        end = buffer.find(b'\n', nl2 + 1)
+        self._lines = (_line(buffer, 0, nl1), _line(buffer, nl1 + 1, nl2), _line(buffer, nl2 + 1, len(buffer) if end == -1 else end))
+
+    @classmethod
+    def from_file(cls, path: str) -> 'DashboardExport':
+        """Memory-maps a local export file."""
+
+        with open(path, 'rb') as f:
+            try:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # an empty file can't be mapped.
+                #
+                buffer = b''
+
+        return cls(buffer, path)
+
+    def close(self) -> None:
+        self._view.release()
+
+        # views of the state still held elsewhere keep the map open until
+        # they're gone.
+        #
+        if isinstance(self._buffer, mmap.mmap):
+            try:
+                self._buffer.close()
+            except BufferError:
+                pass
+
+    def __enter__(self) -> 'DashboardExport':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _slice(self, i: int) -> memoryview:
+        start, end = self._lines[i]
+        return self._view[start:end]
+
+    @cached_property
+    def name(self) -> str:
+        return str(self._slice(0), 'utf-8')
+
+    @cached_property
+    def metadata(self) -> str:
+        return str(self._slice(1), 'utf-8')
+
+    @property
+    def state_bytes(self) -> memoryview:
+        """The view state, undecoded (e.g. to base64-encode it for the server.)"""
+
+        return self._slice(2)
+
+    @property
+    def state(self) -> str:
+        return str(self._slice(2), 'utf-8')
+
+    def parse_state(self) -> dict:
+        return loads(self.state_bytes)
+
+    def parse_dependencies(self) -> dict:
+        """The parts of the view state its table dependencies come from (see parse_state_dependencies.)"""
+
+        return parse_state_dependencies(self.state_bytes)
+
+    def state_hash(self) -> str:
+        """The MD5 hash of the view state (see hash_state), hashed from the buffer."""
+
+        return hash_state(self.state_bytes)
+
+    def state_fingerprint(self) -> str:
+        """The canonical fingerprint of the view state (see fingerprint_state.)"""
+
+        return fingerprint_state(self.state_bytes)
+
+
+def loads(data: bytes):
+    """Decodes JSON from bytes (or a view of them), with orjson if it's installed."""
+
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # json is more lenient (e.g. NaN and big integers), so let it
+            # decide.
+            #
+            pass
+
+    return json.loads(bytes(data) if isinstance(data, memoryview) else data)
+
+
+def hash_state(state: bytes) -> str:
+    """The MD5 hash of a view state, less trailing whitespace, without copying it."""
+
+    end = len(state)
+    while end > 0 and state[end - 1] in b' \t\r\n\x0b\x0c':
+        end -= 1
+
+    return hashlib.md5(memoryview(state)[:end]).hexdigest()
+
+
+# the parts of each tab's dashboard that Immerse sets as it loads, saves or
+# exports a dashboard (the server-side id, the Immerse version, the owner and
+# the UI state), rather than the user as they edit it.
+#
+_VOLATILE_DASHBOARD_KEYS = ('id', 'version', 'owner', 'privileges', 'loadState', 'saveState', 'copyState', 'initialization', 'selectedTabId')
+_VOLATILE_STREAMING_KEYS = ('last_request',)
+
+def fingerprint_state(state: bytes) -> str:
+    """
+    The MD5 hash of a view state in canonical form: the JSON re-encoded with
+    sorted keys and no whitespace, less the fields that differ between copies
+    of the same dashboard (ids, versions and timestamps.) Two copies of a
+    dashboard have the same fingerprint however Immerse or the server wrote
+    them out.
+    """
+
+    dash = loads(state)
+
+    if isinstance(dash, dict) and isinstance(dash.get('tabs'), dict):
+        for tab in dash['tabs'].values():
+            d = tab.get('dashboard') if isinstance(tab, dict) else None
+            if not isinstance(d, dict):
+                continue
+
+            for k in _VOLATILE_DASHBOARD_KEYS:
+                d.pop(k, None)
+
+            if isinstance(d.get('streaming'), dict):
+                for k in _VOLATILE_STREAMING_KEYS:
+                    d['streaming'].pop(k, None)
+
+    # always json, so the fingerprints are the same with or without orjson.
+    #
+    canonical = json.dumps(dash, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+
+    return hashlib.md5(canonical.encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+def parse_state_dependencies(state: bytes) -> dict:
+    """
+    Extracts the parts of a dashboard view state that get_dash_table_deps()
+    uses (the data sources of each tab and the parameter definitions) into a
+    dict shaped like the whole view state, without decoding the rest of it.
+
+    The JSON is scanned in place, skipping over the charts, filters and other
+    configuration, so the time and memory it takes grows with the number of
+    data sources and parameters rather than with the size of the dashboard.
+    """
+
+    scanner = _JSONScanner(state)
+    dash = {}
+
+    for key in scanner.keys():
+        if key == 'tabs':
+            dash['tabs'] = {}
+
+            for tab in scanner.keys():
+                dash['tabs'][tab] = {}
+
+                for tab_key in scanner.keys():
+                    if tab_key != 'dashboard':
+                        scanner.skip()
+                        continue
+
+                    dash['tabs'][tab]['dashboard'] = {}
+                    for dash_key in scanner.keys():
+                        if dash_key != 'dataSources':
+                            scanner.skip()
+                            continue
+
+                        sources = dash['tabs'][tab]['dashboard']['dataSources'] = {}
+                        for source in scanner.keys():
+                            sources[source] = None
+                            scanner.skip()
+
+        elif key == 'parameters':
+            dash['parameters'] = {}
+
+            for param_key in scanner.keys():
+                if param_key != 'definitions':
+                    scanner.skip()
+                    continue
+
+                definitions = dash['parameters']['definitions'] = {}
+                for p in scanner.keys():
+                    definitions[p] = scanner.value()
+
+        else:
+            scanner.skip()
+
+    return dash
+
+
+# JSON text up to the next bracket, stepping over whole strings (so over any
+# brackets in them.)
+#
+_RE_JSON_STRING = re.compile(rb'"[^"\\]*+(?:\\.[^"\\]*+)*+"', re.DOTALL)
+_RE_JSON_TO_BRACKET = re.compile(rb'[^\[\]{}"]*+(?:"[^"\\]*+(?:\\.[^"\\]*+)*+"[^\[\]{}"]*+)*+', re.DOTALL)
+_RE_JSON_SCALAR = re.compile(rb'[^,:\[\]{}"\s]++')
+_RE_JSON_SPACE = re.compile(rb'[ \t\r\n]*+')
+
+class _JSONScanner:
+    """
+    A pull parser over a JSON buffer: walks the keys of objects, and skips or
+    decodes the values, one at a time.
+    """
+
+    def __init__(self, buffer: bytes):
+        self._buffer = buffer
+        self._pos = 0
+
+    def _peek(self) -> int:
+        self._pos = _RE_JSON_SPACE.match(self._buffer, self._pos).end()
+        if self._pos >= len(self._buffer):
+            raise ValueError('Unexpected end of JSON')
+
+        return self._buffer[self._pos]
+
+    def _expect(self, c: str) -> None:
+        if self._peek() != ord(c):
+            raise ValueError(f"Expecting '{c}' at position {self._pos}")
+
+        self._pos += 1
+
+    def keys(self):
+        """
+        Yields the keys of the object at the current position. The value of
+        each key must be consumed (skip, value or keys) before the next one.
+        """
+
+        self._expect('{')
+        if self._peek() == ord('}'):
+            self._pos += 1
+            return
+
+        while True:
+            m = _RE_JSON_STRING.match(self._buffer, self._pos) if self._peek() == ord('"') else None
+            if m is None:
+                raise ValueError(f'Expecting a property name at position {self._pos}')
+
+            self._pos = m.end()
+            self._expect(':')
+
+            yield loads(m.group())
+
+            if self._peek() == ord('}'):
+                self._pos += 1
+                return
+
+            self._expect(',')
+
+    def skip(self) -> None:
+        """Steps over the value at the current position without decoding it."""
+
+        c = self._peek()
+
+        if c == ord('{') or c == ord('['):
+            buffer, pos, end, to_bracket = self._buffer, self._pos, len(self._buffer), _RE_JSON_TO_BRACKET.match
+            depth = 0
+
+            while True:
+                pos = to_bracket(buffer, pos).end()
+                if pos >= end:
+                    raise ValueError('Unexpected end of JSON')
+
+                c = buffer[pos]
+                depth += 1 if c == 123 or c == 91 else -1 # '{' or '['
+                pos += 1
+
+                if depth == 0:
+                    self._pos = pos
+                    return
+
+        m = (_RE_JSON_STRING if c == ord('"') else _RE_JSON_SCALAR).match(self._buffer, self._pos)
+        if m is None:
+            raise ValueError(f'Expecting a value at position {self._pos}')
+
+        self._pos = m.end()
+
+    def value(self):
+        """Decodes the value at the current position."""
+
+        self._peek()
+        start = self._pos
+        self.skip()
+
+        return loads(self._buffer[start:self._pos])
+
+
+def _line(buffer: bytes, start: int, end: int) -> tuple[int, int]:
+    # the line without its carriage return, if the file has Windows line endings.
+    #
+    if end > start and buffer[end - 1] == ord('\r'):
+        end -= 1
+
+    return start, end
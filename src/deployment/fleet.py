@@ -0,0 +1,176 @@
+import copy
+import os
+import time
+
+from concurrent.futures import Executor, ThreadPoolExecutor
+
+from .apply import apply_ddl
+from .constants import *
+from .graph import OperationGraph
+from .journal import Journal
+from .plan import generate_ddl, generate_plan
+from .state import State
+from .util import SessionPool, get_file_content, replace_env_vars
+
+
+def read_connection_urls(uri: str) -> list[str]:
+    """Reads a list of connection URLs, one per line. Blank lines and lines starting with "#" are ignored."""
+
+    urls = []
+    for line in replace_env_vars(get_file_content(uri)).split('\n'):
+        line = line.strip()
+        if len(line) != 0 and not line.startswith('#'):
+            urls.append(line)
+
+    if len(urls) == 0:
+        raise RuntimeError(f'{COLORS.FAIL}No connection URLs found in "{uri}".{COLORS.END}')
+
+    return urls
+
+
+def get_instance_path(path: str, server: str) -> str:
+    """Returns a per-instance version of a journal or state file path, e.g. "deploy.host_6274.journal"."""
+
+    root, ext = os.path.splitext(path)
+    return f'{root}.{server.replace(":", "_")}{ext}'
+
+
+class Instance:
+    """
+    One of the HeavyDB instances an artifacts file is deployed to, with its
+    plan, the outcome of each step and how long it took.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.pool = SessionPool(url)
+        self.server = self.pool.server
+
+        self.state: State = None
+        self.plan: dict = None
+        self.graph: OperationGraph = None
+        self.journal: Journal = None
+
+        self.status = 'pending'
+        self.error: Exception = None
+        self.plan_time: float = None
+        self.apply_time: float = None
+
+    def count(self, state: OPERATION_STATES) -> int:
+        return 0 if self.graph is None else len([ op for op in self.graph.ops if not op.is_note and op.state == state ])
+
+
+def plan_instances(instances: list[Instance], conf: dict, workers: int, plan_workers: int = 1,
+                   state_path: str = DEFAULT_STATE_FILE, journal_path: str = DEFAULT_JOURNAL_FILE,
+                   incremental: bool = False, targets: list[tuple] = None, resume: bool = False,
+                   for_apply: bool = False, process_executor: Executor = None) -> None:
+    """
+    Plans the deployment to each instance, up to "workers" instances at a time.
+    Each instance has its own state and journal files (see get_instance_path.)
+    A failure only fails its own instance. The instances share the dashboard
+    process pool, if there is one.
+    """
+
+    def plan_instance(inst: Instance) -> None:
+        start = time.monotonic()
+
+        try:
+            inst.pool.get()
+            instance_journal = get_instance_path(journal_path, inst.server)
+
+            if resume:
+                if not Journal.unfinished(instance_journal):
+                    inst.status = 'nothing to resume'
+                    return
+
+                inst.journal, inst.graph = Journal.resume(instance_journal)
+
+            else:
+                if for_apply and Journal.unfinished(instance_journal):
+                    raise RuntimeError(f'An unfinished apply was journaled in "{instance_journal}".')
+
+                # the planners add to the configuration they're given, so
+                # every instance needs its own copy.
+                #
+                inst.state = State.load(get_instance_path(state_path, inst.server), inst.server)
+                inst.plan = generate_plan(copy.deepcopy(conf), inst.pool, plan_workers, inst.state, incremental, targets, process_executor)
+                inst.graph = generate_ddl(inst.plan)
+
+            inst.status = 'planned'
+
+        except Exception as e:
+            inst.status = 'plan failed'
+            inst.error = e
+
+        finally:
+            inst.plan_time = time.monotonic() - start
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix='instance') as executor:
+        list(executor.map(plan_instance, instances))
+
+
+def apply_instances(instances: list[Instance], workers: int, env_vars: list[str],
+                    parallelism: int = 1, import_concurrency: int = None,
+                    state_path: str = DEFAULT_STATE_FILE, journal_path: str = DEFAULT_JOURNAL_FILE) -> None:
+    """Applies the planned instances, up to "workers" instances at a time."""
+
+    def apply_instance(inst: Instance) -> None:
+        if inst.status != 'planned':
+            return
+
+        start = time.monotonic()
+
+        try:
+            if inst.journal is None:
+                inst.journal = Journal.create(get_instance_path(journal_path, inst.server), inst.graph, env_vars)
+
+            # apply_ddl raises unless only imports failed, which are counted
+            # in the summary but don't fail the apply.
+            #
+            apply_ddl(inst.pool, inst.graph, False, parallelism, import_concurrency, inst.journal, inst.server)
+            inst.status = 'applied'
+
+        except Exception as e:
+            inst.status = 'apply failed'
+            inst.error = e
+
+        finally:
+            if inst.journal is not None:
+                inst.journal.close()
+
+            if inst.state is not None:
+                try:
+                    inst.state.update(inst.plan, inst.graph, inst.pool)
+                    inst.state.save(get_instance_path(state_path, inst.server))
+                except Exception as e:
+                    inst.error = inst.error or e
+
+            inst.apply_time = time.monotonic() - start
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix='instance') as executor:
+        list(executor.map(apply_instance, instances))
+
+
+def summarize(instances: list[Instance]) -> list[str]:
+    """Returns a line per instance with the outcome and timings of its deployment."""
+
+    width = max(len(i.server) for i in instances)
+
+    lines = []
+    for inst in instances:
+        color = COLORS.FAIL if inst.status.endswith('failed') else COLORS.GREEN
+        line = f'{inst.server:<{width}}  {color}{inst.status:<17}{COLORS.END}'
+
+        if inst.plan_time is not None:
+            line += f'  plan {inst.plan_time:7.1f}s'
+
+        if inst.apply_time is not None:
+            line += f'  apply {inst.apply_time:7.1f}s  ' + \
+                    f'{inst.count(OPERATION_STATES.DONE)} done, {inst.count(OPERATION_STATES.FAILED)} failed, ' + \
+                    f'{inst.count(OPERATION_STATES.SKIPPED)} skipped'
+        elif inst.graph is not None:
+            line += f'  {inst.count(OPERATION_STATES.PENDING)} statements to apply'
+
+        lines.append(line)
+
+    return lines
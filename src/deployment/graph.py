@@ -0,0 +1,214 @@
+from .constants import *
+
+
+# the order the sections are listed in when the graph is printed.
+#
+SECTIONS = ('configs', 'databases', 'static_tables', 'foreign_servers', 'foreign_tables', 'dashboards', 'roles', 'policies', 'users')
+
+
+class Operation:
+    """
+    A single DDL statement (or a note to print) and the operations that have to
+    finish before it can run.
+
+    Dependencies are given either directly, as operations in the same chain
+    (e.g. rename the old table, then create the new one), or as resource keys
+    such as ('table', db, name). A key resolves to the operation that provides
+    the resource, if the plan creates it at all; otherwise the resource already
+    exists and there is nothing to wait for.
+    """
+
+    def __init__(self, op_id: int, section: str, db: str, ddl: str,
+                 after: tuple = (), needs: tuple = (), is_note: bool = False, artifact: tuple = None):
+        self.op_id = op_id
+        self.section = section
+        self.db = db
+        self.ddl = ddl
+        self.after: set[int] = { op.op_id for op in after if op is not None }
+        self.needs: set[tuple] = set(needs)
+        self.is_note = is_note
+        self.artifact = artifact # e.g. ('static_tables', db, name)
+        self.deps: set[int] = set()
+        self.state = OPERATION_STATES.PENDING
+
+    def __repr__(self) -> str:
+        return f'Operation({self.op_id}, {self.section!r}, {self.db!r}, {self.ddl!r})'
+
+
+class OperationGraph:
+    """
+    The DDL generated for a plan, as a dependency graph of operations.
+
+    Every operation implicitly needs the database it runs in, so nothing runs in
+    a database before its CREATE DATABASE. Independent branches (e.g. the
+    imports of unrelated tables) can then be applied concurrently, and a failure
+    only has to stop the operations downstream of it.
+    """
+
+    def __init__(self, default_database: str):
+        self.default_database = default_database
+        self.ops: list[Operation] = []
+        self._providers: dict[tuple, Operation] = {}
+        self._listing: dict[str, dict[str, list[Operation]]] = {}
+        self.resolved = False
+        self.secrets: dict[str, str] = {} # generated secret -> placeholder to write in its place
+
+    def open(self, section: str, db: str) -> None:
+        """Makes sure the section lists the database, even if nothing is added to it."""
+
+        self._listing.setdefault(section, {}).setdefault(db, [])
+
+    def add(self, section: str, db: str, ddl: str, after: tuple = (), needs: tuple = (),
+            provides: tuple = None, artifact: tuple = None) -> Operation:
+
+        op = Operation(len(self.ops), section, db, ddl, after, needs, artifact=artifact)
+        self._append(op)
+
+        if provides is not None:
+            self._providers[provides] = op
+
+        return op
+
+    def note(self, section: str, db: str, text: str, artifact: tuple = None) -> Operation:
+        """Adds a comment, printed in place of (or before) the operations it describes."""
+
+        # notes don't do anything, so they only wait for the entry before
+        # them to keep them next to the statements they are about.
+        #
+        self.open(section, db)
+        prev = self._listing[section][db][-1] if self._listing[section][db] else None
+
+        op = Operation(len(self.ops), section, db, f'-- {text}', (prev,), is_note=True, artifact=artifact)
+        self._append(op)
+
+        return op
+
+    def add_provider(self, key: tuple, op: Operation) -> None:
+        """Marks op as the operation the resource is ready after."""
+
+        self._providers[key] = op
+        self.resolved = False
+
+    def provider(self, key: tuple) -> Operation:
+        return self._providers.get(key)
+
+    def resolve(self) -> None:
+        """Turns the resource keys into dependencies and checks the graph for cycles."""
+
+        for op in self.ops:
+            needs = op.needs | { ('database', op.db) }
+            op.deps = set(op.after)
+
+            for key in needs:
+                p = self._providers.get(key)
+                if p is not None and p.op_id != op.op_id:
+                    op.deps.add(p.op_id)
+
+        # Kahn's algorithm. anything left over is part of a cycle.
+        #
+        remaining = { op.op_id: len(op.deps) for op in self.ops }
+        dependents = self.dependents()
+        ready = [ i for i, n in remaining.items() if n == 0 ]
+        seen = 0
+
+        while ready:
+            i = ready.pop()
+            seen += 1
+
+            for d in dependents[i]:
+                remaining[d] -= 1
+                if remaining[d] == 0:
+                    ready.append(d)
+
+        if seen != len(self.ops):
+            cycle = [ self.ops[i].ddl for i, n in remaining.items() if n > 0 ]
+            raise RuntimeError(f'Dependency cycle between DDL statements: {cycle}')
+
+        self.resolved = True
+
+    def dependents(self) -> dict[int, list[int]]:
+        dependents = { op.op_id: [] for op in self.ops }
+        for op in self.ops:
+            for d in op.deps:
+                dependents[d].append(op.op_id)
+
+        return dependents
+
+    def downstream(self, op: Operation) -> list[Operation]:
+        """Returns every operation that (directly or not) depends on op, in order."""
+
+        dependents = self.dependents()
+        found = set()
+        stack = [op.op_id]
+
+        while stack:
+            for d in dependents[stack.pop()]:
+                if d not in found:
+                    found.add(d)
+                    stack.append(d)
+
+        return [ self.ops[i] for i in sorted(found) ]
+
+    def artifact_ops(self) -> dict[tuple, list[Operation]]:
+        """Returns the operations of each artifact."""
+
+        retval = {}
+        for op in self.ops:
+            if op.artifact is not None:
+                retval.setdefault(op.artifact, []).append(op)
+
+        return retval
+
+    def ddls(self) -> list[str]:
+        """
+        Returns the graph as the flat list of DDL statements, with "\\db"
+        switches and section headers, for printing the plan.
+        """
+
+        retval = []
+        for section in SECTIONS:
+            if section not in self._listing:
+                continue
+
+            retval.append(f'-- ({section}) --')
+
+            # the default database first
+            #
+            dbs = sorted(self._listing[section], key=lambda db: db != self.default_database)
+            for db in dbs:
+                retval.append(f'\\db {db}')
+                retval += [ op.ddl for op in self._listing[section][db] ]
+
+        return retval
+
+    def to_dict(self) -> dict:
+        """Returns the resolved graph as a JSON-serializable dict (see from_dict.)"""
+
+        if not self.resolved:
+            self.resolve()
+
+        return {
+            'default_database': self.default_database,
+            'ops': [ { 'id': op.op_id, 'section': op.section, 'db': op.db, 'ddl': op.ddl,
+                       'deps': sorted(op.deps), 'is_note': op.is_note, 'artifact': op.artifact } for op in self.ops ]
+        }
+
+    @staticmethod
+    def from_dict(d: dict) -> 'OperationGraph':
+        graph = OperationGraph(d['default_database'])
+
+        for o in d['ops']:
+            op = Operation(o['id'], o['section'], o['db'], o['ddl'], is_note=o['is_note'],
+                           artifact=tuple(o['artifact']) if o.get('artifact') else None)
+            op.deps = set(o['deps'])
+            graph._append(op)
+
+        graph.resolved = True
+
+        return graph
+
+    def _append(self, op: Operation) -> None:
+        self.open(op.section, op.db)
+        self._listing[op.section][op.db].append(op)
+        self.ops.append(op)
+        self.resolved = False
@@ -0,0 +1,205 @@
+import json
+import os
+import threading
+import time
+
+from datetime import datetime
+
+from .constants import *
+from .graph import Operation, OperationGraph
+from .util import generate_password
+
+
+# env var values shorter than this aren't templated out of the journal. they
+# aren't likely to be secrets, but are likely to turn up all over the DDL.
+#
+MIN_TEMPLATED_ENV_VAR_LEN = 6
+
+
+def template_graph(graph: OperationGraph, env_vars: list[str]) -> tuple[dict, list[str]]:
+    """
+    Returns the graph as a dict (see OperationGraph.to_dict) with the secrets
+    taken out of the DDL: the values of the env vars are replaced with ${VAR}
+    references, and generated secrets with their placeholders. Also returns
+    the env vars that were templated.
+    """
+
+    env_vars = [ v for v in env_vars if len(os.environ.get(v, '')) >= MIN_TEMPLATED_ENV_VAR_LEN ]
+
+    # longest values first, in case one value contains another
+    #
+    env_vars.sort(key=lambda v: len(os.environ[v]), reverse=True)
+
+    def template(ddl: str) -> str:
+        for secret, placeholder in graph.secrets.items():
+            ddl = ddl.replace(secret, placeholder)
+
+        for v in env_vars:
+            ddl = ddl.replace(os.environ[v], f'${{{v}}}')
+
+        return ddl
+
+    d = graph.to_dict()
+    for o in d['ops']:
+        o['ddl'] = template(o['ddl'])
+
+    return d, env_vars
+
+
+def untemplate_graph(d: dict, env_vars: list[str]) -> OperationGraph:
+    """
+    Rebuilds a graph templated by template_graph(), with the env vars filled in
+    from the environment and new generated passwords.
+    """
+
+    def untemplate(ddl: str) -> str:
+        for v in env_vars:
+            if f'${{{v}}}' in ddl:
+                if v not in os.environ:
+                    raise RuntimeError(f'Env variable ${{{v}}} not found.')
+
+                ddl = ddl.replace(f'${{{v}}}', os.environ[v])
+
+        if f"password='{DEFAULT_USER_INIT_PASSWORD}'" in ddl:
+            password = generate_password()
+            secrets[password] = DEFAULT_USER_INIT_PASSWORD
+            ddl = ddl.replace(f"password='{DEFAULT_USER_INIT_PASSWORD}'", f"password='{password}'")
+
+        return ddl
+
+    secrets = {}
+    graph = OperationGraph.from_dict(dict(d, ops=[ dict(o, ddl=untemplate(o['ddl'])) for o in d['ops'] ]))
+    graph.secrets = secrets
+
+    return graph
+
+
+class Journal:
+    """
+    An append-only record of an apply, one JSON object per line, so that a
+    failed or interrupted apply can be resumed without redoing the operations
+    that already completed.
+
+    The first line holds the operation graph being applied. Because replanning
+    after a partial apply would produce a different plan (e.g. the backup table
+    names are timestamped), a resumed apply runs the journaled graph, not a new
+    one. Secrets are kept out of the file: the values of the env vars used in
+    the artifacts file are written as ${VAR} references, and generated user
+    passwords as a placeholder (a resumed run generates new ones.)
+
+    Every line after that is an event for a single operation ("started", "done",
+    "failed" or "skipped"), and the last is the end of the run. Every line is
+    flushed and fsync'd before the operation goes ahead, so the journal is
+    accurate up to the moment the process died.
+    """
+
+    def __init__(self, path: str, f):
+        self.path = path
+        self._f = f
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def create(path: str, graph: OperationGraph, env_vars: list[str]) -> 'Journal':
+        """Starts a new journal for the graph, refusing to replace one for an unfinished apply."""
+
+        if Journal.unfinished(path):
+            raise RuntimeError(f'{COLORS.FAIL}An unfinished apply was journaled in "{path}". '
+                               f'Run "apply --resume" to finish it, or remove the file to start over.{COLORS.END}')
+
+        header, env_vars = template_graph(graph, env_vars)
+
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        journal = Journal(path, os.fdopen(fd, 'w'))
+        journal._write({ 'type': 'header', 'started': datetime.now().isoformat(), 'env_vars': env_vars, 'graph': header })
+
+        return journal
+
+    @staticmethod
+    def resume(path: str) -> tuple['Journal', OperationGraph]:
+        """
+        Reopens the journal of an unfinished apply, returning it along with the
+        journaled graph. Operations that completed are marked done.
+        """
+
+        if not os.path.isfile(path):
+            raise RuntimeError(f'{COLORS.FAIL}No apply journal found at "{path}".{COLORS.END}')
+
+        header, events = Journal._read(path)
+
+        if not Journal.unfinished(path):
+            raise RuntimeError(f'{COLORS.FAIL}The apply journaled in "{path}" already completed. Nothing to resume.{COLORS.END}')
+
+        graph = untemplate_graph(header['graph'], header['env_vars'])
+
+        # only the last event counts. an operation that had started but didn't
+        # finish is run again.
+        #
+        for e in events:
+            if e['type'] == 'op':
+                graph.ops[e['id']].state = OPERATION_STATES.DONE if e['status'] == 'done' else \
+                                           OPERATION_STATES.PENDING
+
+        journal = Journal(path, open(path, 'a'))
+        journal._write({ 'type': 'resume', 'time': datetime.now().isoformat() })
+
+        return journal, graph
+
+    def started(self, op: Operation) -> None:
+        self._write({ 'type': 'op', 'id': op.op_id, 'status': 'started', 'time': time.time() })
+
+    def finished(self, op: Operation, duration: float, error: Exception = None) -> None:
+        event = { 'type': 'op', 'id': op.op_id, 'status': 'done' if error is None else 'failed',
+                  'time': time.time(), 'duration': round(duration, 3) }
+        if error is not None:
+            event['error'] = str(error)
+
+        self._write(event)
+
+    def skipped(self, op: Operation) -> None:
+        self._write({ 'type': 'op', 'id': op.op_id, 'status': 'skipped', 'time': time.time() })
+
+    def end(self, complete: bool) -> None:
+        self._write({ 'type': 'end', 'complete': complete, 'time': time.time() })
+
+    def close(self) -> None:
+        self._f.close()
+
+    def _write(self, event: dict) -> None:
+        with self._lock:
+            self._f.write(json.dumps(event) + '\n')
+            self._f.flush()
+            os.fsync(self._f.fileno())
+
+    @staticmethod
+    def _read(path: str) -> tuple[dict, list[dict]]:
+        with open(path, 'r') as f:
+            lines = f.read().split('\n')
+
+        # the last line may have been cut short if the process died while
+        # writing it.
+        #
+        events = []
+        for line in lines:
+            try:
+                events.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+
+        if len(events) == 0 or events[0]['type'] != 'header':
+            raise RuntimeError(f'{COLORS.FAIL}"{path}" is not an apply journal.{COLORS.END}')
+
+        return events[0], events[1:]
+
+    @staticmethod
+    def unfinished(path: str) -> bool:
+        """Indicates whether there's a journal of an unfinished apply at path."""
+
+        if not os.path.isfile(path):
+            return False
+
+        try:
+            _, events = Journal._read(path)
+        except RuntimeError:
+            return False
+
+        return len(events) == 0 or events[-1]['type'] != 'end' or not events[-1]['complete']
@@ -1,101 +1,215 @@
 import csv
 import json
-import pandas as pd
-import random
-import string
-import warnings
+import multiprocessing
 
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
-from heavyai import Connection
-from icecream import ic
+from functools import partial
 
+from .catalog import CatalogSnapshot
 from .constants import *
-from .util import file_exists, is_dash_code_same, get_dash_id_from_name, get_file_content, get_dash_table_deps
-
-
-def generate_plan(conf: dict, con: Connection) -> dict:
+from .graph import OperationGraph
+from .profile import span
+from .state import State, filter_config, get_changed_artifacts, hash_config
+from .target import select_targets
+from .util import SessionPool, analyze_dashboard, file_exists, generate_password, get_dash_id_from_name, get_dashboard_export, get_file_content, get_file_fingerprint
+
+
+# the planners, grouped into waves. a planner only reads the plans of sections
+# in earlier waves, so the planners in a wave can run concurrently and still
+# produce the same plan as running them one after the other. (the policies
+# planner looks for users in the plan, but the users are planned after the
+# policies, so it never sees them either way.)
+#
+PLAN_WAVES = (
+    ('configs', 'databases'),
+    ('static_tables', 'foreign_servers'),
+    ('foreign_tables',),
+    ('dashboards',),
+    ('roles',),
+    ('policies', 'users'),
+)
+
+
+def generate_plan(conf: dict, pool: SessionPool, workers: int = 1, state: State = None, incremental: bool = False,
+                  targets: list[tuple] = None, process_executor: Executor = None) -> dict:
     plan: dict = {}
 
     err_msg = ''
 
-    con._client.switch_database(con._session, 'information_schema')
-    dbs = [ d.db_name for d in con._client.get_databases(con._session) ]
-    if 'heavyai' not in dbs and 'omnisci' not in dbs and 'mapd' not in dbs:
-        raise RuntimeError(f'{COLORS.FAIL}Planning failed:\nUnable to identify default database (one of "heavyai", "omnisci", or "mapd"){COLORS.END}')
+    # hash the artifacts' configurations before the planners add to them.
+    #
+    plan['config_hashes'] = hash_config(conf)
+
+    planners = {
+        'configs': plan_configs,
+        'databases': plan_databases,
+        'static_tables': plan_static_tables,
+        'foreign_servers': plan_foreign_servers,
+        'foreign_tables': plan_foreign_tables,
+        'dashboards': partial(plan_dashboards, state=state, process_executor=process_executor),
+        'roles': plan_roles,
+        'policies': plan_policies,
+        'users': plan_users
+    }
+
+    # with more than one worker, the sections in a wave are planned
+    # concurrently, as are the per-database and per-artifact checks within
+    # them (catalog queries, file probes, dashboard downloads.) every worker
+    # thread gets its own sessions from the session pool.
+    #
+    executor = None
+    section_executor = None
+    if workers > 1:
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='plan')
+        section_executor = ThreadPoolExecutor(max_workers=max(len(w) for w in PLAN_WAVES), thread_name_prefix='plan_section')
+
+    try:
+        # a targeted plan only plans the targets and what they depend on. the
+        # other artifacts aren't in the plan at all, so their state is kept.
+        #
+        artifacts = list(plan['config_hashes'])
+        required = set()
 
-    plan['default_database'] = 'heavyai' if 'heavyai' in dbs else \
-                               'omnisci' if 'omnisci' in dbs else \
-                               'mapd'
+        if targets:
+            selected, required = select_targets(conf, artifacts, targets)
+            artifacts = [ a for a in artifacts if a in selected or a in required ]
+            plan['config_hashes'] = { a: plan['config_hashes'][a] for a in artifacts }
 
+        # an incremental plan only plans the artifacts that changed since the
+        # last apply (and what depends on them.) the rest are taken to be up
+        # to date, without looking at the server.
+        #
+        if incremental and state is not None:
+            changed = get_changed_artifacts(conf, plan['config_hashes'], state, executor)
+            plan['unchanged'] = [ a for a in artifacts if a not in changed ]
+            artifacts = [ a for a in artifacts if a in changed ]
+
+        if targets or incremental and state is not None:
+            conf = filter_config(conf, artifacts)
+
+        # fetch everything the planners need to know about the server in one
+        # pass, rather than having each planner query it again.
+        #
+        with span('section', 'catalog'):
+            catalog = CatalogSnapshot(pool, conf, executor)
+        plan['catalog_fingerprint'] = catalog.fingerprint()
+
+        # what the targets depend on only has to exist. what's on the server
+        # already is left out of the plan (and out of the state), so it's
+        # left as it is. databases are only ever created, and the planners
+        # look for them in the plan, so they stay.
+        #
+        if len(required) != 0:
+            plan['required'] = [ a for a in artifacts if a in required and a[0] != 'databases' and catalog.has_artifact(a) ]
+            artifacts = [ a for a in artifacts if a not in plan['required'] ]
+            plan['config_hashes'] = { a: h for a, h in plan['config_hashes'].items() if a not in plan['required'] }
+            conf = filter_config(conf, artifacts)
+
+        dbs = catalog.databases
+        if 'heavyai' not in dbs and 'omnisci' not in dbs and 'mapd' not in dbs:
+            raise RuntimeError(f'{COLORS.FAIL}Planning failed:\nUnable to identify default database (one of "heavyai", "omnisci", or "mapd"){COLORS.END}')
+
+        plan['default_database'] = 'heavyai' if 'heavyai' in dbs else \
+                                   'omnisci' if 'omnisci' in dbs else \
+                                   'mapd'
+
+        for wave in PLAN_WAVES:
+            sections = [ s for s in wave if s in conf ]
+
+            if section_executor is not None:
+                futures = [ section_executor.submit(_plan_section, s, planners[s], pool, conf, plan, catalog, executor) for s in sections ]
+                results = [ f.result() for f in futures ]
+            else:
+                results = [ _plan_section(s, planners[s], pool, conf, plan, catalog, executor) for s in sections ]
+
+            # only add the wave's plans once the whole wave is done, so that
+            # no planner sees the plan of another planner in the same wave.
+            #
+            for section, (section_plan, e) in zip(sections, results):
+                if e is not None:
+                    err_msg += f'  Error planning {section.replace("_", " ")}: \n{e}\n'
+                else:
+                    plan[section] = section_plan
+
+    finally:
+        if executor is not None:
+            executor.shutdown()
+            section_executor.shutdown()
 
-    if 'configs' in conf:
-        try:
-            plan['configs'] = plan_configs(con, conf, plan)
-        except Exception as e:
-            err_msg += f'  Error planning configs: \n{e}\n'
-    
-    if 'databases' in conf:
-        try:
-            plan['databases'] = plan_databases(con, conf, plan)
-        except Exception as e:
-            err_msg += f'  Error planning databases: \n{e}\n'
-    
-    if 'static_tables' in conf:
-        try:
-            plan['static_tables'] = plan_static_tables(con, conf, plan)
-        except Exception as e:
-            err_msg += f'  Error planning static tables: \n{e}\n'
-    
-    if 'foreign_servers' in conf:
-        try:
-            plan['foreign_servers'] = plan_foreign_servers(con, conf, plan)
-        except Exception as e:
-            err_msg += f'  Error planning foreign servers: \n{e}\n'
-    
-    if 'foreign_tables' in conf:
-        try:
-            plan['foreign_tables'] = plan_foreign_tables(con, conf, plan)
-        except Exception as e:
-            err_msg += f'  Error planning foreign tables: \n{e}\n'
-    
-    if 'dashboards' in conf:
-        try:
-            plan['dashboards'] = plan_dashboards(con, conf, plan)
-        except Exception as e:
-            err_msg += f'  Error planning dashboards: \n{e}\n'
-
-    if 'roles' in conf:
-        try:
-            plan['roles'] = plan_roles(con, conf, plan)
-        except Exception as e:
-            err_msg += f'  Error planning roles: \n{e}\n'
-
-    if 'policies' in conf:
-        try:
-            plan['policies'] = plan_policies(con, conf, plan)
-        except Exception as e:
-            err_msg += f'  Error planning policies: \n{e}\n'
-
-    if 'users' in conf:
-        try:
-            plan['users'] = plan_users(con, conf, plan)
-        except Exception as e:
-            err_msg += f'  Error planning users: \n{e}\n'
-    
     if len(err_msg) != 0:
         raise RuntimeError(f'{COLORS.FAIL}Planning failed:\n{err_msg}{COLORS.END}')
 
     return plan
 
 
-def plan_configs(con: Connection, server_conf: dict, server_plan: dict) -> dict:
+def _plan_section(section: str, planner, pool: SessionPool, server_conf: dict, server_plan: dict, catalog: CatalogSnapshot, executor: Executor) -> tuple:
+    """Runs a planner, returning its plan and the exception it raised (if any)."""
+
+    try:
+        with span('section', section):
+            return planner(pool, server_conf, server_plan, catalog, executor), None
+    except Exception as e:
+        return None, e
+
+
+def _submit(executor: Executor, artifact: tuple, fn, *args) -> Future:
+    """Runs fn (the planning of an artifact) on the executor, or right away if there isn't one."""
+
+    def run():
+        with span('artifact', fn.__name__, artifact[1], artifact):
+            return fn(*args)
+
+    if executor is not None:
+        return executor.submit(run)
+
+    f = Future()
+    try:
+        f.set_result(run())
+    except Exception as e:
+        f.set_exception(e)
+
+    return f
+
+
+def dashboard_process_pool(processes: int) -> Executor:
+    """
+    A pool of processes to compare and parse dashboards in (see
+    analyze_dashboard), or None for no processes. The caller shuts it down.
+    """
+
+    if processes < 1:
+        return None
+
+    # the processes are started fresh, rather than forked from a process
+    # with planner threads and open connections.
+    #
+    return ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'))
+
+
+def _run_in_process(executor: Executor, fn, *args):
+    """Runs fn in the process pool and waits for it, or runs it right here if there isn't one."""
+
+    if executor is None:
+        return fn(*args)
+
+    return executor.submit(fn, *[ bytes(a) if isinstance(a, memoryview) else a for a in args ]).result()
+
+
+def _join_err_msgs(err_msgs: list) -> str:
+    """Joins a list of error messages and futures returning error messages, in order."""
+
+    return ''.join([ m.result() if isinstance(m, Future) else m for m in err_msgs ])
+
+
+def plan_configs(pool: SessionPool, server_conf: dict, server_plan: dict, catalog: CatalogSnapshot, executor: Executor = None) -> dict:
     return None
 
 
-def plan_databases(con: Connection, server_conf: dict, server_plan: dict) -> dict:
+def plan_databases(pool: SessionPool, server_conf: dict, server_plan: dict, catalog: CatalogSnapshot, executor: Executor = None) -> dict:
     databases_plan = {}
 
-    dbs = [ d.db_name for d in con._client.get_databases(con._session) ]
+    dbs = catalog.databases
 
     for db in server_conf['databases']:
         databases_plan[db] = {}
@@ -106,23 +220,21 @@ def plan_databases(con: Connection, server_conf: dict, server_plan: dict) -> dic
     return databases_plan
 
 
-def plan_static_tables(con: Connection, server_conf: dict, server_plan: dict) -> dict:
+def plan_static_tables(pool: SessionPool, server_conf: dict, server_plan: dict, catalog: CatalogSnapshot, executor: Executor = None) -> dict:
     static_tables_plan = {}
-    err_msg = ''
+    err_msgs = []
 
-    dbs = [ d.db_name for d in con._client.get_databases(con._session) ]
+    dbs = catalog.databases
 
     for db in server_conf['static_tables']:
         if db not in dbs and \
            ('databases' not in server_plan or db not in server_plan['databases']):
-            err_msg += f'    Unable to create/modify static tables in database "{db}": Database does not exist and not in plan.\n'
+            err_msgs.append(f'    Unable to create/modify static tables in database "{db}": Database does not exist and not in plan.\n')
             continue
 
         static_tables_plan[db] = {}
 
-        with warnings.catch_warnings():
-            warnings.simplefilter(action='ignore', category=UserWarning)
-            tab_list = pd.read_sql_query(f"SELECT table_name FROM tables WHERE database_name = '{db}'", con)['table_name'].values
+        tab_list = catalog.tables.get(db, set())
 
         for tab in server_conf['static_tables'][db]:
             if tab == '_comment':
@@ -132,38 +244,11 @@ def plan_static_tables(con: Connection, server_conf: dict, server_plan: dict) ->
             static_tables_plan[db][tab]['state'] = RESOURCE_STATES.EXISTS if tab in tab_list else \
                                                    RESOURCE_STATES.NEEDS_CREATION
 
-            if 'ddl_uri' in static_tables_plan[db][tab] and \
-               (static_tables_plan[db][tab]['state'] == RESOURCE_STATES.NEEDS_CREATION or \
-                static_tables_plan[db][tab]['if_exists'] != RESOURCE_IF_EXISTS_ACTIONS.SKIP) and \
-               not file_exists(static_tables_plan[db][tab]['ddl_uri']):
-                err_msg += f'    Unable to create static table "{tab}" in database "{db}" from "ddl_uri": File "{static_tables_plan[db][tab]["ddl_uri"]}" not found.\n'
-                continue
-
-            # TODO: import data can come from ODBC and custom s3 endpoints.
-            #       need to figure out how to handle those.
+            # the file checks are the slow part, so they can run concurrently.
             #
-            if 'import' in static_tables_plan[db][tab] and \
-               (static_tables_plan[db][tab]['state'] == RESOURCE_STATES.NEEDS_CREATION or \
-                static_tables_plan[db][tab]['if_exists'] != RESOURCE_IF_EXISTS_ACTIONS.SKIP) and \
-               static_tables_plan[db][tab]['import']['is_dump'] and \
-               not file_exists(static_tables_plan[db][tab]['import']['source_uri']):
-                err_msg += f'    Unable to import data into static table "{tab}" in database "{db}" from "source_uri": File "{static_tables_plan[db][tab]["import"]["source_uri"]}" not found.\n'
-                continue
-
-            if not 'import' in static_tables_plan[db][tab] or \
-               not static_tables_plan[db][tab]['import']['is_dump']:
+            err_msgs.append(_submit(executor, ('static_tables', db, tab), _plan_static_table, db, tab, static_tables_plan[db][tab]))
 
-                if 'ddl_cmd' in static_tables_plan[db][tab]:
-                    ddl_cmd = static_tables_plan[db][tab]['ddl_cmd']
-                else:
-                    ddl_cmd = get_file_content(static_tables_plan[db][tab]['ddl_uri'])
-                
-                static_tables_plan[db][tab]['ddl_cmd'] = ddl_cmd
-                
-                if not re.match(RE_IS_CREATE_STATIC_TABLE_DDL, ddl_cmd):
-                    err_msg += f'    Unable to create static table "{tab}" in database "{db}": DDL does not appear to be a CREATE TABLE statement.\n'
-                    continue
-        
+    err_msg = _join_err_msgs(err_msgs)
 
     if len(err_msg) != 0:
         raise RuntimeError(err_msg)
@@ -171,11 +256,46 @@ def plan_static_tables(con: Connection, server_conf: dict, server_plan: dict) ->
     return static_tables_plan
 
 
-def plan_foreign_servers(con: Connection, server_conf: dict, server_plan: dict) -> dict:
+def _plan_static_table(db: str, tab: str, tab_plan: dict) -> str:
+    """Checks the DDL and import sources of a static table, returning any error messages."""
+
+    if 'ddl_uri' in tab_plan and \
+       (tab_plan['state'] == RESOURCE_STATES.NEEDS_CREATION or \
+        tab_plan['if_exists'] != RESOURCE_IF_EXISTS_ACTIONS.SKIP) and \
+       not file_exists(tab_plan['ddl_uri'], fetch=True):
+        return f'    Unable to create static table "{tab}" in database "{db}" from "ddl_uri": File "{tab_plan["ddl_uri"]}" not found.\n'
+
+    # TODO: import data can come from ODBC and custom s3 endpoints.
+    #       need to figure out how to handle those.
+    #
+    if 'import' in tab_plan and \
+       (tab_plan['state'] == RESOURCE_STATES.NEEDS_CREATION or \
+        tab_plan['if_exists'] != RESOURCE_IF_EXISTS_ACTIONS.SKIP) and \
+       tab_plan['import']['is_dump'] and \
+       not file_exists(tab_plan['import']['source_uri']):
+        return f'    Unable to import data into static table "{tab}" in database "{db}" from "source_uri": File "{tab_plan["import"]["source_uri"]}" not found.\n'
+
+    if not 'import' in tab_plan or \
+       not tab_plan['import']['is_dump']:
+
+        if 'ddl_cmd' in tab_plan:
+            ddl_cmd = tab_plan['ddl_cmd']
+        else:
+            ddl_cmd = get_file_content(tab_plan['ddl_uri'])
+        
+        tab_plan['ddl_cmd'] = ddl_cmd
+        
+        if not re.match(RE_IS_CREATE_STATIC_TABLE_DDL, ddl_cmd):
+            return f'    Unable to create static table "{tab}" in database "{db}": DDL does not appear to be a CREATE TABLE statement.\n'
+
+    return ''
+
+
+def plan_foreign_servers(pool: SessionPool, server_conf: dict, server_plan: dict, catalog: CatalogSnapshot, executor: Executor = None) -> dict:
     foreign_servers_plan = {}
     err_msg = ''
 
-    dbs = [ d.db_name for d in con._client.get_databases(con._session) ]
+    dbs = catalog.databases
 
     for db in server_conf['foreign_servers']:
         if db not in dbs and \
@@ -186,29 +306,19 @@ def plan_foreign_servers(con: Connection, server_conf: dict, server_plan: dict)
         foreign_servers_plan[db] = {}
 
         # there's no "servers" table in the "information_schema" database, so
-        # we have to switch to the database in question in order to use SHOW
-        # SERVERS to get the list of servers. start by creating an empty result
-        # set with the correct schema.
+        # the catalog snapshot gathers the SHOW SERVERS output of each
+        # database in the artifacts file that already exists.
         #
-        schema={'server_name': 'object', 'data_wrapper': 'object', 'created_at': 'datetime64[ns]', 'options': 'object'}
-        servers_list = pd.DataFrame(columns=schema.keys()).astype(schema)
-        if server_plan['databases'][db]['state'] == RESOURCE_STATES.EXISTS:
-            with warnings.catch_warnings():
-                warnings.simplefilter(action='ignore', category=UserWarning)
-
-                orig_db = con._client.get_session_info(con._session).database
-                con._client.switch_database(con._session, db)
-                servers_list = pd.read_sql_query(f"SHOW SERVERS", con)
-                con._client.switch_database(con._session, orig_db)
+        servers_list = catalog.servers.get(db, {})
 
         for fs in server_conf['foreign_servers'][db]:
             foreign_servers_plan[db][fs] = server_conf['foreign_servers'][db][fs]
 
-            foreign_servers_plan[db][fs]['state'] = RESOURCE_STATES.EXISTS if fs in servers_list['server_name'].values else \
+            foreign_servers_plan[db][fs]['state'] = RESOURCE_STATES.EXISTS if fs in servers_list else \
                                                     RESOURCE_STATES.NEEDS_CREATION
             
             if foreign_servers_plan[db][fs]['state'] == RESOURCE_STATES.EXISTS:
-                options = json.loads(servers_list[servers_list['server_name'] == fs]['options'].values[0])
+                options = json.loads(servers_list[fs]['options'])
 
                 # figure out what options are different between the current
                 # settings and the plan. settings can't be removed by an ALTER
@@ -222,7 +332,7 @@ def plan_foreign_servers(con: Connection, server_conf: dict, server_plan: dict)
                                        foreign_servers_plan[db][fs][o.lower()] != options[o] 
                                    ]
 
-                if foreign_servers_plan[db][fs]['wrapper'] != servers_list[servers_list['server_name'] == fs]['data_wrapper'].values[0]:
+                if foreign_servers_plan[db][fs]['wrapper'] != servers_list[fs]['data_wrapper']:
                     fields_to_update.append('wrapper')
 
                 if len(fields_to_update) > 0:
@@ -238,31 +348,22 @@ def plan_foreign_servers(con: Connection, server_conf: dict, server_plan: dict)
     return foreign_servers_plan
 
 
-def plan_foreign_tables(con: Connection, server_conf: dict, server_plan: dict) -> dict:
+def plan_foreign_tables(pool: SessionPool, server_conf: dict, server_plan: dict, catalog: CatalogSnapshot, executor: Executor = None) -> dict:
     foreign_tables_plan = {}
-    err_msg = ''
+    err_msgs = []
 
-    dbs = [ d.db_name for d in con._client.get_databases(con._session) ]
+    dbs = catalog.databases
 
     for db in server_conf['foreign_tables']:
         if db not in dbs and \
            ('databases' not in server_plan or db not in server_plan['databases']):
-            err_msg += f'    Unable to create/modify foreign tables in database "{db}": Database does not exist and not in plan.\n'
+            err_msgs.append(f'    Unable to create/modify foreign tables in database "{db}": Database does not exist and not in plan.\n')
             continue
 
         foreign_tables_plan[db] = {}
 
-        tab_list = []
-        server_list = []
-
-        if db in dbs:
-            with warnings.catch_warnings():
-                warnings.simplefilter(action='ignore', category=UserWarning)
-                orig_db = con._client.get_session_info(con._session).database
-                con._client.switch_database(con._session, db)
-                tab_list = pd.read_sql_query(f"SHOW TABLES", con)['table_name'].values
-                server_list = pd.read_sql_query(f"SHOW SERVERS", con)['server_name'].values
-                con._client.switch_database(con._session, orig_db)
+        tab_list = catalog.tables.get(db, set())
+        server_list = catalog.servers.get(db, {})
 
         for tab in server_conf['foreign_tables'][db]:
             if tab == '_comment':
@@ -272,32 +373,9 @@ def plan_foreign_tables(con: Connection, server_conf: dict, server_plan: dict) -
             foreign_tables_plan[db][tab]['state'] = RESOURCE_STATES.EXISTS if tab in tab_list else \
                                                    RESOURCE_STATES.NEEDS_CREATION
 
-            if 'ddl_uri' in foreign_tables_plan[db][tab] and \
-               (foreign_tables_plan[db][tab]['state'] == RESOURCE_STATES.NEEDS_CREATION or \
-                foreign_tables_plan[db][tab]['if_exists'] != RESOURCE_IF_EXISTS_ACTIONS.SKIP) and \
-               not file_exists(foreign_tables_plan[db][tab]['ddl_uri']):
+            err_msgs.append(_submit(executor, ('foreign_tables', db, tab), _plan_foreign_table, db, tab, foreign_tables_plan[db][tab], server_list, server_plan))
 
-                err_msg += f'    Unable to create foreign table "{tab}" in database "{db}" from "ddl_uri": File "{foreign_tables_plan[db][tab]["ddl_uri"]}" not found.\n'
-                continue
-
-            if 'ddl_cmd' in foreign_tables_plan[db][tab]:
-                ddl_cmd = foreign_tables_plan[db][tab]['ddl_cmd']
-            else:
-                ddl_cmd = get_file_content(foreign_tables_plan[db][tab]['ddl_uri'])
-                foreign_tables_plan[db][tab]['ddl_cmd'] = ddl_cmd
-            
-            if not re.match(RE_IS_CREATE_FOREIGN_TABLE_DDL, ddl_cmd):
-                err_msg += f'    Unable to create foreign table "{tab}" in database "{db}": DDL does not appear to be a CREATE FOREIGN TABLE statement.\n'
-                continue
-
-            if foreign_tables_plan[db][tab]['server'] not in server_list and \
-               ('foreign_servers' not in server_plan or \
-                db not in server_plan['foreign_servers'] or \
-                foreign_tables_plan[db][tab]['server'] not in server_plan['foreign_servers'][db]):
-
-                err_msg += f'    Unable to create foreign table "{tab}" in database "{db}": Server "{foreign_tables_plan[db][tab]["server"]}" does not exist in database "{db}" and not in plan.\n'
-                continue
-        
+    err_msg = _join_err_msgs(err_msgs)
 
     if len(err_msg) != 0:
         raise RuntimeError(err_msg)
@@ -305,93 +383,173 @@ def plan_foreign_tables(con: Connection, server_conf: dict, server_plan: dict) -
     return foreign_tables_plan
 
 
-def plan_dashboards(con: Connection, server_conf: dict, server_plan: dict) -> dict:
-    dashboards_plan = {}
-    err_msg = ''
+def _plan_foreign_table(db: str, tab: str, tab_plan: dict, server_list: dict, server_plan: dict) -> str:
+    """Checks the DDL and server of a foreign table, returning any error messages."""
+
+    if 'ddl_uri' in tab_plan and \
+       (tab_plan['state'] == RESOURCE_STATES.NEEDS_CREATION or \
+        tab_plan['if_exists'] != RESOURCE_IF_EXISTS_ACTIONS.SKIP) and \
+       not file_exists(tab_plan['ddl_uri'], fetch=True):
 
-    with warnings.catch_warnings():
-        warnings.simplefilter(action='ignore', category=UserWarning)
-        table_list = pd.read_sql_query(f"SELECT table_name, database_name FROM tables", con)
+        return f'    Unable to create foreign table "{tab}" in database "{db}" from "ddl_uri": File "{tab_plan["ddl_uri"]}" not found.\n'
+
+    if 'ddl_cmd' in tab_plan:
+        ddl_cmd = tab_plan['ddl_cmd']
+    else:
+        ddl_cmd = get_file_content(tab_plan['ddl_uri'])
+        tab_plan['ddl_cmd'] = ddl_cmd
+    
+    if not re.match(RE_IS_CREATE_FOREIGN_TABLE_DDL, ddl_cmd):
+        return f'    Unable to create foreign table "{tab}" in database "{db}": DDL does not appear to be a CREATE FOREIGN TABLE statement.\n'
 
-    dbs = [ d.db_name for d in con._client.get_databases(con._session) ]
+    if tab_plan['server'] not in server_list and \
+       ('foreign_servers' not in server_plan or \
+        db not in server_plan['foreign_servers'] or \
+        tab_plan['server'] not in server_plan['foreign_servers'][db]):
+
+        return f'    Unable to create foreign table "{tab}" in database "{db}": Server "{tab_plan["server"]}" does not exist in database "{db}" and not in plan.\n'
+
+    return ''
+
+
+def plan_dashboards(pool: SessionPool, server_conf: dict, server_plan: dict, catalog: CatalogSnapshot, executor: Executor = None,
+                    state: State = None, process_executor: Executor = None) -> dict:
+    dashboards_plan = {}
+    err_msgs = []
+
+    dbs = catalog.databases
 
     for db in server_conf['dashboards']:
         if db not in dbs and \
            ('databases' not in server_plan or db not in server_plan['databases']):
-            err_msg += f'    Unable to create/modify dashboards in database "{db}": Database does not exist and not in plan.\n'
+            err_msgs.append(f'    Unable to create/modify dashboards in database "{db}": Database does not exist and not in plan.\n')
             continue
 
         dashboards_plan[db] = {}
 
-        with warnings.catch_warnings():
-            warnings.simplefilter(action='ignore', category=UserWarning)
-            dash_list = pd.read_sql_query(f"SELECT dashboard_name, dashboard_id FROM dashboards WHERE database_name = '{db}'", con)
+        dash_list = catalog.dashboards.get(db, {})
 
         for dash in server_conf['dashboards'][db]:
             if dash == '_comment':
                 continue
 
             dashboards_plan[db][dash] = server_conf['dashboards'][db][dash]
-            dashboards_plan[db][dash]['state'] = RESOURCE_STATES.EXISTS if dash in dash_list['dashboard_name'].values else \
+            dashboards_plan[db][dash]['state'] = RESOURCE_STATES.EXISTS if dash in dash_list else \
                                                  RESOURCE_STATES.NEEDS_CREATION
 
             if dashboards_plan[db][dash]['state'] == RESOURCE_STATES.EXISTS:
-                dash_id = dash_list[dash_list['dashboard_name'] == dash]['dashboard_id'].values[0]
-                dashboards_plan[db][dash]['dashboard_id'] = dash_id
+                dashboards_plan[db][dash]['dashboard_id'] = dash_list[dash]
 
-            if not file_exists(dashboards_plan[db][dash]['dashboard_uri']):
-                err_msg += f'    Unable to import dashboard "{dash}" into database "{db}": File "{dashboards_plan[db][dash]["dashboard_uri"]}" not found.\n'
-                continue
+            # downloading and comparing the dashboards is the slow part, so
+            # they can run concurrently.
+            #
+            err_msgs.append(_submit(executor, ('dashboards', db, dash), _plan_dashboard, pool, db, dash, dashboards_plan[db][dash], catalog, server_plan, state, process_executor))
 
-            if dashboards_plan[db][dash]['state'] == RESOURCE_STATES.EXISTS:
-                if is_dash_code_same(con, db, dash_id, dashboards_plan[db][dash]["dashboard_uri"]):
-                    dashboards_plan[db][dash]['state'] = RESOURCE_STATES.UP_TO_DATE
-                else:
-                    dashboards_plan[db][dash]['state'] = RESOURCE_STATES.NEEDS_UPDATE
-            
-            if dashboards_plan[db][dash]['state'] != RESOURCE_STATES.UP_TO_DATE:
-                try:
-                    dash_state = get_file_content(dashboards_plan[db][dash]['dashboard_uri']).split('\n')[2]
-                    dash_dict = json.loads(dash_state)
-                except Exception as e:
-                    err_msg += f'    Unable to import dashboard "{dash}" into database "{db}": Error parsing dashboard state: {e}\n'
-                    continue
+    err_msg = _join_err_msgs(err_msgs)
 
-                for t in get_dash_table_deps(dash_dict):
-                    m = re.match(r'(\w+\.)?(\w+)', t)
-                    t_db = db if m.group(1) is None else m.group(1)[:-1] # immerse doesn't currently support choosing a table from a different database, but some day ...
-                    t_name = m.group(2)
+    if len(err_msg) != 0:
+        raise RuntimeError(err_msg)
 
-                    if table_list[(table_list['database_name'] == t_db) & (table_list['table_name'] == t_name)].empty and \
-                       ('static_tables' not in server_plan or \
-                        t_db not in server_plan['static_tables'] or \
-                        t not in server_plan['static_tables'][t_db]) and \
-                       ('foreign_tables' not in server_plan or \
-                        t_db not in server_plan['foreign_tables'] or \
-                        t not in server_plan['foreign_tables'][t_db]):
+    return dashboards_plan
 
-                        err_msg += f'    Unable to import dashboard "{dash}" into database "{db}": Dependent table "{t}" does not exist and not in plan.\n'
 
-                    # TODO: validate columns in the tables.
+def _plan_dashboard(pool: SessionPool, db: str, dash: str, dash_plan: dict, catalog: CatalogSnapshot, server_plan: dict,
+                    state: State = None, process_executor: Executor = None) -> str:
+    """Compares a dashboard with the server copy and checks its tables, returning any error messages."""
 
+    err_msg = ''
 
-    if len(err_msg) != 0:
-        raise RuntimeError(err_msg)
+    # if the file, its configuration and the server copy are all as they
+    # were when the dashboard was last applied, it's up to date without
+    # downloading and comparing it.
+    #
+    if state is not None:
+        dash_plan['fingerprint'] = get_file_fingerprint(dash_plan['dashboard_uri'])
+        applied = state.get(('dashboards', db, dash))
+
+        if dash_plan['state'] == RESOURCE_STATES.EXISTS and \
+           dash_plan['fingerprint'] is not None and \
+           applied is not None and \
+           applied.get('fingerprint') == dash_plan['fingerprint'] and \
+           applied.get('config_hash') == server_plan['config_hashes'].get(('dashboards', db, dash)) and \
+           applied.get('dashboard_id') == dash_plan['dashboard_id'] and \
+           applied.get('update_time') == pool.dashboards.get_update_time(db, dash_plan['dashboard_id']):
+
+            dash_plan['state'] = RESOURCE_STATES.UP_TO_DATE
+            dash_plan['state_fingerprint'] = applied.get('state_fingerprint')
+            return err_msg
+
+    if not file_exists(dash_plan['dashboard_uri'], fetch=True):
+        return f'    Unable to import dashboard "{dash}" into database "{db}": File "{dash_plan["dashboard_uri"]}" not found.\n'
+
+    # the server copy is only downloaded if its fingerprint isn't known for
+    # its last update time, from earlier in the run or from the last apply.
+    #
+    server_state = None
+    server_fingerprint = None
+    if dash_plan['state'] == RESOURCE_STATES.EXISTS:
+        server_fingerprint = pool.dashboards.get_fingerprint(db, dash_plan['dashboard_id'])
 
-    return dashboards_plan
+        if server_fingerprint is None and state is not None:
+            applied = state.get(('dashboards', db, dash))
+
+            if applied is not None and \
+               applied.get('dashboard_id') == dash_plan['dashboard_id'] and \
+               applied.get('update_time') == pool.dashboards.get_update_time(db, dash_plan['dashboard_id']):
+
+                server_fingerprint = applied.get('state_fingerprint')
+
+        if server_fingerprint is None:
+            con = pool.get(db)
+            server_state = con._client.get_dashboard(con._session, dash_plan['dashboard_id']).dashboard_state
+
+    # comparing with the server copy and finding the tables is CPU bound, so
+    # with a process pool it doesn't hold up the other planner threads.
+    #
+    try:
+        with get_dashboard_export(dash_plan['dashboard_uri']) as export:
+            fingerprint, server_fingerprint, tables = _run_in_process(process_executor, analyze_dashboard, export.state_bytes, server_state, server_fingerprint)
+    except Exception as e:
+        return f'    Unable to import dashboard "{dash}" into database "{db}": Error parsing dashboard state: {e}\n'
+
+    dash_plan['state_fingerprint'] = fingerprint
+
+    if dash_plan['state'] == RESOURCE_STATES.EXISTS:
+        pool.dashboards.set_fingerprint(db, dash_plan['dashboard_id'], server_fingerprint)
+        dash_plan['state'] = RESOURCE_STATES.UP_TO_DATE if fingerprint == server_fingerprint else RESOURCE_STATES.NEEDS_UPDATE
+
+    if dash_plan['state'] != RESOURCE_STATES.UP_TO_DATE:
+        dash_plan['table_deps'] = []
+
+        for t in tables:
+            m = re.match(r'(\w+\.)?(\w+)', t)
+            t_db = db if m.group(1) is None else m.group(1)[:-1] # immerse doesn't currently support choosing a table from a different database, but some day ...
+            t_name = m.group(2)
 
+            dash_plan['table_deps'].append((t_db, t_name))
 
-def plan_roles(con: Connection, server_conf: dict, server_plan: dict) -> dict:
+            if not catalog.has_table(t_db, t_name) and \
+               ('static_tables' not in server_plan or \
+                t_db not in server_plan['static_tables'] or \
+                t not in server_plan['static_tables'][t_db]) and \
+               ('foreign_tables' not in server_plan or \
+                t_db not in server_plan['foreign_tables'] or \
+                t not in server_plan['foreign_tables'][t_db]):
+
+                err_msg += f'    Unable to import dashboard "{dash}" into database "{db}": Dependent table "{t}" does not exist and not in plan.\n'
+
+            # TODO: validate columns in the tables.
+
+    return err_msg
+
+
+def plan_roles(pool: SessionPool, server_conf: dict, server_plan: dict, catalog: CatalogSnapshot, executor: Executor = None) -> dict:
 
     roles_plan = {}
     err_msg = ''
 
-    dbs = [ d.db_name for d in con._client.get_databases(con._session) ]
-
-    with warnings.catch_warnings():
-        warnings.simplefilter(action='ignore', category=UserWarning)
-        roles = pd.read_sql_query("SELECT role_name FROM roles", con)['role_name'].values
-        dashboards = pd.read_sql_query("SELECT dashboard_name, dashboard_id, database_name FROM dashboards", con)
+    dbs = catalog.databases
+    roles = catalog.roles
 
     for r in server_conf['roles']:
         roles_plan[r] = {}
@@ -430,7 +588,7 @@ def plan_roles(con: Connection, server_conf: dict, server_plan: dict) -> dict:
 
                 for dash in server_conf['roles'][r]['dashboards'][db]:
 
-                    dash_exists = not dashboards[(dashboards['database_name'] == db) & (dashboards['dashboard_name'] == dash)].empty
+                    dash_exists = dash in catalog.dashboards.get(db, {})
                     dash_in_plan = ('dashboards' in server_plan and \
                         db in server_plan['dashboards'] and \
                         dash in server_plan['dashboards'][db])
@@ -439,10 +597,13 @@ def plan_roles(con: Connection, server_conf: dict, server_plan: dict) -> dict:
                         err_msg += f'    Unable to apply dashboard permissions for role "{r}": Dashboard "{dash}" in database "{db}" does not exist and not in plan.\n'
                         continue
 
+                    # a dashboard that's updated is replaced in place, so it
+                    # keeps its id too.
+                    #
                     if dash_exists and not dash_in_plan or \
-                       server_plan['dashboards'][db][dash]['state'] == RESOURCE_STATES.UP_TO_DATE:
+                       server_plan['dashboards'][db][dash]['state'] in (RESOURCE_STATES.UP_TO_DATE, RESOURCE_STATES.NEEDS_UPDATE):
 
-                        dash_id = get_dash_id_from_name(con, db, dash)
+                        dash_id = get_dash_id_from_name(pool, db, dash)
 
                     else:
                         dash_id = -1
@@ -457,16 +618,13 @@ def plan_roles(con: Connection, server_conf: dict, server_plan: dict) -> dict:
     return roles_plan
 
 
-def plan_policies(con: Connection, server_conf: dict, server_plan: dict) -> dict:
+def plan_policies(pool: SessionPool, server_conf: dict, server_plan: dict, catalog: CatalogSnapshot, executor: Executor = None) -> dict:
     err_msg = ''
     policies_plan = {}
 
-    with warnings.catch_warnings():
-        warnings.simplefilter(action='ignore', category=UserWarning)
-        users = pd.read_sql_query("SELECT user_name FROM users", con)['user_name'].values
-        roles = pd.read_sql_query("SELECT role_name FROM roles", con)['role_name'].values
-
-    dbs = [ d.db_name for d in con._client.get_databases(con._session) ]
+    users = catalog.users
+    roles = catalog.roles
+    dbs = catalog.databases
 
     for db in server_conf['policies']:
         if db not in dbs and \
@@ -476,11 +634,7 @@ def plan_policies(con: Connection, server_conf: dict, server_plan: dict) -> dict
 
         policies_plan[db] = {}
 
-        if db in dbs:
-            con._client.switch_database(con._session, db)
-            table_list = con.get_tables()
-        else:
-            table_list = []
+        table_list = catalog.tables.get(db, set())
 
         for tab in server_conf['policies'][db]:
 
@@ -500,7 +654,7 @@ def plan_policies(con: Connection, server_conf: dict, server_plan: dict) -> dict
 
             if tab in table_list:
                 tab_exists = True
-                col_list = con.get_column_details(tab)
+                col_list = catalog.columns[db][tab]
 
             if 'static_tables' in server_plan and \
                db in server_plan['static_tables'] and \
@@ -575,13 +729,8 @@ def plan_policies(con: Connection, server_conf: dict, server_plan: dict) -> dict
 
                     policies_plan[db][tab][col][ur]['state'] = RESOURCE_STATES.NEEDS_CREATION
 
-                    if ur in users or ur in roles:
-                        with warnings.catch_warnings():
-                            warnings.simplefilter(action='ignore', category=UserWarning)
-                            df = pd.read_sql_query(f'SHOW POLICIES {ur}', con)
-
-                        if f'{tab}.{col}'.upper() in [ str(c).upper() for c in df['COLUMN'].values ]:
-                            policies_plan[db][tab][col][ur]['state'] = RESOURCE_STATES.EXISTS
+                    if f'{tab}.{col}'.upper() in catalog.policies.get(db, {}).get(ur, ()):
+                        policies_plan[db][tab][col][ur]['state'] = RESOURCE_STATES.EXISTS
 
                     values = server_conf['policies'][db][tab][col][ur]
 
@@ -610,24 +759,19 @@ def plan_policies(con: Connection, server_conf: dict, server_plan: dict) -> dict
 
                     policies_plan[db][tab][col][ur]['values'] = values_sql
 
-    con._client.switch_database(con._session, 'information_schema')
-
     if len(err_msg) != 0:
         raise RuntimeError(err_msg)
 
     return policies_plan
 
 
-def plan_users(con: Connection, server_conf: dict, server_plan: dict) -> dict:
+def plan_users(pool: SessionPool, server_conf: dict, server_plan: dict, catalog: CatalogSnapshot, executor: Executor = None) -> dict:
     users_plan = {}
     err_msg = ''
 
-    dbs = [ d.db_name for d in con._client.get_databases(con._session) ]
-
-    with warnings.catch_warnings():
-        warnings.simplefilter(action='ignore', category=UserWarning)
-        roles = pd.read_sql_query("SELECT role_name FROM roles", con)['role_name'].values
-        users = pd.read_sql_query("SELECT user_name FROM users", con)['user_name'].values
+    dbs = catalog.databases
+    roles = catalog.roles
+    users = catalog.users
 
     for u in server_conf['users']:
         users_plan[u] = server_conf['users'][u]
@@ -655,42 +799,40 @@ def plan_users(con: Connection, server_conf: dict, server_plan: dict) -> dict:
     return users_plan
 
 
-def generate_ddl(plan: dict) -> list[str]:
-    ddls = {}
-
+def generate_ddl(plan: dict) -> OperationGraph:
     # generate a common postfix for all resources that are being replaced in
     # case we need to roll back the replacement(s)
     #
     new_resource_postfix = '_replaced_on_' + datetime.now().strftime('%Y%m%d%H%M%S')
     def_db = plan['default_database']
 
+    graph = OperationGraph(def_db)
+
     if 'configs' in plan:
         pass
 
     if 'databases' in plan:
-        if 'databases' not in ddls:
-            ddls['databases'] = { def_db: [f'\\db {def_db}'] }
+        graph.open('databases', def_db)
         
         for db in plan['databases']:
+            artifact = ('databases', db)
             if plan['databases'][db]['state'] == RESOURCE_STATES.NEEDS_CREATION:
-                ddls['databases'][def_db].append(f'CREATE DATABASE {db}')
+                graph.add('databases', def_db, f'CREATE DATABASE {db}', provides=('database', db), artifact=artifact)
             else:
-                ddls['databases'][def_db].append(f'-- {COLORS.GREEN}Database "{db}" exists. Skipping.{COLORS.END}')
+                graph.note('databases', def_db, f'{COLORS.GREEN}Database "{db}" exists. Skipping.{COLORS.END}', artifact=artifact)
 
 
     if 'static_tables' in plan:
-        if 'static_tables' not in ddls:
-            ddls['static_tables'] = {}
-        
         for db in plan['static_tables']:
-            if db not in ddls['static_tables']:
-                ddls['static_tables'][db] = [f'\\db {db}']
+            graph.open('static_tables', db)
 
             for tab in plan['static_tables'][db]:
+                artifact = ('static_tables', db, tab)
+                prev = None
 
                 if plan['static_tables'][db][tab]['state'] == RESOURCE_STATES.EXISTS:
                     if plan['static_tables'][db][tab]['if_exists'] == RESOURCE_IF_EXISTS_ACTIONS.SKIP:
-                        ddls['static_tables'][db].append(f'-- {COLORS.WARNING}Table "{tab}" exists but "if_exists" flag set to "skip". Skipping.{COLORS.END}')
+                        graph.note('static_tables', db, f'{COLORS.WARNING}Table "{tab}" exists but "if_exists" flag set to "skip". Skipping.{COLORS.END}', artifact=artifact)
                         continue
                     else:
                         # even if the plan is to replace a table, make a
@@ -698,7 +840,7 @@ def generate_ddl(plan: dict) -> list[str]:
                         # successful. we'll drop it later.
                         #
                         new_tab = tab + new_resource_postfix
-                        ddls['static_tables'][db].append(f'ALTER TABLE {tab} RENAME TO {new_tab}')
+                        prev = graph.add('static_tables', db, f'ALTER TABLE {tab} RENAME TO {new_tab}', artifact=artifact)
 
                 # The RESTORE TABLE command requires that the table being
                 # restored does not already exist (unlike COPY...FROM).
@@ -713,7 +855,7 @@ def generate_ddl(plan: dict) -> list[str]:
                     #
                     ddl = re.sub(RE_IS_CREATE_STATIC_TABLE_DDL, f'CREATE TABLE {tab}', ddl)
 
-                    ddls['static_tables'][db].append(ddl)
+                    prev = graph.add('static_tables', db, ddl, after=(prev,), provides=('table', db, tab), artifact=artifact)
 
                 if 'import' in plan['static_tables'][db][tab]:
                     ddl = ''
@@ -731,22 +873,22 @@ def generate_ddl(plan: dict) -> list[str]:
 
                         ddl += f' WITH ({with_clause})'
 
-                    ddls['static_tables'][db].append(ddl)
+                    # anything using the table waits for its data, too
+                    #
+                    prev = graph.add('static_tables', db, ddl, after=(prev,), provides=('table', db, tab), artifact=artifact)
 
-                # drop the old table if it exists and the plan is to replace it
+                # drop the old table if it exists and the plan is to replace
+                # it. this waits for the import, so a failed import leaves the
+                # backup in place.
                 #
                 if plan['static_tables'][db][tab]['state'] == RESOURCE_STATES.EXISTS and \
                    plan['static_tables'][db][tab]['if_exists'] == RESOURCE_IF_EXISTS_ACTIONS.REPLACE:
-                    ddls['static_tables'][db].append(f'DROP TABLE {new_tab}')
+                    graph.add('static_tables', db, f'DROP TABLE {new_tab}', after=(prev,), artifact=artifact)
 
 
     if 'foreign_servers' in plan:
-        if 'foreign_servers' not in ddls:
-            ddls['foreign_servers'] = {}
-        
         for db in plan['foreign_servers']:
-            if db not in ddls['foreign_servers']:
-                ddls['foreign_servers'][db] = [f'\\db {db}']
+            graph.open('foreign_servers', db)
 
             # can only create or alter here. drop would require dropping all of
             # the dependent foreign tables, which is not something we want to
@@ -755,49 +897,55 @@ def generate_ddl(plan: dict) -> list[str]:
             # database nor is there a SHOW FOREIGN TABLES command.
             #
             for fs in plan['foreign_servers'][db]:
+                artifact = ('foreign_servers', db, fs)
+                prev = None
+
                 match plan['foreign_servers'][db][fs]['state']:
 
                     case RESOURCE_STATES.UP_TO_DATE:
-                        ddls['foreign_servers'][db].append(f'-- {COLORS.GREEN}Server "{fs}" exists and is up to date. Skipping.{COLORS.END}')
+                        graph.note('foreign_servers', db, f'{COLORS.GREEN}Server "{fs}" exists and is up to date. Skipping.{COLORS.END}', artifact=artifact)
                         continue
 
                     case RESOURCE_STATES.NEEDS_CREATION:
                         ddl = f'CREATE SERVER {fs} FOREIGN DATA WRAPPER {plan["foreign_servers"][db][fs]["wrapper"]} WITH (' + \
                                    ', '.join([ f"{o}='{plan['foreign_servers'][db][fs][o.lower()]}'" for o in FS_OPTIONS if o.lower() in plan['foreign_servers'][db][fs] ]) + \
                                ')'
-                        ddls['foreign_servers'][db].append(ddl)
+                        prev = graph.add('foreign_servers', db, ddl, artifact=artifact)
 
                     case RESOURCE_STATES.NEEDS_UPDATE:
                         if 'wrapper' in plan['foreign_servers'][db][fs]['fields_to_update']:
                             ddl = f'ALTER SERVER {fs} SET FOREIGN DATA WRAPPER {plan["foreign_servers"][db][fs]["wrapper"]}'
-                            ddls['foreign_servers'][db].append(ddl)
+                            prev = graph.add('foreign_servers', db, ddl, artifact=artifact)
                             plan['foreign_servers'][db][fs]['fields_to_update'].remove('wrapper')
 
                         if len(plan['foreign_servers'][db][fs]['fields_to_update']) > 0:
                             ddl = f'ALTER SERVER {fs} SET (' + \
                                        ', '.join([ f"{o.upper()}='{plan['foreign_servers'][db][fs][o]}'" for o in plan['foreign_servers'][db][fs]['fields_to_update'] ]) + \
                                    ')'
-                            ddls['foreign_servers'][db].append(ddl)
+                            prev = graph.add('foreign_servers', db, ddl, after=(prev,), artifact=artifact)
                 
                 if 'user_mapping_with_clause' in plan['foreign_servers'][db][fs]:
-                    ddls['foreign_servers'][db].append(f'DROP USER MAPPING IF EXISTS FOR PUBLIC SERVER {fs}')
+                    prev = graph.add('foreign_servers', db, f'DROP USER MAPPING IF EXISTS FOR PUBLIC SERVER {fs}', after=(prev,), artifact=artifact)
 
                     with_clause = plan['foreign_servers'][db][fs]['user_mapping_with_clause']
                     if with_clause.startswith('(') and with_clause.endswith(')'):
                         with_clause = with_clause[1:-1]
 
-                    ddls['foreign_servers'][db].append(f'CREATE USER MAPPING FOR PUBLIC SERVER {fs} WITH ({with_clause})')
+                    prev = graph.add('foreign_servers', db, f'CREATE USER MAPPING FOR PUBLIC SERVER {fs} WITH ({with_clause})', after=(prev,), artifact=artifact)
+
+                # the foreign tables using the server wait for all of the above
+                #
+                if prev is not None:
+                    graph.add_provider(('server', db, fs), prev)
 
 
     if 'foreign_tables' in plan:
-        if 'foreign_tables' not in ddls:
-            ddls['foreign_tables'] = {}
-        
         for db in plan['foreign_tables']:
-            if db not in ddls['foreign_tables']:
-                ddls['foreign_tables'][db] = [f'\\db {db}']
+            graph.open('foreign_tables', db)
 
             for tab in plan['foreign_tables'][db]:
+                artifact = ('foreign_tables', db, tab)
+                prev = None
                 ddl = plan['foreign_tables'][db][tab]['ddl_cmd']
                 
                 # make sure the ddl uses the correct table name and server
@@ -810,7 +958,7 @@ def generate_ddl(plan: dict) -> list[str]:
 
                 if plan['foreign_tables'][db][tab]['state'] == RESOURCE_STATES.EXISTS:
                     if plan['foreign_tables'][db][tab]['if_exists'] == RESOURCE_IF_EXISTS_ACTIONS.SKIP:
-                        ddls['foreign_tables'][db].append(f'-- {COLORS.WARNING}Table "{tab}" exists but "if_exists" flag set to "skip". Skipping.{COLORS.END}')
+                        graph.note('foreign_tables', db, f'{COLORS.WARNING}Table "{tab}" exists but "if_exists" flag set to "skip". Skipping.{COLORS.END}', artifact=artifact)
                         continue
                     else:
                         # even if the plan is to replace a table, make a
@@ -818,15 +966,17 @@ def generate_ddl(plan: dict) -> list[str]:
                         # successful. we'll drop it later.
                         #
                         new_tab = tab + new_resource_postfix
-                        ddls['foreign_tables'][db].append(f'ALTER FOREIGN TABLE {tab} RENAME TO {new_tab}')
+                        prev = graph.add('foreign_tables', db, f'ALTER FOREIGN TABLE {tab} RENAME TO {new_tab}', artifact=artifact)
 
-                ddls['foreign_tables'][db].append(ddl)
+                prev = graph.add('foreign_tables', db, ddl, after=(prev,),
+                                 needs=(('server', db, plan['foreign_tables'][db][tab]['server']),),
+                                 provides=('table', db, tab), artifact=artifact)
 
                 # drop the old table if it exists and the plan is to replace it
                 #
                 if plan['foreign_tables'][db][tab]['state'] == RESOURCE_STATES.EXISTS and \
                    plan['foreign_tables'][db][tab]['if_exists'] == RESOURCE_IF_EXISTS_ACTIONS.REPLACE:
-                    ddls['foreign_tables'][db].append(f'DROP FOREIGN TABLE {new_tab}')
+                    graph.add('foreign_tables', db, f'DROP FOREIGN TABLE {new_tab}', after=(prev,), artifact=artifact)
 
 
     # none of these backslash commands are supported by the python client (and
@@ -835,122 +985,150 @@ def generate_ddl(plan: dict) -> list[str]:
     # python equivalents to use. There are no DDL equivalents for these, either.
     #
     if 'dashboards' in plan:
-        if 'dashboards' not in ddls:
-            ddls['dashboards'] = {}
-        
         for db in plan['dashboards']:
-            if db not in ddls['dashboards']: 
-                ddls['dashboards'][db] = [f'\\db {db}']
+            graph.open('dashboards', db)
 
             for dash_name in plan['dashboards'][db]:
+                artifact = ('dashboards', db, dash_name)
                 escaped_dn = dash_name.replace("'", "\\'")
+                prev = None
+
+                needs = tuple(('table', t_db, t) for t_db, t in plan['dashboards'][db][dash_name].get('table_deps', ())) + \
+                        tuple(('database', t_db) for t_db, _ in plan['dashboards'][db][dash_name].get('table_deps', ()))
 
                 if plan['dashboards'][db][dash_name]['state'] == RESOURCE_STATES.UP_TO_DATE:
-                    ddls['dashboards'][db].append(f'-- {COLORS.GREEN}Dashboard "{dash_name}" exists and is up to date. Skipping.{COLORS.END}')
+                    graph.note('dashboards', db, f'{COLORS.GREEN}Dashboard "{dash_name}" exists and is up to date. Skipping.{COLORS.END}', artifact=artifact)
                     continue
 
                 elif plan['dashboards'][db][dash_name]['state'] == RESOURCE_STATES.NEEDS_UPDATE:
 
-                    new_dn = escaped_dn + new_resource_postfix
-
-                    if plan['dashboards'][db][dash_name]['if_exists'] == RESOURCE_IF_EXISTS_ACTIONS.REPLACE:
-                        ddls['dashboards'][db].append(f'\\drop_dashboard "{escaped_dn}"')
-                    elif plan['dashboards'][db][dash_name]['if_exists'] == RESOURCE_IF_EXISTS_ACTIONS.RENAME:
-                        ddls['dashboards'][db].append(f'\\rename_dashboard "{escaped_dn}" "{new_dn}"')
-                    else:
-                        ddls['dashboards'][db].append(f'-- {COLORS.WARNING}Dashboard "{dash_name}" exists but "if_exists" flag set to "skip". Skipping.{COLORS.END}')
+                    if plan['dashboards'][db][dash_name]['if_exists'] == RESOURCE_IF_EXISTS_ACTIONS.SKIP:
+                        graph.note('dashboards', db, f'{COLORS.WARNING}Dashboard "{dash_name}" exists but "if_exists" flag set to "skip". Skipping.{COLORS.END}', artifact=artifact)
                         continue
-                
-                if plan['dashboards'][db][dash_name]['state'] == RESOURCE_STATES.NEEDS_CREATION or \
-                   plan['dashboards'][db][dash_name]['if_exists'] != RESOURCE_IF_EXISTS_ACTIONS.SKIP:
-                    ddls['dashboards'][db].append(f'\\import_dashboard "{escaped_dn}" "{plan["dashboards"][db][dash_name]["dashboard_uri"]}"')
 
+                    # the dashboard is replaced in place, keeping its id and
+                    # the grants on it. "rename" keeps a copy of the old
+                    # version first.
+                    #
+                    if plan['dashboards'][db][dash_name]['if_exists'] == RESOURCE_IF_EXISTS_ACTIONS.RENAME:
+                        new_dn = escaped_dn + new_resource_postfix
+                        prev = graph.add('dashboards', db, f'\\duplicate_dashboard "{escaped_dn}" "{new_dn}"', artifact=artifact)
+
+                    graph.add('dashboards', db, f'\\replace_dashboard "{escaped_dn}" "{plan["dashboards"][db][dash_name]["dashboard_uri"]}"', after=(prev,),
+                              needs=needs, provides=('dashboard', db, dash_name), artifact=artifact)
+
+                else:
+                    graph.add('dashboards', db, f'\\import_dashboard "{escaped_dn}" "{plan["dashboards"][db][dash_name]["dashboard_uri"]}"',
+                              needs=needs, provides=('dashboard', db, dash_name), artifact=artifact)
+
+
+    # roles that are dropped and recreated. their policies go with them.
+    #
+    recreated_roles = set()
 
     if 'roles' in plan:
-        if 'roles' not in ddls:
-            ddls['roles'] = { def_db: [f'\\db {def_db}'] }
+        graph.open('roles', def_db)
         
         for r in plan['roles']:
+            artifact = ('roles', r)
+            prev = None
+
             if plan['roles'][r]['state'] == RESOURCE_STATES.EXISTS:
-                ddls['roles'][def_db].append(f'-- {COLORS.WARNING}Role "{r}" exists. Recreating.{COLORS.END}')
-                ddls['roles'][def_db].append(f'DROP ROLE {r}')
+                graph.note('roles', def_db, f'{COLORS.WARNING}Role "{r}" exists. Recreating.{COLORS.END}', artifact=artifact)
+                prev = graph.add('roles', def_db, f'DROP ROLE {r}', artifact=artifact)
+                recreated_roles.add(r)
 
-            ddls['roles'][def_db].append(f'CREATE ROLE {r}')
+            create = graph.add('roles', def_db, f'CREATE ROLE {r}', after=(prev,), provides=('role', r), artifact=artifact)
 
             for db in plan['roles'][r]['databases']:
-                ddls['roles'][def_db].append(f'GRANT {", ".join(plan["roles"][r]["databases"][db])} ON DATABASE {db} TO {r}')
+                graph.add('roles', def_db, f'GRANT {", ".join(plan["roles"][r]["databases"][db])} ON DATABASE {db} TO {r}',
+                          after=(create,), needs=(('database', db),), artifact=artifact)
 
             for db in plan['roles'][r]['dashboards']:
-                if db not in ddls['roles']: 
-                    ddls['roles'][db] = [f'\\db {db}']
+                graph.open('roles', db)
 
                 for dash_id in plan['roles'][r]['dashboards'][db]:
-                    ddls['roles'][db].append(f'GRANT {", ".join(plan["roles"][r]["dashboards"][db][dash_id])} ON DASHBOARD {dash_id} TO {r}')
+                    # dashboards still to be imported are referred to by name
+                    #
+                    needs = ()
+                    if isinstance(dash_id, str) and dash_id.startswith(f"'{DASH_ID_TBD_PREFIX}"):
+                        needs = (('dashboard', db, dash_id[len(DASH_ID_TBD_PREFIX) + 1:-1].replace("\\'", "'")),)
 
+                    graph.add('roles', db, f'GRANT {", ".join(plan["roles"][r]["dashboards"][db][dash_id])} ON DASHBOARD {dash_id} TO {r}',
+                              after=(create,), needs=needs, artifact=artifact)
 
-    if 'policies' in plan:
-        ddls['policies'] = {}
 
+    if 'policies' in plan:
         for db in plan['policies']:
-            if db not in ddls['policies']:
-                ddls['policies'][db] = [ f'\\db {db}' ]
+            graph.open('policies', db)
 
             for tab in plan['policies'][db]:
                 for col in plan['policies'][db][tab]:
                     for ur in plan['policies'][db][tab][col]:
+                        artifact = ('policies', db, tab, col, ur)
+                        prev = None
+
+                        needs = (('table', db, tab), ('role', ur), ('user', ur))
 
                         # drop the policy if it exists, but only if the role or user don't already
-                        # have a DROP DDL (the policy is dropped when the role or user is dropped)
+                        # have a DROP DDL (the policy is dropped when the role or user is dropped).
+                        # it waits for the table too, in case the table is being replaced.
                         #
                         if plan['policies'][db][tab][col][ur]['state'] == RESOURCE_STATES.EXISTS and \
-                           f'DROP ROLE {ur}' not in ddls['roles'][def_db]:
-                            ddls['policies'][db].append(f'DROP POLICY ON COLUMN {tab}.{col} FROM {ur}')
+                           ur not in recreated_roles:
+                            prev = graph.add('policies', db, f'DROP POLICY ON COLUMN {tab}.{col} FROM {ur}', needs=needs, artifact=artifact)
                         elif plan['policies'][db][tab][col][ur]['state'] == RESOURCE_STATES.EXISTS:
-                            ddls['policies'][db].append(f'-- {COLORS.WARNING}Policy on column "{tab}.{col}" for "{ur}" is being recreated because role "{ur}" was recreated.{COLORS.END}')
+                            graph.note('policies', db, f'{COLORS.WARNING}Policy on column "{tab}.{col}" for "{ur}" is being recreated because role "{ur}" was recreated.{COLORS.END}', artifact=artifact)
                         
-                        ddls['policies'][db].append(f'CREATE POLICY ON COLUMN {tab}.{col} TO "{ur}" VALUES ({plan["policies"][db][tab][col][ur]["values"]})')
+                        graph.add('policies', db, f'CREATE POLICY ON COLUMN {tab}.{col} TO "{ur}" VALUES ({plan["policies"][db][tab][col][ur]["values"]})',
+                                  after=(prev,), needs=needs, artifact=artifact)
 
 
     if 'users' in plan:
-        if 'users' not in ddls:
-            ddls['users'] = { def_db: [f'\\db {def_db}'] }
+        graph.open('users', def_db)
         
         for u in plan['users']:
+            artifact = ('users', u)
             udict = plan['users'][u]
+            prev = None
+
             if udict['state'] == RESOURCE_STATES.NEEDS_CREATION:
-                password = udict['password'] if udict['password'] != DEFAULT_USER_INIT_PASSWORD else \
-                                ''.join(random.choice(string.ascii_letters + string.digits + '!#$^*-_') for _ in range(16))
-                ddls['users'][def_db].append(f"CREATE USER \"{u}\" (password='{password}', is_super='{udict['is_super']}', can_login='{udict['can_login']}', default_db='{udict['default_db']}')")
+                password = udict['password']
+                if password == DEFAULT_USER_INIT_PASSWORD:
+                    password = generate_password()
+
+                    # random passwords are never written out (e.g. to the
+                    # apply journal.) a resumed apply picks a new one.
+                    #
+                    graph.secrets[password] = DEFAULT_USER_INIT_PASSWORD
+
+                prev = graph.add('users', def_db, f"CREATE USER \"{u}\" (password='{password}', is_super='{udict['is_super']}', can_login='{udict['can_login']}', default_db='{udict['default_db']}')",
+                                 needs=(('database', udict['default_db']),), provides=('user', u), artifact=artifact)
 
             elif udict['state'] == RESOURCE_STATES.EXISTS:
-                ddls['users'][def_db].append(f"ALTER USER \"{u}\" (is_super='{udict['is_super']}', can_login='{udict['can_login']}', default_db='{udict['default_db']}')")
+                prev = graph.add('users', def_db, f"ALTER USER \"{u}\" (is_super='{udict['is_super']}', can_login='{udict['can_login']}', default_db='{udict['default_db']}')",
+                                 needs=(('database', udict['default_db']),), provides=('user', u), artifact=artifact)
                 
 
             if 'roles' in plan['users'][u]:
                 for r in plan['users'][u]['roles']:
-                    ddls['users'][def_db].append(f'GRANT {r} TO "{u}"')
+                    graph.add('users', def_db, f'GRANT {r} TO "{u}"', after=(prev,), needs=(('role', r),), artifact=artifact)
         
 
-    # the order of dictionary keys is not deterministic, so we need to make 
-    # sure DDL's are executed in the correct order
+    # the artifacts left out of an incremental plan, and those a targeted
+    # plan only needs to exist.
     #
-    retval = []
-    for section in ('configs', 'databases', 'static_tables', 'foreign_servers', 'foreign_tables', 'dashboards', 'roles', 'policies', 'users'):
-        if section in ddls:
-            retval.append(f'-- ({section}) --')
+    skipped = [ (a, 'unchanged since the last apply') for a in plan.get('unchanged', []) ] + \
+              [ (a, 'exists and is needed by a target') for a in plan.get('required', []) ]
 
-            # make sure the default database DDL's are executed first
-            #
-            if def_db in ddls[section]:
-                retval = retval + ddls[section][def_db]
+    for artifact, reason in skipped:
+        if artifact[0] in ('static_tables', 'foreign_servers', 'foreign_tables', 'dashboards', 'policies'):
+            db, name = artifact[1], '.'.join(artifact[2:])
+        else:
+            db, name = def_db, artifact[1]
 
-            # process the rest of the databases
-            #
-            if len(section) > (1 if def_db in ddls[section] else 0):
-                for db in ddls[section]:
-                    if db == def_db:
-                        continue
+        graph.note(artifact[0], db, f'{COLORS.GREEN}"{name}" {reason}. Skipping.{COLORS.END}', artifact=artifact)
 
-                    retval = retval + ddls[section][db]
+    graph.resolve()
 
-    return retval
+    return graph
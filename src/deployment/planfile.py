@@ -0,0 +1,134 @@
+import json
+import os
+
+from datetime import datetime
+
+from .catalog import CatalogSnapshot
+from .constants import *
+from .graph import OperationGraph
+from .journal import template_graph, untemplate_graph
+from .state import filter_config, hash_config
+from .util import SessionPool, get_file_fingerprint
+
+
+PLAN_FILE_VERSION = 1
+
+
+def save_plan(path: str, plan: dict, graph: OperationGraph, server: str, env_vars: list[str], targeted: bool = False) -> None:
+    """
+    Writes the plan to a file that "apply --plan-file" can apply without
+    planning again: the DDL (secrets templated out, as in the journal), and
+    what it was planned from, to tell whether it's gone stale since. That's
+    the configuration hashes of the artifacts, a fingerprint of the server
+    catalog and fingerprints of the dashboard files to be imported.
+    """
+
+    graph_dict, env_vars = template_graph(graph, env_vars)
+
+    # what the state needs to record the applied artifacts (see State.update.)
+    #
+    artifacts = []
+    files = {}
+    for a in plan['config_hashes']:
+        node = plan
+        for k in a:
+            node = node.get(k) if isinstance(node, dict) else None
+
+        if not isinstance(node, dict):
+            continue
+
+        entry = { k: node[k] for k in ('fingerprint', 'ddl_uri') if k in node }
+        if 'source_uri' in node.get('import', {}):
+            entry['import'] = { 'source_uri': node['import']['source_uri'] }
+
+        artifacts.append([ list(a), entry ])
+
+        if a[0] == 'dashboards' and node.get('state') != RESOURCE_STATES.UP_TO_DATE:
+            files[node['dashboard_uri']] = node.get('fingerprint') or get_file_fingerprint(node['dashboard_uri'])
+
+    d = {
+        'version': PLAN_FILE_VERSION,
+        'created': datetime.now().isoformat(),
+        'server': server,
+        'default_database': plan['default_database'],
+        'catalog_fingerprint': plan['catalog_fingerprint'],
+        'targeted': targeted,
+        'config_hashes': [ [ list(a), h ] for a, h in plan['config_hashes'].items() ],
+        'unchanged': [ list(a) for a in plan.get('unchanged', []) ],
+        'required': [ list(a) for a in plan.get('required', []) ],
+        'artifacts': artifacts,
+        'files': files,
+        'env_vars': env_vars,
+        'graph': graph_dict
+    }
+
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        json.dump(d, f)
+
+
+def load_plan(path: str, conf: dict, pool: SessionPool) -> tuple[dict, OperationGraph]:
+    """
+    Reads a plan written by save_plan(), returning the plan (as much of it as
+    the state needs) and the graph to apply. Raises a RuntimeError if the plan
+    is stale: the artifacts file, the server catalog or a dashboard file
+    changed since it was made.
+    """
+
+    if not os.path.isfile(path):
+        raise RuntimeError(f'{COLORS.FAIL}No plan file found at "{path}".{COLORS.END}')
+
+    with open(path, 'r') as f:
+        try:
+            d = json.load(f)
+        except json.JSONDecodeError as e:
+            raise RuntimeError(f'{COLORS.FAIL}"{path}" is not a plan file: {e}{COLORS.END}')
+
+    if d.get('version') != PLAN_FILE_VERSION:
+        raise RuntimeError(f'{COLORS.FAIL}"{path}" is not a plan file (or was written by another version.){COLORS.END}')
+
+    err_msg = ''
+
+    if d['server'] != pool.server:
+        err_msg += f'    The plan was made for server "{d["server"]}", not "{pool.server}".\n'
+
+    config_hashes = { tuple(a): h for a, h in d['config_hashes'] }
+    hashes = hash_config(conf)
+
+    for a, h in config_hashes.items():
+        if hashes.get(a) != h:
+            err_msg += f'    "{".".join(a)}" changed in the artifacts file.\n'
+
+    if not d['targeted']:
+        for a in hashes:
+            if a not in config_hashes:
+                err_msg += f'    "{".".join(a)}" was added to the artifacts file.\n'
+
+    # the snapshot is taken of what was planned, as it was when planning
+    # (including what a targeted plan found on the server already.)
+    #
+    unchanged = [ tuple(a) for a in d['unchanged'] ]
+    required = [ tuple(a) for a in d.get('required', []) ]
+    planned = filter_config(conf, [ a for a in list(config_hashes) + required if a in hashes and a not in unchanged ])
+
+    if CatalogSnapshot(pool, planned).fingerprint() != d['catalog_fingerprint']:
+        err_msg += f'    The databases, tables, columns, servers, policies, dashboards, roles or users on the server changed.\n'
+
+    for uri, fp in d['files'].items():
+        if get_file_fingerprint(uri) != fp:
+            err_msg += f'    Dashboard file "{uri}" changed.\n'
+
+    if len(err_msg) != 0:
+        raise RuntimeError(f'{COLORS.FAIL}The plan in "{path}" (made {d["created"]}) is stale:\n{err_msg}Plan again.{COLORS.END}')
+
+    plan = { 'default_database': d['default_database'], 'catalog_fingerprint': d['catalog_fingerprint'],
+             'config_hashes': config_hashes, 'unchanged': unchanged, 'required': required }
+
+    for a, entry in d['artifacts']:
+        node = plan
+        for k in a[:-1]:
+            node = node.setdefault(k, {})
+
+        node[a[-1]] = entry
+
+    return plan, untemplate_graph(d['graph'], d['env_vars'])
@@ -0,0 +1,223 @@
+import functools
+import json
+import os
+import threading
+import time
+
+
+class Span:
+    """A timed piece of work: a phase of the run, a planner, an artifact, a DDL statement, a Thrift call or a file access."""
+
+    __slots__ = ('kind', 'name', 'start', 'duration', 'thread', 'db', 'artifact')
+
+    def __init__(self, kind: str, name: str, db: str = None, artifact: tuple = None):
+        self.kind = kind
+        self.name = name
+        self.db = db
+        self.artifact = artifact
+        self.start: float = None
+        self.duration: float = None
+        self.thread: int = None
+
+    def __enter__(self) -> 'Span':
+        self.start = time.perf_counter()
+        self.thread = threading.get_ident()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.duration = time.perf_counter() - self.start
+        if _profiler is not None:
+            _profiler.add(self)
+
+
+class _NoSpan:
+    """Stands in for a span when profiling is off, so that it costs next to nothing."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+_NO_SPAN = _NoSpan()
+
+
+class Profiler:
+    """
+    Collects the spans of a run. A report adds them up per phase, per planner
+    section, per Thrift method, per file access function and per artifact.
+    Spans overlap when the work is concurrent, so the totals can add up to
+    more than the wall time.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans: list[Span] = []
+        self.thread_names: dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def add(self, span: Span) -> None:
+        with self._lock:
+            self.spans.append(span)
+            if span.thread not in self.thread_names:
+                self.thread_names[span.thread] = threading.current_thread().name
+
+    def report(self, top_n: int = 10) -> dict:
+        with self._lock:
+            spans = list(self.spans)
+
+        def totals(kind: str, key=lambda s: s.name) -> list[dict]:
+            retval = {}
+            for s in spans:
+                if s.kind == kind:
+                    t = retval.setdefault(key(s), { 'name': key(s), 'count': 0, 'time': 0.0 })
+                    t['count'] += 1
+                    t['time'] += s.duration
+
+            return list(retval.values())
+
+        by_time = lambda ts: sorted(ts, key=lambda t: t['time'], reverse=True)
+
+        # an artifact's time is the time spent planning it plus the time spent
+        # applying its statements.
+        #
+        artifacts = {}
+        for s in spans:
+            if s.artifact is not None and s.kind in ('artifact', 'ddl'):
+                name = '.'.join(s.artifact)
+                a = artifacts.setdefault(name, { 'name': name, 'count': 0, 'time': 0.0, 'plan_time': 0.0, 'apply_time': 0.0 })
+                a['count'] += 1
+                a['time'] += s.duration
+                a['plan_time' if s.kind == 'artifact' else 'apply_time'] += s.duration
+
+        return {
+            'wall_time': time.perf_counter() - self.start,
+            'phases': totals('phase'),
+            'sections': by_time(totals('section')),
+            'rpc': by_time(totals('rpc')),
+            'io': by_time(totals('io')),
+            'queries': by_time(totals('query')),
+            'artifacts': by_time(artifacts.values())[:top_n]
+        }
+
+    def trace_events(self) -> list[dict]:
+        """
+        Returns the spans as Chrome trace events, for a timeline of the run in
+        Perfetto or chrome://tracing: one row per thread, with each span tagged
+        by its database and artifact.
+        """
+
+        with self._lock:
+            spans = list(self.spans)
+            thread_names = dict(self.thread_names)
+
+        pid = os.getpid()
+        tids = { t: i for i, t in enumerate(thread_names) }
+
+        events = [ { 'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': { 'name': 'heavyai deploy' } } ]
+        events += [ { 'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tids[t], 'args': { 'name': n } }
+                    for t, n in thread_names.items() ]
+
+        for s in spans:
+            event = { 'name': s.name, 'cat': s.kind, 'ph': 'X', 'pid': pid, 'tid': tids[s.thread],
+                      'ts': round((s.start - self.start) * 1e6), 'dur': round(s.duration * 1e6), 'args': {} }
+            if s.db is not None:
+                event['args']['db'] = s.db
+            if s.artifact is not None:
+                event['args']['artifact'] = '.'.join(s.artifact)
+
+            events.append(event)
+
+        return events
+
+    def write_trace(self, path: str) -> None:
+        with open(path, 'w') as f:
+            json.dump({ 'traceEvents': self.trace_events(), 'displayTimeUnit': 'ms' }, f)
+
+
+def format_report(report: dict) -> list[str]:
+    """Returns the lines of a profile report (see Profiler.report) for printing."""
+
+    lines = [ f'Profile (wall time {report["wall_time"]:.2f}s):' ]
+
+    for key, title in (('phases', 'Phases'), ('sections', 'Planned sections'), ('rpc', 'Thrift calls'),
+                       ('io', 'File and S3/HTTP access'), ('queries', 'Catalog queries'), ('artifacts', 'Slowest artifacts')):
+        if len(report[key]) == 0:
+            continue
+
+        lines.append(f'  {title}:')
+        width = max(len(t['name']) for t in report[key])
+
+        for t in report[key]:
+            line = f'    {t["name"]:<{width}}  {t["count"]:6} calls  {t["time"]:9.3f}s'
+            if key == 'artifacts':
+                line = f'    {t["name"]:<{width}}  plan {t["plan_time"]:9.3f}s  apply {t["apply_time"]:9.3f}s'
+
+            lines.append(line)
+
+    return lines
+
+
+_profiler: Profiler = None
+
+
+def enable() -> Profiler:
+    """Starts profiling, returning the profiler that collects the spans."""
+
+    global _profiler
+    _profiler = Profiler()
+    return _profiler
+
+
+def disable() -> None:
+    global _profiler
+    _profiler = None
+
+
+def is_enabled() -> bool:
+    return _profiler is not None
+
+
+def span(kind: str, name: str, db: str = None, artifact: tuple = None):
+    """Returns a context manager timing the work in its block, when profiling is on."""
+
+    if _profiler is None:
+        return _NO_SPAN
+
+    return Span(kind, name, db, artifact)
+
+
+def profiled(kind: str):
+    """Decorates a function so each call is timed as a span, when profiling is on."""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _profiler is None:
+                return fn(*args, **kwargs)
+
+            with Span(kind, fn.__name__):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class ProfiledClient:
+    """Wraps a Thrift client so that every call to the server is timed, when profiling is on."""
+
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._client, name)
+        if not callable(attr) or name.startswith('_'):
+            return attr
+
+        def call(*args, **kwargs):
+            with span('rpc', name):
+                return attr(*args, **kwargs)
+
+        return call
@@ -0,0 +1,305 @@
+import hashlib
+import json
+import os
+
+from concurrent.futures import Executor
+from datetime import datetime
+
+from .constants import *
+from .graph import OperationGraph
+from .util import SessionPool, get_file_fingerprint
+
+
+# how deep the artifacts are in each section of the artifacts file, e.g. the
+# static tables are under their database, the policies under their database,
+# table, column and user or role.
+#
+ARTIFACT_DEPTHS = {
+    'databases': 1,
+    'static_tables': 2,
+    'foreign_servers': 2,
+    'foreign_tables': 2,
+    'dashboards': 2,
+    'roles': 1,
+    'policies': 4,
+    'users': 1
+}
+
+# keys left out of the configuration hashes, which are written to the state
+# and plan files. passwords are only used to create a user, so a changed one
+# doesn't make the user change.
+#
+UNHASHED_KEYS = ('password',)
+
+
+def hash_config(conf: dict) -> dict[tuple, str]:
+    """
+    Hashes the configuration of every artifact in the (validated) artifacts
+    file, returning a dict of the hashes, keyed by artifact, e.g.
+    ('static_tables', db, name). Secrets (see UNHASHED_KEYS) aren't hashed.
+    """
+
+    hashes = {}
+
+    def strip(node):
+        if isinstance(node, dict):
+            return { k: strip(v) for k, v in node.items() if k not in UNHASHED_KEYS }
+        if isinstance(node, list):
+            return [ strip(v) for v in node ]
+
+        return node
+
+    def walk(key: tuple, node, depth: int) -> None:
+        if depth == 0:
+            hashes[key] = hashlib.md5(json.dumps(strip(node), sort_keys=True, default=str).encode()).hexdigest()
+            return
+
+        for k in node:
+            if k != '_comment':
+                walk(key + (k,), node[k] if isinstance(node, dict) else None, depth - 1)
+
+    for section, depth in ARTIFACT_DEPTHS.items():
+        if section in conf:
+            walk((section,), conf[section], depth)
+
+    return hashes
+
+
+def get_changed_artifacts(conf: dict, hashes: dict[tuple, str], state: 'State', executor: Executor = None) -> set[tuple]:
+    """
+    Returns the artifacts that changed since they were last applied, along with
+    everything that depends on them: those with a different configuration hash
+    or file fingerprint, or missing from the state.
+    """
+
+    def is_changed(artifact: tuple) -> bool:
+        applied = state.get(artifact)
+        if applied is None or applied.get('config_hash') != hashes[artifact]:
+            return True
+
+        if artifact[0] == 'dashboards':
+            _, db, dash = artifact
+            return applied.get('fingerprint') != _get_fingerprint(conf['dashboards'][db][dash]['dashboard_uri'])
+
+        return any(_get_fingerprint(u) != fp for u, fp in applied.get('fingerprints', {}).items())
+
+    artifacts = list(hashes)
+    changed = executor.map(is_changed, artifacts) if executor is not None else map(is_changed, artifacts)
+    changed = { a for a, c in zip(artifacts, changed) if c }
+
+    # a replaced table loses its policies, a recreated role its grants, and so
+    # on, so whatever depends on a changed artifact is planned again too.
+    #
+    todo = list(changed)
+    while todo:
+        for a in _get_dependents(conf, hashes, todo.pop()):
+            if a not in changed:
+                changed.add(a)
+                todo.append(a)
+
+    return changed
+
+
+def _get_dependents(conf: dict, hashes: dict[tuple, str], artifact: tuple) -> set[tuple]:
+    """Returns the artifacts that have to be applied again when the artifact is."""
+
+    section = artifact[0]
+
+    if section == 'databases':
+        db = artifact[1]
+        return { a for a in hashes if (a[0] in ('static_tables', 'foreign_servers', 'foreign_tables', 'dashboards', 'policies') and a[1] == db) or \
+                                      (a[0] == 'users' and conf['users'][a[1]].get('default_db') == db) or \
+                                      (a[0] == 'roles' and (db in conf['roles'][a[1]].get('databases', {}) or db in conf['roles'][a[1]].get('dashboards', {}))) }
+
+    elif section in ('static_tables', 'foreign_tables'):
+        _, db, tab = artifact
+        return { a for a in hashes if a[0] == 'policies' and a[1:3] == (db, tab) }
+
+    elif section == 'foreign_servers':
+        _, db, fs = artifact
+        return { a for a in hashes if a[0] == 'foreign_tables' and a[1] == db and conf['foreign_tables'][db][a[2]].get('server') == fs }
+
+    elif section == 'dashboards':
+        _, db, dash = artifact
+        return { a for a in hashes if a[0] == 'roles' and dash in conf['roles'][a[1]].get('dashboards', {}).get(db, {}) }
+
+    elif section in ('roles', 'users'):
+        ur = artifact[1]
+        return { a for a in hashes if (a[0] == 'policies' and a[4] == ur) or \
+                                      (section == 'roles' and a[0] == 'users' and ur in conf['users'][a[1]].get('roles', [])) }
+
+    return set()
+
+
+def filter_config(conf: dict, artifacts: list[tuple]) -> dict:
+    """
+    Returns a copy of the (validated) artifacts file with only the given
+    artifacts, in the order given.
+    """
+
+    filtered = { k: v for k, v in conf.items() if k not in ARTIFACT_DEPTHS }
+
+    for a in artifacts:
+        if a[0] == 'databases':
+            filtered.setdefault('databases', []).append(a[1])
+            continue
+
+        src = conf
+        dst = filtered
+        for k in a[:-1]:
+            src = src[k]
+            dst = dst.setdefault(k, {})
+
+        dst[a[-1]] = src[a[-1]]
+
+    return filtered
+
+
+class State:
+    """
+    What was last applied to a server, written after every apply: per artifact,
+    the hash of its configuration, fingerprints (ETags or hashes) of the files
+    it was created from, and for dashboards, the server-side id and update time
+    and the fingerprint of the view state (see fingerprint_state.)
+
+    Planning with the state can tell that a dashboard is unchanged from the
+    fingerprints alone, without downloading and comparing it. The state is
+    only a hint: anything that doesn't match is planned as if there were no
+    state, so a stale or deleted state file costs time, not correctness.
+    """
+
+    def __init__(self, server: str, artifacts: dict = None):
+        self.server = server
+        self.artifacts = artifacts if artifacts is not None else {}
+
+    @staticmethod
+    def load(path: str, server: str) -> 'State':
+        """Reads the state for the server from the file, or returns an empty state if there isn't one."""
+
+        if not os.path.isfile(path):
+            return State(server)
+
+        with open(path, 'r') as f:
+            d = json.load(f)
+
+        # a state file kept for another server is ignored (and replaced.)
+        #
+        if d.get('server') != server:
+            return State(server)
+
+        return State(server, d.get('artifacts', {}))
+
+    def save(self, path: str) -> None:
+        """Writes the state to the file, replacing it in one step so it's never left half written."""
+
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({ 'server': self.server, 'updated': datetime.now().isoformat(), 'artifacts': self.artifacts }, f, indent=2)
+
+        os.replace(tmp_path, path)
+
+    def get(self, artifact: tuple) -> dict:
+        node = self.artifacts
+        for k in artifact:
+            if not isinstance(node, dict) or k not in node:
+                return None
+
+            node = node[k]
+
+        return node
+
+    def set(self, artifact: tuple, entry: dict) -> None:
+        node = self.artifacts
+        for k in artifact[:-1]:
+            node = node.setdefault(k, {})
+
+        node[artifact[-1]] = entry
+
+    def remove(self, artifact: tuple) -> None:
+        node = self.get(artifact[:-1])
+        if node is not None:
+            node.pop(artifact[-1], None)
+
+    def update(self, plan: dict, graph: OperationGraph, pool: SessionPool) -> None:
+        """
+        Records the artifacts of the plan that are now in place after applying
+        its graph: those with all their operations done (or none to do.) The
+        artifacts that didn't apply are dropped from the state, so they're
+        planned in full next time.
+        """
+
+        artifact_ops = graph.artifact_ops()
+        refreshed = set()
+        unchanged = set(plan.get('unchanged', []))
+
+        for artifact, config_hash in plan.get('config_hashes', {}).items():
+            # an incremental plan leaves out what hasn't changed since the
+            # last apply, so its state is still current.
+            #
+            if artifact in unchanged:
+                continue
+
+            ops = [ op for op in artifact_ops.get(artifact, []) if not op.is_note ]
+
+            if any(op.state != OPERATION_STATES.DONE for op in ops):
+                self.remove(artifact)
+                continue
+
+            artifact_plan = _get_artifact_plan(plan, artifact)
+            if artifact_plan is None:
+                self.remove(artifact)
+                continue
+
+            entry = { 'config_hash': config_hash }
+
+            if artifact[0] == 'dashboards':
+                _, db, dash = artifact
+
+                # the update time only comes with the list of dashboards, so
+                # fetch the list again for the dashboards that were imported.
+                #
+                if len(ops) != 0 and db not in refreshed:
+                    pool.dashboards.refresh(db)
+                    refreshed.add(db)
+
+                dash_id = pool.dashboards.get_id(db, dash)
+                if dash_id == -1 or artifact_plan.get('fingerprint') is None:
+                    self.remove(artifact)
+                    continue
+
+                entry['fingerprint'] = artifact_plan['fingerprint']
+                entry['dashboard_id'] = dash_id
+                entry['update_time'] = pool.dashboards.get_update_time(db, dash_id)
+
+                # the server copy is now the export (imported, or the same
+                # but for volatile fields), so it has the export's fingerprint.
+                #
+                if artifact_plan.get('state_fingerprint') is not None:
+                    entry['state_fingerprint'] = artifact_plan['state_fingerprint']
+                    pool.dashboards.set_fingerprint(db, dash_id, entry['state_fingerprint'])
+
+            else:
+                uris = [ artifact_plan.get('ddl_uri'), artifact_plan.get('import', {}).get('source_uri') ]
+                entry['fingerprints'] = { u: _get_fingerprint(u) for u in uris if u is not None }
+
+            self.set(artifact, entry)
+
+
+def _get_fingerprint(uri: str) -> str:
+    try:
+        return get_file_fingerprint(uri)
+    except Exception:
+        return None
+
+
+def _get_artifact_plan(plan: dict, artifact: tuple):
+    """Returns the plan for an artifact, or None if it isn't in the plan."""
+
+    node = plan
+    for k in artifact:
+        if not isinstance(node, dict) or k not in node:
+            return None
+
+        node = node[k]
+
+    return node
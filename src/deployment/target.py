@@ -0,0 +1,155 @@
+import re
+
+from fnmatch import fnmatchcase
+
+from .constants import *
+from .state import ARTIFACT_DEPTHS, _get_dependents
+from .util import get_dash_table_deps, get_dashboard_export
+
+
+# a part of an artifact address: a quoted name (with \" and \\ escapes), or
+# a name without dots or quotes.
+#
+RE_TARGET_PART = re.compile(r'"((?:[^"\\]|\\.)*)"|([^."]+)')
+
+
+def parse_target(address: str) -> tuple:
+    """
+    Parses an artifact address, e.g. dashboards.heavyai."Flood St Louis" or
+    static_tables.heavyai.*, into a tuple of name patterns. Names with dots or
+    spaces are quoted; any part can be a glob pattern, and trailing parts can
+    be left out to address everything below.
+    """
+
+    parts = []
+    pos = 0
+    while True:
+        m = RE_TARGET_PART.match(address, pos)
+        if m is None:
+            raise RuntimeError(f'{COLORS.FAIL}Invalid target "{address}".{COLORS.END}')
+
+        parts.append(m.group(2) if m.group(2) is not None else re.sub(r'\\(.)', r'\1', m.group(1)))
+
+        pos = m.end()
+        if pos == len(address):
+            break
+        elif address[pos] != '.':
+            raise RuntimeError(f'{COLORS.FAIL}Invalid target "{address}".{COLORS.END}')
+
+        pos += 1
+
+    if parts[0] not in ARTIFACT_DEPTHS:
+        raise RuntimeError(f'{COLORS.FAIL}Invalid target "{address}": Unknown section "{parts[0]}" (one of {", ".join(ARTIFACT_DEPTHS)}).{COLORS.END}')
+
+    if len(parts) > ARTIFACT_DEPTHS[parts[0]] + 1:
+        raise RuntimeError(f'{COLORS.FAIL}Invalid target "{address}": Too many parts for a {parts[0]} address.{COLORS.END}')
+
+    return tuple(parts)
+
+
+def select_targets(conf: dict, artifacts: list[tuple], targets: list[tuple]) -> tuple[set[tuple], set[tuple]]:
+    """
+    Returns the artifacts to apply and the artifacts they need.
+
+    The artifacts to apply are those addressed by the targets, along with what
+    has to be applied again when one of them is dropped and recreated (i.e.
+    the policies and users of a role, or the policies of a replaced table.)
+
+    The artifacts they need are everything they depend on: the tables a
+    dashboard uses, the server of a foreign table, the tables, roles and users
+    of a policy, the roles granted to a user, the dashboards a role is granted
+    on, and the database of each of them. These only have to exist: they're
+    created if they don't, but otherwise left as they are.
+    """
+
+    err_msg = ''
+    selected = set()
+    artifacts = set(artifacts)
+
+    for t in targets:
+        matched = { a for a in artifacts if len(a) >= len(t) and all(fnmatchcase(n, p) for n, p in zip(a, t)) }
+        if len(matched) == 0:
+            err_msg += f'    Target "{".".join(t)}" does not match any artifact.\n'
+
+        selected |= matched
+
+    if len(err_msg) != 0:
+        raise RuntimeError(f'{COLORS.FAIL}Targeting failed:\n{err_msg}{COLORS.END}')
+
+    todo = list(selected)
+    while todo:
+        for a in _get_recreated_dependents(conf, artifacts, todo.pop()):
+            if a not in selected:
+                selected.add(a)
+                todo.append(a)
+
+    required = set()
+    todo = list(selected)
+    while todo:
+        for a in _get_dependencies(conf, todo.pop()):
+            if a in artifacts and a not in selected and a not in required:
+                required.add(a)
+                todo.append(a)
+
+    return selected, required
+
+
+def _get_recreated_dependents(conf: dict, artifacts: set[tuple], artifact: tuple) -> set[tuple]:
+    """
+    Returns the artifacts lost when the artifact is dropped and recreated: an
+    existing role always is, an existing table unless "if_exists" is "skip".
+    """
+
+    section = artifact[0]
+
+    if section == 'roles' or \
+       section in ('static_tables', 'foreign_tables') and conf[section][artifact[1]][artifact[2]].get('if_exists') != RESOURCE_IF_EXISTS_ACTIONS.SKIP:
+        return _get_dependents(conf, artifacts, artifact)
+
+    return set()
+
+
+def _get_dependencies(conf: dict, artifact: tuple) -> set[tuple]:
+    """Returns the artifacts that have to be in place before the artifact can be applied."""
+
+    section = artifact[0]
+    deps = set()
+
+    if section in ('static_tables', 'foreign_servers', 'foreign_tables', 'dashboards', 'policies'):
+        deps.add(('databases', artifact[1]))
+
+    if section == 'foreign_tables':
+        _, db, tab = artifact
+        deps.add(('foreign_servers', db, conf['foreign_tables'][db][tab]['server']))
+
+    elif section == 'dashboards':
+        _, db, dash = artifact
+
+        try:
+            with get_dashboard_export(conf['dashboards'][db][dash]['dashboard_uri']) as export:
+                dash_dict = export.parse_dependencies()
+            tabs = get_dash_table_deps(dash_dict)
+        except Exception as e:
+            raise RuntimeError(f'{COLORS.FAIL}Unable to find the tables of dashboard "{dash}" in database "{db}": {e}{COLORS.END}')
+
+        for t in tabs:
+            m = re.match(r'(\w+\.)?(\w+)', t)
+            t_db = db if m.group(1) is None else m.group(1)[:-1]
+            deps |= { ('static_tables', t_db, m.group(2)), ('foreign_tables', t_db, m.group(2)) }
+
+    elif section == 'policies':
+        _, db, tab, _, ur = artifact
+        deps |= { ('static_tables', db, tab), ('foreign_tables', db, tab), ('roles', ur), ('users', ur) }
+
+    elif section == 'users':
+        udict = conf['users'][artifact[1]]
+        deps |= { ('roles', r) for r in udict.get('roles', []) }
+        if 'default_db' in udict:
+            deps.add(('databases', udict['default_db']))
+
+    elif section == 'roles':
+        rdict = conf['roles'][artifact[1]]
+        deps |= { ('databases', db) for db in list(rdict.get('databases', {})) + list(rdict.get('dashboards', {})) }
+        deps |= { ('dashboards', db, dash) for db in rdict.get('dashboards', {}) if db != '_comment' for dash in rdict['dashboards'][db] }
+
+    return deps
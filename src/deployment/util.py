@@ -1,20 +1,26 @@
 import base64
-import boto3
 import hashlib
 import json
 import os
+import random
 import re
-import requests
-
-from botocore import UNSIGNED
-from botocore.client import Config
-from botocore.exceptions import ClientError
-from heavyai import Connection
-from icecream import ic
-from string import whitespace as space
+import threading
+
+from concurrent.futures import Future
+from string import ascii_letters, digits, whitespace as space
+from typing import TYPE_CHECKING
 from urllib.parse import urlparse
 
+# boto3, requests and heavyai (which brings in pandas) take seconds to import
+# between them, so they're imported where they're used. validating an
+# artifacts file needs none of them.
+#
+if TYPE_CHECKING:
+    from heavyai import Connection
+
 from .constants import *
+from .dashboard import DashboardExport, fingerprint_state, hash_state, parse_state_dependencies
+from .profile import ProfiledClient, is_enabled as is_profiling, profiled, span
 
 AWS_REGION="us-east-1"
 
@@ -112,6 +118,19 @@ def replace_env_vars(instr: str) -> str:
 
     return retval
 
+
+def get_env_var_names(instr: str) -> list[str]:
+    """Returns the names of the environment variables used in a string (see replace_env_vars.)"""
+
+    return list(dict.fromkeys(m.group(2) for m in re.finditer("(\\$(?:{)?([\\w]+)(?:})?)", instr)))
+
+
+def generate_password(length: int = 16) -> str:
+    """Returns a random password for a new user."""
+
+    return ''.join(random.choice(ascii_letters + digits + '!#$^*-_') for _ in range(length))
+
+
 def obfuscate_secrets(instr: str) -> str:
     """Scan through a string and replace the usage of any secrets with obfuscated strings."""
 
@@ -123,7 +142,7 @@ def obfuscate_secrets(instr: str) -> str:
             break
 
         searchstr = m.group(1)
-        retval = re.sub(searchstr, RE_OBFUSCATE_DB_URL_PW_REPL, retval)
+        retval = re.sub(re.escape(searchstr), RE_OBFUSCATE_DB_URL_PW_REPL, retval)
 
     while True:
         m = re.search(RE_OBFUSCATE_ODBC_PW, retval)
@@ -131,7 +150,7 @@ def obfuscate_secrets(instr: str) -> str:
             break
 
         searchstr = m.group(1)
-        retval = re.sub(searchstr, RE_OBFUSCATE_ODBC_PW_REPL, retval)
+        retval = re.sub(re.escape(searchstr), RE_OBFUSCATE_ODBC_PW_REPL, retval)
 
     while True:
         m = re.search(RE_OBFUSCATE_S3_KEY, retval)
@@ -145,7 +164,7 @@ def obfuscate_secrets(instr: str) -> str:
         # the obfuscated string from being matched again in the same string.
         #
         repl_str = searchstr[:4] + '...' + searchstr[-4:]
-        retval = re.sub(searchstr, repl_str, retval)
+        retval = re.sub(re.escape(searchstr), repl_str, retval)
 
     return retval
 
@@ -157,6 +176,10 @@ def get_anon_s3_client():
     -------
     An anonymous S3 client
     """
+    import boto3
+    from botocore import UNSIGNED
+    from botocore.client import Config
+
     return boto3.client("s3", config=Config(signature_version=UNSIGNED))
 
 
@@ -176,6 +199,8 @@ def get_s3_client():
     -------
     An S3 client
     """
+    import boto3
+    from botocore.exceptions import ClientError
 
     s3_client = boto3.Session().client('s3')
     try:
@@ -213,6 +238,8 @@ def resource_exists(url: str, s3_client = None, chase_redirect: bool = False) ->
     """
 
     if url.startswith(("http:", "https:")):
+        import requests
+
         r = requests.head(url)
         if r.status_code == 302 and chase_redirect:
             url_parsed = urlparse(url)
@@ -237,8 +264,19 @@ def resource_exists(url: str, s3_client = None, chase_redirect: bool = False) ->
         raise RuntimeError(f"URL protocol not supported: {url}")
 
 
-def file_exists(uri: str) -> bool:
-    """Check if a file exists on the filesystem or at the HTTP/s or S3 URI."""
+@profiled('io')
+def file_exists(uri: str, fetch: bool = False) -> bool:
+    """
+    Check if a file exists on the filesystem or at the HTTP/s or S3 URI.
+
+    While file contents are shared (see share_file_contents), a file that was
+    fetched exists, and with "fetch" the file is fetched to find out (for files
+    that are read anyway, like DDL files and dashboards.)
+    """
+
+    f = _shared_content(uri, fetch)
+    if f is not None:
+        return f.exception() is None
 
     if uri.startswith('http://') or uri.startswith('https://') or uri.startswith('s3://'):
         return resource_exists(uri)
@@ -246,6 +284,122 @@ def file_exists(uri: str) -> bool:
         return os.path.isfile(uri)
 
 
+def get_resource_size(url: str, s3_client = None) -> int:
+    """Get the size in bytes of the resource at the URL
+
+    Supports both HTTP/S and S3 URI's. An S3 URI that isn't a single object is
+    treated as a prefix (e.g. a directory of parquet files for COPY ... FROM)
+    and the sizes of all the objects under it are added up.
+
+    Parameters
+    ----------
+    url : str
+        The location of the resource
+
+    s3_client : (An AWS client object created by boto3)
+        The client object to use for access. Defaults to None indicating env
+        vars, .aws files, or (absent these) anonymous creds should be used to
+        create a client
+
+    Returns
+    -------
+    The size of the resource, or None if it can't be determined
+    """
+
+    if url.startswith(("http:", "https:")):
+        import requests
+
+        r = requests.head(url, allow_redirects=True)
+        if r.status_code != 200 or 'Content-Length' not in r.headers:
+            return None
+
+        return int(r.headers['Content-Length'])
+
+    elif url.startswith("s3:"):
+        blist = re.findall('^s3://([a-z0-9.-]{3,63})/', url)
+        klist = re.findall('^s3://[a-z0-9.-]{3,63}/(.*)', url)
+
+        if not blist or not klist:
+            raise RuntimeError(f"Unable to parse S3 bucket URI: {url}")
+
+        from botocore.exceptions import ClientError
+
+        s3 = s3_client if s3_client else get_s3_client()
+        try:
+            return s3.head_object(Bucket=blist[0], Key=klist[0])['ContentLength']
+        except ClientError:
+            pass
+
+        size = 0
+        found = False
+        for page in s3.get_paginator('list_objects_v2').paginate(Bucket=blist[0], Prefix=klist[0]):
+            for obj in page.get('Contents', []):
+                size += obj['Size']
+                found = True
+
+        return size if found else None
+
+    else:
+        raise RuntimeError(f"URL protocol not supported: {url}")
+
+
+@profiled('io')
+def get_file_size(uri: str, s3_client = None) -> int:
+    """Get the size of a file on the filesystem or at the HTTP/s or S3 URI (None if unknown.)"""
+
+    if uri.startswith('http://') or uri.startswith('https://') or uri.startswith('s3://'):
+        return get_resource_size(uri, s3_client)
+    else:
+        return os.path.getsize(uri) if os.path.isfile(uri) else None
+
+
+@profiled('io')
+def get_file_fingerprint(uri: str, s3_client = None) -> str:
+    """
+    Get a cheap fingerprint of the content of a file on the filesystem or at the
+    HTTP/s or S3 URI, without downloading it: the ETag (or Last-Modified date)
+    of a remote file, or the MD5 hash of a local one.
+
+    Returns None if the file doesn't exist or can't be fingerprinted.
+    """
+
+    if uri.startswith(("http:", "https:")):
+        import requests
+
+        r = requests.head(uri, allow_redirects=True)
+        if r.status_code != 200:
+            return None
+
+        if 'ETag' in r.headers:
+            return 'etag:' + r.headers['ETag'].strip('"')
+        elif 'Last-Modified' in r.headers:
+            return f"last-modified:{r.headers['Last-Modified']}:{r.headers.get('Content-Length', '')}"
+
+        return None
+
+    elif uri.startswith("s3:"):
+        blist = re.findall('^s3://([a-z0-9.-]{3,63})/', uri)
+        klist = re.findall('^s3://[a-z0-9.-]{3,63}/(.*)', uri)
+
+        if not blist or not klist:
+            raise RuntimeError(f"Unable to parse S3 bucket URI: {uri}")
+
+        from botocore.exceptions import ClientError
+
+        s3 = s3_client if s3_client else get_s3_client()
+        try:
+            return 'etag:' + s3.head_object(Bucket=blist[0], Key=klist[0])['ETag'].strip('"')
+        except ClientError:
+            return None
+
+    else:
+        if not os.path.isfile(uri):
+            return None
+
+        with open(uri, 'rb') as f:
+            return f'md5:{hashlib.md5(f.read()).hexdigest()}'
+
+
 def get_file_content_from_url(url: str, s3_client = None) -> str:
     """Get the contents of the resource at the URL
 
@@ -267,7 +421,11 @@ def get_file_content_from_url(url: str, s3_client = None) -> str:
     """
 
     if url.startswith(("http:", "https:")):
-        return requests.get(url).text
+        import requests
+
+        r = requests.get(url)
+        r.raise_for_status()
+        return r.text
 
     elif url.startswith("s3:"):
         blist = re.findall('^s3://([a-z0-9.-]{3,63})/', url)
@@ -285,11 +443,237 @@ def get_file_content_from_url(url: str, s3_client = None) -> str:
         raise RuntimeError(f"URL protocol not supported: {url}")
 
 
+class FileCache:
+    """
+    An on-disk cache of the contents of remote files, keyed by URI, each with
+    the ETag (or Last-Modified date) it was downloaded with.
+
+    A cached file is revalidated every time it's fetched, with a conditional
+    GET over HTTP/S or by comparing the ETag from head_object on S3, so it's
+    only downloaded again when it changed. The least recently used files are
+    evicted once the cache grows past max_bytes.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_CACHE_SIZE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _paths(self, url: str) -> tuple[str, str]:
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f'{key}.data'), os.path.join(self.directory, f'{key}.json')
+
+    def _load(self, url: str) -> dict:
+        """Returns the cache entry of the URL (with its "content" bytes), or None."""
+
+        data_path, meta_path = self._paths(url)
+
+        try:
+            with open(meta_path, 'r') as f:
+                entry = json.load(f)
+
+            with open(data_path, 'rb') as f:
+                entry['content'] = f.read()
+        except (OSError, ValueError):
+            return None
+
+        return entry if entry.get('url') == url else None
+
+    def _touch(self, url: str) -> None:
+        # the modification time of the metadata is the last use, for eviction.
+        #
+        try:
+            os.utime(self._paths(url)[1])
+        except OSError:
+            pass
+
+    def _store(self, url: str, content: bytes, validators: dict) -> None:
+        data_path, meta_path = self._paths(url)
+
+        # a cache that can't be written only costs the download next time.
+        #
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+
+            for path, data in ((data_path, content),
+                               (meta_path, json.dumps({ 'url': url, **validators }).encode('utf-8'))):
+                tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+        except OSError:
+            return
+
+        self._evict()
+
+    def _evict(self) -> None:
+        with self._lock:
+            entries = []
+            total = 0
+
+            for name in os.listdir(self.directory):
+                if not name.endswith('.json'):
+                    continue
+
+                meta_path = os.path.join(self.directory, name)
+                data_path = meta_path[:-len('.json')] + '.data'
+                try:
+                    size = os.path.getsize(data_path)
+                    entries.append((os.path.getmtime(meta_path), size, meta_path, data_path))
+                    total += size
+                except OSError:
+                    pass
+
+            for _, size, meta_path, data_path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+
+                for path in (meta_path, data_path):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+                total -= size
+
+    def get(self, url: str, s3_client = None) -> bytes:
+        """Get the contents of the resource at the HTTP/S or S3 URL, from the cache if it hasn't changed."""
+
+        entry = self._load(url)
+
+        if url.startswith(("http:", "https:")):
+            import requests
+
+            headers = {}
+            if entry is not None and entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            elif entry is not None and entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+            r = requests.get(url, headers=headers)
+            if r.status_code == 304 and entry is not None:
+                self._touch(url)
+                return entry['content']
+
+            r.raise_for_status()
+
+            validators = { 'etag': r.headers.get('ETag'), 'last_modified': r.headers.get('Last-Modified') }
+            if validators['etag'] or validators['last_modified']:
+                self._store(url, r.content, validators)
+
+            return r.content
+
+        elif url.startswith("s3:"):
+            blist = re.findall('^s3://([a-z0-9.-]{3,63})/', url)
+            klist = re.findall('^s3://[a-z0-9.-]{3,63}/(.*)', url)
+
+            if not blist or not klist:
+                raise RuntimeError(f"Unable to parse S3 bucket URI: {url}")
+
+            s3 = s3_client if s3_client else get_s3_client()
+
+            if entry is not None and entry.get('etag'):
+                if s3.head_object(Bucket=blist[0], Key=klist[0])['ETag'] == entry['etag']:
+                    self._touch(url)
+                    return entry['content']
+
+            obj = s3.get_object(Bucket=blist[0], Key=klist[0])
+            content = obj['Body'].read()
+            self._store(url, content, { 'etag': obj['ETag'] })
+
+            return content
+
+        else:
+            raise RuntimeError(f"URL protocol not supported: {url}")
+
+
+# the cache remote files are downloaded through (see use_file_cache.)
+#
+_file_cache: FileCache = None
+
+def use_file_cache(cache: FileCache) -> None:
+    """Download remote files through the cache (or directly, given None.)"""
+
+    global _file_cache
+    _file_cache = cache
+
+
+# the contents of files, when they're shared for the run (see
+# share_file_contents.) uri -> future of the contents.
+#
+_shared_contents: dict[str, Future] = None
+_shared_contents_lock = threading.Lock()
+
+def share_file_contents(enable: bool = True) -> None:
+    """
+    Start (or stop) sharing the contents of remote files between callers, so
+    that each file is downloaded once per run, however many times it's planned
+    and applied (and however many deployments use it.) Local files aren't
+    shared: reading them again is cheap, and dashboard exports are memory
+    mapped instead (see get_dashboard_export.)
+    """
+
+    global _shared_contents
+
+    with _shared_contents_lock:
+        _shared_contents = {} if enable else None
+
+
+def _read_file(uri: str) -> bytes:
+    if uri.startswith('http://') or uri.startswith('https://') or uri.startswith('s3://'):
+        return _file_cache.get(uri) if _file_cache is not None else get_file_content_from_url(uri).encode('utf-8')
+    else:
+        if not os.path.isfile(uri):
+            raise RuntimeError(f'File {uri} not found.')
+
+        with open(uri, 'rb') as f:
+            return f.read()
+
+
+def _decode(content: bytes) -> str:
+    # as the file would read in text mode.
+    #
+    return content.decode('utf-8').replace('\r\n', '\n')
+
+
+def _shared_content(uri: str, fetch: bool = True) -> Future:
+    """
+    Returns the future of the shared contents of the remote file, downloading
+    it first if "fetch" and nobody has, or None if the contents aren't shared
+    (or weren't fetched, or the file is local.)
+    """
+
+    if not (uri.startswith('http://') or uri.startswith('https://') or uri.startswith('s3://')):
+        return None
+
+    with _shared_contents_lock:
+        if _shared_contents is None or (not fetch and uri not in _shared_contents):
+            return None
+
+        owner = uri not in _shared_contents
+        f = _shared_contents.setdefault(uri, Future())
+
+    # the first caller reads the file, the others wait for it.
+    #
+    if owner:
+        try:
+            f.set_result(_read_file(uri))
+        except Exception as e:
+            f.set_exception(e)
+
+    return f
+
+
+@profiled('io')
 def get_file_content(uri: str) -> str:
     """Get the contents of a file from the filesystem or at the HTTP/s or S3 URI."""
 
+    f = _shared_content(uri)
+    if f is not None:
+        return _decode(f.result())
+
     if uri.startswith('http://') or uri.startswith('https://') or uri.startswith('s3://'):
-        return get_file_content_from_url(uri)
+        return _decode(_file_cache.get(uri)) if _file_cache is not None else get_file_content_from_url(uri)
     else:
         if not os.path.isfile(uri):
             raise RuntimeError(f'File {uri} not found.')
@@ -298,67 +682,320 @@ def get_file_content(uri: str) -> str:
             return f.read()
 
 
-def is_dash_code_same(con: Connection, db_name: str, dash_id: int, dash_file: str) -> bool:
+@profiled('io')
+def get_dashboard_export(uri: str) -> DashboardExport:
     """
-    Performs a hash comparison of the view states of a dashboard in a database 
-    and a dashboard export file.
+    Get a dashboard export file from the filesystem or at the HTTP/s or S3 URI,
+    without copying its contents: the shared or downloaded bytes of a remote
+    file, or a memory map of a local file.
     """
 
-    # capture the current database from the session info
-    #
-    orig_db = con._client.get_session_info(con._session).database
-    con._client.switch_database(con._session, db_name)
+    f = _shared_content(uri)
+    if f is not None:
+        return DashboardExport(f.result(), uri)
+
+    if uri.startswith('http://') or uri.startswith('https://') or uri.startswith('s3://'):
+        return DashboardExport(_read_file(uri), uri)
+    else:
+        if not os.path.isfile(uri):
+            raise RuntimeError(f'File {uri} not found.')
+
+        return DashboardExport.from_file(uri)
+
+
+def connect(url: str) -> 'Connection':
+    """heavyai.connect(), importing heavyai on first use."""
+
+    from heavyai import connect as heavyai_connect
+    return heavyai_connect(url)
+
+
+class SessionPool:
+    """
+    Hands out one authenticated connection per database, reused for the whole
+    run.
+
+    Every connection is opened against the database it serves, so callers
+    get a database-scoped handle from get() and never have to switch the
+    database of a shared session (and switch it back again).
+
+    Thrift clients can't be shared between threads, so each thread gets its
+    own connection to each database it uses.
+    """
+
+    def __init__(self, url: str):
+        self._url = urlparse(url)
+        self.default_database = self._url.path.lstrip('/')
+
+        self._connections: dict[tuple[int, str], 'Connection'] = {}
+        self._lock = threading.Lock()
+
+        self.dashboards = DashboardIndex(self)
+
+    @property
+    def server(self) -> str:
+        """The host and port of the server, without the credentials."""
+
+        return f'{self._url.hostname}:{self._url.port or DEFAULT_PORT}'
+
+    def get(self, db_name: str = None) -> 'Connection':
+        """Get the connection for a database (default: the database in the connection URL)."""
+
+        db_name = db_name if db_name else self.default_database
+        key = (threading.get_ident(), db_name)
+
+        with self._lock:
+            if key in self._connections:
+                return self._connections[key]
+
+        # connect outside of the lock so other threads aren't held up waiting
+        # on the server. only the calling thread can ask for this key.
+        #
+        with span('rpc', 'connect', db_name):
+            con = connect(self._url._replace(path=f'/{db_name}').geturl())
+
+        if is_profiling():
+            con._client = ProfiledClient(con._client)
+
+        with self._lock:
+            self._connections[key] = con
+
+        return con
+
+    def close(self) -> None:
+        """Closes every connection, carrying on past any that fail (e.g. a session the server already timed out.)"""
+
+        with self._lock:
+            for con in self._connections.values():
+                try:
+                    con.close()
+                except Exception:
+                    pass
+
+            self._connections = {}
+
+
+class DashboardIndex:
+    """
+    A per-database dashboard name -> id index.
+
+    Each database's dashboard list is fetched once, the first time one of its
+    dashboards is looked up. exec_dash_ddl() keeps the index current as it
+    imports, renames and drops dashboards, so resolving a dashboard id never
+    costs another round trip to the server.
+
+    The last update times of the dashboards come with the list, but aren't
+    known for dashboards added since; refresh() fetches the list again. The
+    fingerprint of each dashboard's view state is kept with its update time,
+    so it's computed once per version of the dashboard.
+    """
+
+    def __init__(self, pool: SessionPool):
+        self._pool = pool
+        self._databases: set[str] = None
+        self._index: dict[str, dict[str, int]] = {}
+        self._update_times: dict[tuple[str, int], str] = {} # (db, id) -> update time
+        self._owners: dict[tuple[str, int], str] = {} # (db, id) -> owner
+        self._fingerprints: dict[tuple[str, int], tuple[str, str]] = {} # (db, id) -> (update time, fingerprint)
+        self._fetches: dict[str, Future] = {} # db -> the fetch of its dashboard list in progress
+
+        # guards the dicts, but isn't held during the round trips to the
+        # server, so looking up one database doesn't wait on another's fetch.
+        #
+        self._lock = threading.Lock()
+
+    def _get_database_index(self, db_name: str) -> dict[str, int]:
+        while True:
+            with self._lock:
+                if db_name in self._index:
+                    return self._index[db_name]
+
+                # only one thread fetches a database's list. the others wait
+                # for it.
+                #
+                fetch = self._fetches.get(db_name)
+                if fetch is None:
+                    fetch = self._fetches[db_name] = Future()
+                    break
+
+            # None if the list was refreshed while it was being fetched.
+            #
+            index = fetch.result()
+            if index is not None:
+                return index
+
+        try:
+            dashboards = self._fetch_dashboards(db_name)
+        except Exception as e:
+            with self._lock:
+                if self._fetches.get(db_name) is fetch:
+                    self._fetches.pop(db_name)
+
+            fetch.set_exception(e)
+            raise
+
+        index = None
+        with self._lock:
+            if self._fetches.get(db_name) is fetch:
+                self._fetches.pop(db_name)
+                index = {}
+
+                # a database that doesn't exist isn't kept, so it's looked for
+                # again next time.
+                #
+                if dashboards is not None:
+                    self._index[db_name] = index
+                    for d in dashboards:
+                        index.setdefault(d.dashboard_name, d.dashboard_id)
+                        self._update_times[(db_name, d.dashboard_id)] = d.update_time
+                        self._owners[(db_name, d.dashboard_id)] = d.dashboard_owner
+
+        fetch.set_result(index)
+
+        return index if index is not None else self._get_database_index(db_name)
+
+    def _fetch_dashboards(self, db_name: str) -> list:
+        """Fetches the dashboard list of a database, or returns None if the database doesn't exist."""
+
+        # only go back to the server for the database list if the database
+        # isn't known yet. it may have been created since the last check.
+        #
+        with self._lock:
+            databases = self._databases
+
+        if databases is None or db_name not in databases:
+            con = self._pool.get()
+            databases = { d.db_name for d in con._client.get_databases(con._session) }
+
+            with self._lock:
+                self._databases = databases
+
+        if db_name not in databases:
+            return None
+
+        # get the dashboard ids from the dashboard names. this works,
+        # whereas selecting from the information_schema.dashboards table
+        # does not. there seems to be either a race condition or some kind
+        # of commit visibility issue after creating a dashboard.
+        #
+        con = self._pool.get(db_name)
+        return con._client.get_dashboards(con._session)
+
+    def get_id(self, db_name: str, dash_name: str) -> int:
+        """Get the id of a dashboard, or -1 if it doesn't exist."""
+
+        index = self._get_database_index(db_name)
+
+        with self._lock:
+            return index.get(dash_name, -1)
+
+    def get_update_time(self, db_name: str, dash_id: int) -> str:
+        """Get the last update time of a dashboard, or None if it isn't known."""
+
+        self._get_database_index(db_name)
+
+        with self._lock:
+            return self._update_times.get((db_name, dash_id))
+
+    def get_owner(self, db_name: str, dash_id: int) -> str:
+        """Get the owner of a dashboard, or None if it isn't known."""
+
+        self._get_database_index(db_name)
+
+        with self._lock:
+            return self._owners.get((db_name, dash_id))
+
+    def get_fingerprint(self, db_name: str, dash_id: int) -> str:
+        """Get the fingerprint of a dashboard's view state, or None if it isn't known for its last update time."""
+
+        update_time = self.get_update_time(db_name, dash_id)
+
+        with self._lock:
+            entry = self._fingerprints.get((db_name, dash_id))
+
+        return entry[1] if entry is not None and update_time is not None and entry[0] == update_time else None
+
+    def set_fingerprint(self, db_name: str, dash_id: int, fingerprint: str, update_time: str = None) -> None:
+        """Keep the fingerprint of a dashboard's view state as of an update time (by default its last one.)"""
+
+        update_time = update_time or self.get_update_time(db_name, dash_id)
+        if update_time is not None and fingerprint is not None:
+            with self._lock:
+                self._fingerprints[(db_name, dash_id)] = (update_time, fingerprint)
+
+    def refresh(self, db_name: str) -> None:
+        """Forget the database's dashboards, so they're fetched again on the next lookup."""
+
+        with self._lock:
+            self._index.pop(db_name, None)
+            self._fetches.pop(db_name, None)
+
+    def add(self, db_name: str, dash_name: str, dash_id: int) -> None:
+        self._get_database_index(db_name)
 
+        with self._lock:
+            self._index.setdefault(db_name, {})[dash_name] = dash_id
+
+    def remove(self, db_name: str, dash_name: str) -> None:
+        self._get_database_index(db_name)
+
+        with self._lock:
+            self._index.get(db_name, {}).pop(dash_name, None)
+
+
+def is_dash_code_same(pool: SessionPool, db_name: str, dash_id: int, dash_file: str) -> bool:
+    """
+    Compares the view states of a dashboard in a database and a dashboard
+    export file: byte for byte, or failing that, by their canonical
+    fingerprints.
+    """
+
+    con = pool.get(db_name)
     dashboard = con._client.get_dashboard(con._session, dash_id)
 
-    # construct what the dashboard export file contents would look like
-    #
-    db_view_state = base64.b64decode(dashboard.dashboard_state).decode('utf-8').rstrip()
+    server_state = base64.b64decode(dashboard.dashboard_state)
 
-    # switch back to the database in use prior to the call
-    # to is_dash_code_same()
-    #
-    con._client.switch_database(con._session, orig_db)
+    with get_dashboard_export(dash_file) as export:
+        if hash_state(server_state) == export.state_hash():
+            return True
 
-    file_view_state = get_file_content(dash_file).split('\n')[2].rstrip()
+        return fingerprint_state(server_state) == export.state_fingerprint()
 
-    # get the md5 hashes for the existing dashboard and the new dashboard
-    #
-    existing_md5 = hashlib.md5(db_view_state.encode('utf-8')).hexdigest()
-    new_md5 = hashlib.md5(file_view_state.encode('utf-8')).hexdigest()
+def analyze_dashboard(state: bytes, server_state: bytes = None, server_fingerprint: str = None) -> tuple[str, str, list[str]]:
+    """
+    Compares the view state of a dashboard export with the server copy, by
+    their canonical fingerprints (see fingerprint_state), and unless they're
+    the same, finds the tables the dashboard uses.
 
-    return existing_md5 == new_md5
+    The server copy is either its view state (base64 encoded, as get_dashboard
+    returns it), or its fingerprint if that's known already, or neither if
+    there isn't one. Returns the fingerprints of the export and the server
+    copy, and the tables (None if the fingerprints are the same.)
 
-def get_dash_id_from_name(con: Connection, db_name: str, dash_name: str) -> int:
-    """Looks up the name of a dashboard from its ID in a database."""
+    It's all CPU bound, so the planner can run it in a worker process: it only
+    takes and returns plain values.
+    """
 
-    dbs = [ d.db_name for d in con._client.get_databases(con._session) ]
-    if db_name not in dbs:
-        return -1
+    fingerprint = fingerprint_state(state)
 
-    # capture the current database from the session info and switch to the
-    # database containing the dashboard.
-    #
-    orig_db = con._client.get_session_info(con._session).database
-    con._client.switch_database(con._session, db_name)
+    if server_state is not None:
+        # a byte for byte copy needn't be decoded again.
+        #
+        server_state = base64.b64decode(server_state)
+        server_fingerprint = fingerprint if hash_state(server_state) == hash_state(state) else fingerprint_state(server_state)
 
-    # get the dashboard id from the dashboard name. this works, whereas 
-    # selecting from the information_schema.dashboards table does not.
-    # there seems to be either a race condition or some kind of commit 
-    # visibility issue after creating a dashboard.
-    #
-    dash_list = con._client.get_dashboards(con._session)
-    dash_ids = [ d.dashboard_id for d in dash_list if d.dashboard_name == dash_name ]
-    dash_id = dash_ids[0] if len(dash_ids) > 0 else -1
+    if server_fingerprint == fingerprint:
+        return fingerprint, server_fingerprint, None
 
-    # switch back to the database in use prior to the call to this method.
-    #
-    con._client.switch_database(con._session, orig_db)
+    return fingerprint, server_fingerprint, get_dash_table_deps(parse_state_dependencies(state))
 
-    return dash_id
+def get_dash_id_from_name(pool: SessionPool, db_name: str, dash_name: str) -> int:
+    """Looks up the ID of a dashboard from its name in a database."""
 
+    return pool.dashboards.get_id(db_name, dash_name)
 
-def exec_dash_ddl(con: Connection, ddl: str) -> None:
+
+def exec_dash_ddl(pool: SessionPool, db: str, ddl: str) -> None:
     r"""
     There are no DDL or slash commands for working with dashboards (other than
     '\import_dashboard') so this implements support for them. Supported
@@ -367,13 +1004,21 @@ def exec_dash_ddl(con: Connection, ddl: str) -> None:
     \drop_dashboard "dashboard_name"
     
     \rename_dashboard "dashboard_name" "new_dashboard_name"
+
+    \duplicate_dashboard "dashboard_name" "new_dashboard_name"
     
     \import_dashboard "dashboard_name" "file_uri"
 
+    \replace_dashboard "dashboard_name" "file_uri"
+
+    '\replace_dashboard' swaps the view state and metadata of an existing
+    dashboard for the file's in place, so its id (and the grants on it) stay
+    the same.
+
     NOTE: Arguments must be double quoted, not single quoted.
     """
     ddl = ddl.strip()
-    db = con._client.get_session_info(con._session).database
+    con = pool.get(db)
 
     # parse single quoted and escaped double quotes arguments in ddl
     #
@@ -391,11 +1036,15 @@ def exec_dash_ddl(con: Connection, ddl: str) -> None:
         if len(args) < 3:
             raise RuntimeError(f'Missing arguments to {cmd}: {ddl}')
     
-    dash_id = get_dash_id_from_name(con, db, dash) if cmd != '\\import_dashboard' else None
+    dash_id = get_dash_id_from_name(pool, db, dash) if cmd != '\\import_dashboard' else None
+
+    if dash_id == -1:
+        raise RuntimeError(f'Dashboard "{dash}" does not exist in database "{db}": {ddl}')
 
     match cmd:
         case '\\drop_dashboard':
             con._client.delete_dashboard(con._session, dash_id)
+            pool.dashboards.remove(db, dash)
 
         case '\\rename_dashboard':
             new_dash = args[2][1:-1] if args[2].startswith('"') else args[2]
@@ -404,37 +1053,60 @@ def exec_dash_ddl(con: Connection, ddl: str) -> None:
             # there doesn't seem to be a way in the heavyai API to rename a
             # dashboard, so we have to duplicate it and delete the original.
             #
-            con.duplicate_dashboard(dash_id, new_dash)
+            new_dash_id = con.duplicate_dashboard(dash_id, new_dash)
             con._client.delete_dashboard(con._session, dash_id)
 
+            pool.dashboards.remove(db, dash)
+            pool.dashboards.add(db, new_dash, new_dash_id)
+
+        case '\\duplicate_dashboard':
+            new_dash = args[2][1:-1] if args[2].startswith('"') else args[2]
+            new_dash = new_dash.replace('\\"', '"')
+
+            new_dash_id = con.duplicate_dashboard(dash_id, new_dash)
+            pool.dashboards.add(db, new_dash, new_dash_id)
+
         case '\\import_dashboard':
             dash_file_uri = args[2][1:-1] if args[2].startswith('"') else args[2]
             dash_file_uri = dash_file_uri.replace('\\"', '"')
-            dname, dmeta, dstate = get_file_content(dash_file_uri).split('\n', 2)
-
-            con._client.create_dashboard(
-                con._session, 
-                dash, 
-                base64.b64encode(bytes(dstate.encode('utf-8'))), 
-                None, 
-                dmeta
-            )
+            with get_dashboard_export(dash_file_uri) as export:
+                new_dash_id = con._client.create_dashboard(
+                    con._session, 
+                    dash, 
+                    base64.b64encode(export.state_bytes), 
+                    None, 
+                    export.metadata
+                )
+
+            pool.dashboards.add(db, dash, new_dash_id)
+
+        case '\\replace_dashboard':
+            dash_file_uri = args[2][1:-1] if args[2].startswith('"') else args[2]
+            dash_file_uri = dash_file_uri.replace('\\"', '"')
+            # the owner has to be given, so keep the one it has.
+            #
+            with get_dashboard_export(dash_file_uri) as export:
+                con._client.replace_dashboard(
+                    con._session,
+                    dash_id,
+                    dash,
+                    pool.dashboards.get_owner(db, dash_id) or con._client.get_session_info(con._session).user,
+                    base64.b64encode(export.state_bytes),
+                    None,
+                    export.metadata
+                )
 
         case _:
             raise RuntimeError(f'Unrecognized dashboard DDL: {ddl}')
 
 
-def get_dash_table_deps_from_db(con: Connection, db_name: str, dash_id: int) -> list[str]:
+def get_dash_table_deps_from_db(pool: SessionPool, db_name: str, dash_id: int) -> list[str]:
     """Get the list of tables used in a dashboard from a database connection."""
 
-    orig_db = con._client.get_session_info(con._session).database
-    con._client.switch_database(con._session, db_name)
-
+    con = pool.get(db_name)
     dash_obj = con._client.get_dashboard(con._session, dash_id)
- 
-    con._client.switch_database(con._session, orig_db)
 
-    dash_dict = json.loads(base64.b64decode(dash_obj.dashboard_state).decode('utf-8'))
+    dash_dict = parse_state_dependencies(base64.b64decode(dash_obj.dashboard_state))
 
     return get_dash_table_deps(dash_dict)
 
@@ -442,7 +1114,8 @@ def get_dash_table_deps_from_db(con: Connection, db_name: str, dash_id: int) ->
 def get_dash_table_deps(dash: dict) -> list[str]:
     """
     Get the list of tables used in a dashboard from the dashboard export file's
-    dashboard state (line 3) translated into a dictionary.
+    dashboard state (line 3) translated into a dictionary, or just the parts
+    of it parse_state_dependencies() extracts.
     """
 
     # extract all the data sources from all the tabs. dedup the list
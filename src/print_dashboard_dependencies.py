@@ -1,9 +1,8 @@
 import argparse
-import json
 import os
 
-from heavyai import connect
-from deployment.util import get_dash_table_deps, get_dash_table_deps_from_db
+from deployment.dashboard import DashboardExport
+from deployment.util import SessionPool, get_dash_table_deps, get_dash_table_deps_from_db
 
 def get_connect_url(args):
     if args.url is not None:
@@ -22,14 +21,14 @@ def print_dependencies(args) -> None:
 
     if args.dashboard_file is not None:
         try:
-            with open(args.dashboard_file, 'r') as f:
-                dashboard_json = f.read().split('\n')[2]
+            export = DashboardExport.from_file(args.dashboard_file)
         except Exception as e:
             print(f'Error: Could not open file {args.dashboard_file}. {e}')
             return
         
         try:
-            dash_dict = json.loads(dashboard_json)
+            with export:
+                dash_dict = export.parse_dependencies()
         except Exception as e:
             print(f'Error: Could not parse JSON from file {args.dashboard_file}. {e}')
             return
@@ -38,8 +37,8 @@ def print_dependencies(args) -> None:
     
     else:
         url = get_connect_url(args)
-        con = connect(url)
-        dash_table_deps = get_dash_table_deps_from_db(con, args.db, args.dashboard_id)
+        pool = SessionPool(url)
+        dash_table_deps = get_dash_table_deps_from_db(pool, args.db, args.dashboard_id)
 
     for t in dash_table_deps:
         print(t)
@@ -0,0 +1,152 @@
+"""
+Benchmarks generate_plan, generate_ddl and apply_ddl against a FakeServer
+holding a synthetic catalog, at increasing catalog sizes, reporting the time
+and the number of calls to the server at each size. The "growth" columns
+compare the cost per artifact with the previous size: about 1.0 when the
+cost is linear in the number of artifacts, and about the size ratio when
+it's quadratic.
+
+    python -m test.integration.benchmark --sizes 100 1000 5000 --latency 0.001
+"""
+
+import argparse
+import io
+import json
+import sys
+import tempfile
+import time
+
+from contextlib import nullcontext, redirect_stdout
+from unittest.mock import patch
+
+from src.deployment.apply import apply_ddl
+from src.deployment.plan import generate_plan, generate_ddl
+from src.deployment.util import SessionPool
+from src.deployment.validate import validate
+
+from .fake_heavydb import FakeServer
+from .synthetic import generate_artifacts
+from .thrift_server import ThriftServer
+
+
+def run(size: int, latency: float = 0.0, workers: int = 1, parallelism: int = 1, existing: float = 0.5,
+        thrift: bool = False, dashboard_bytes: int = 0) -> dict:
+    """
+    Plans and applies a synthetic artifacts file of the given size, returning
+    the timings and call counts. With "thrift", the fake server is reached
+    through heavyai.connect and a local Thrift server, rather than in-process.
+    """
+
+    server = FakeServer(latency)
+
+    with tempfile.TemporaryDirectory() as directory, \
+         (ThriftServer(server) if thrift else nullcontext()) as thrift_server:
+
+        location = { 'host': thrift_server.host, 'port': thrift_server.port } if thrift else {}
+        conf = validate(generate_artifacts(directory, size, server, existing, dashboard_bytes=dashboard_bytes, **location))
+
+        with (nullcontext() if thrift else patch('src.deployment.util.connect', server.connect)):
+            pool = SessionPool(conf['connection_url'])
+
+            start = time.perf_counter()
+            plan = generate_plan(conf, pool, workers)
+            plan_time = time.perf_counter() - start
+            plan_calls = dict(server.calls)
+
+            start = time.perf_counter()
+            graph = generate_ddl(plan)
+            ddl_time = time.perf_counter() - start
+
+            # apply_ddl prints every statement.
+            #
+            server.reset_counts()
+            start = time.perf_counter()
+            with redirect_stdout(io.StringIO()):
+                apply_ddl(pool, graph, parallelism=parallelism)
+            apply_time = time.perf_counter() - start
+
+            pool.close()
+
+    return {
+        'size': size,
+        'artifacts': len(plan['config_hashes']),
+        'plan_time': plan_time,
+        'ddl_time': ddl_time,
+        'apply_time': apply_time,
+        'plan_rpcs': sum(plan_calls.values()),
+        'apply_rpcs': sum(server.calls.values()),
+        'statements': len(server.statements),
+        'plan_calls': plan_calls,
+        'apply_calls': dict(server.calls)
+    }
+
+
+def growth(results: list[dict], key: str) -> list[float]:
+    """The cost per artifact at each size relative to the previous size (None for the first.)"""
+
+    retval = [None]
+    for prev, cur in zip(results, results[1:]):
+        if prev[key] == 0:
+            retval.append(None)
+            continue
+
+        retval.append((cur[key] / cur['artifacts']) / (prev[key] / prev['artifacts']))
+
+    return retval
+
+
+def format_results(results: list[dict]) -> list[str]:
+    lines = [ f'{"size":>7} {"artifacts":>9} {"plan (s)":>9} {"ddl (s)":>8} {"apply (s)":>9} '
+              f'{"plan rpcs":>9} {"apply rpcs":>10} {"stmts":>6}  {"plan growth":>11} {"rpc growth":>10} {"apply growth":>12}' ]
+
+    fmt = lambda g: f'{g:.2f}' if g is not None else '-'
+
+    for r, pg, rg, ag in zip(results, growth(results, 'plan_time'), growth(results, 'plan_rpcs'), growth(results, 'apply_time')):
+        lines.append(f'{r["size"]:>7} {r["artifacts"]:>9} {r["plan_time"]:>9.3f} {r["ddl_time"]:>8.3f} {r["apply_time"]:>9.3f} '
+                     f'{r["plan_rpcs"]:>9} {r["apply_rpcs"]:>10} {r["statements"]:>6}  {fmt(pg):>11} {fmt(rg):>10} {fmt(ag):>12}')
+
+    return lines
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Benchmark planning and applying synthetic artifacts against a fake HeavyDB server.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 5000],
+                        help='The catalog sizes (number of static tables) to benchmark. (Default: 100 1000 5000)')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds each call to the fake server takes. (Default: 0)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Planner workers. (Default: 1)')
+    parser.add_argument('--parallelism', type=int, default=1,
+                        help='Statements applied concurrently. (Default: 1)')
+    parser.add_argument('--existing', type=float, default=0.5,
+                        help='Fraction of the artifacts already on the server. (Default: 0.5)')
+    parser.add_argument('--thrift', action='store_true',
+                        help='Go through heavyai.connect and a local Thrift server instead of calling the fake server in-process.')
+    parser.add_argument('--dashboard-bytes', type=int, default=0,
+                        help='Pad the dashboards to about this size. (Default: no padding)')
+    parser.add_argument('--max-growth', type=float,
+                        help='Fail if the plan time or calls per artifact grow by more than this factor between sizes.')
+    parser.add_argument('--out', metavar='<Path to a JSON file>',
+                        help='Also write the results, with the calls by method, to the file.')
+    args = parser.parse_args()
+
+    results = []
+    for size in sorted(args.sizes):
+        results.append(run(size, args.latency, args.workers, args.parallelism, args.existing, args.thrift, args.dashboard_bytes))
+        print(format_results(results)[-1] if len(results) > 1 else '\n'.join(format_results(results)), flush=True)
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.max_growth is not None:
+        worst = max([ g for key in ('plan_time', 'plan_rpcs') for g in growth(results, key) if g is not None ], default=0)
+        if worst > args.max_growth:
+            print(f'Cost per artifact grew by {worst:.2f}x (more than {args.max_growth:.2f}x) between sizes.')
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
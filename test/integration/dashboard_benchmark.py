@@ -0,0 +1,145 @@
+"""
+Benchmarks finding the tables a dashboard export uses, by decoding its whole
+view state with json.loads and by extracting only the data sources and
+parameter definitions with parse_state_dependencies, reporting the time and
+the peak memory of each.
+
+With --processes, it also times comparing and parsing a set of copies of the
+dashboard (analyze_dashboard, as the planner does) in planner threads only and
+in process pools of each size, to show how the work scales across cores.
+
+    python -m test.integration.dashboard_benchmark test_assets/dashboards/heavyeco_flood_st_louis.json
+    python -m test.integration.dashboard_benchmark --processes 1 2 4 8 --copies 32
+"""
+
+import argparse
+import base64
+import os
+import sys
+import time
+import tracemalloc
+
+from concurrent.futures import ThreadPoolExecutor
+
+from src.deployment.dashboard import DashboardExport
+from src.deployment.plan import _run_in_process, dashboard_process_pool
+from src.deployment.util import analyze_dashboard, get_dash_table_deps
+
+
+DEFAULT_DASHBOARD = os.path.join(os.path.dirname(__file__), '..', '..', 'test_assets', 'dashboards', 'heavyeco_flood_st_louis.json')
+
+
+def measure(fn, repeat: int) -> tuple[float, int, list]:
+    """Runs fn repeat times, returning the best time, the peak memory it allocated and its result."""
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    try:
+        result = fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return best, peak, result
+
+
+def run(path: str, repeat: int = 5) -> dict:
+    export = DashboardExport.from_file(path)
+
+    full_time, full_peak, full_deps = measure(lambda: get_dash_table_deps(export.parse_state()), repeat)
+    stream_time, stream_peak, stream_deps = measure(lambda: get_dash_table_deps(export.parse_dependencies()), repeat)
+
+    return {
+        'file': path,
+        'state_bytes': len(export.state_bytes),
+        'tables': len(full_deps),
+        'same_tables': full_deps == stream_deps,
+        'json_loads_time': full_time,
+        'json_loads_peak': full_peak,
+        'extract_time': stream_time,
+        'extract_peak': stream_peak
+    }
+
+
+def scaling(path: str, copies: int, processes: list[int], threads: int = 4) -> list[dict]:
+    """
+    Times analyzing "copies" copies of the dashboard, each against a server copy
+    that differs (so they're all parsed), from "threads" planner threads, with
+    the work done in the threads themselves (0 processes) and in process pools
+    of each size.
+    """
+
+    export = DashboardExport.from_file(path)
+    server_state = base64.b64encode(b'{}')
+
+    results = []
+    for n in [0] + processes:
+        process_executor = dashboard_process_pool(n)
+
+        try:
+            # start the processes before timing.
+            #
+            if process_executor is not None:
+                list(process_executor.map(abs, range(n)))
+
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                start = time.perf_counter()
+                tables = list(executor.map(lambda _: _run_in_process(process_executor, analyze_dashboard, export.state_bytes, server_state)[1],
+                                           range(copies)))
+                elapsed = time.perf_counter() - start
+        finally:
+            if process_executor is not None:
+                process_executor.shutdown()
+
+        results.append({ 'processes': n, 'copies': copies, 'time': elapsed, 'tables': tables[0], 'same_tables': all(t == tables[0] for t in tables) })
+
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Benchmark extracting the table dependencies of dashboard exports.')
+    parser.add_argument('files', nargs='*', default=[DEFAULT_DASHBOARD],
+                        help='The dashboard export files. (Default: the St. Louis flood dashboard in test_assets)')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Runs to take the best time of. (Default: 5)')
+    parser.add_argument('--processes', type=int, nargs='+',
+                        help='Also time analyzing --copies copies of the (first) dashboard with process pools of these sizes.')
+    parser.add_argument('--copies', type=int, default=16,
+                        help='The number of dashboards for --processes. (Default: 16)')
+    args = parser.parse_args()
+
+    print(f'{"state (MB)":>10} {"tables":>6} {"loads (ms)":>10} {"loads peak (MB)":>15} {"extract (ms)":>12} {"extract peak (MB)":>17}  file')
+
+    retval = 0
+    for path in args.files:
+        r = run(path, args.repeat)
+        print(f'{r["state_bytes"] / 1e6:>10.2f} {r["tables"]:>6} {r["json_loads_time"] * 1000:>10.1f} {r["json_loads_peak"] / 1e6:>15.2f} '
+              f'{r["extract_time"] * 1000:>12.1f} {r["extract_peak"] / 1e6:>17.3f}  {os.path.basename(path)}')
+
+        if not r['same_tables']:
+            print(f'  The tables extracted from {path} differ from the ones in its decoded view state.')
+            retval = 1
+
+    if args.processes:
+        print()
+        print(f'{"processes":>9} {"dashboards":>10} {"time (s)":>8} {"speedup":>7}  ({os.cpu_count()} cores)')
+
+        results = scaling(args.files[0], args.copies, args.processes)
+        for r in results:
+            print(f'{r["processes"] or "threads":>9} {r["copies"]:>10} {r["time"]:>8.2f} {results[0]["time"] / r["time"]:>7.2f}')
+
+        if not all(r['same_tables'] and r['tables'] == results[0]['tables'] for r in results):
+            print('  The tables found in the processes differ from the ones found in the threads.')
+            retval = 1
+
+    return retval
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,334 @@
+import base64
+import copy
+import itertools
+import json
+import re
+import threading
+import time
+
+from collections import Counter, namedtuple
+from heavydb.thrift.ttypes import TDashboard, TDBInfo
+from urllib.parse import urlparse
+
+
+ColumnDetails = namedtuple('ColumnDetails', 'name type')
+
+
+class FakeServer:
+    """
+    An in-process stand-in for a HeavyDB server, for benchmarking the planner
+    and apply_ddl without one. It holds a catalog (databases, tables,
+    dashboards, roles, users, servers and policies), answers the Thrift calls
+    and queries the deployment makes, and applies the effects of the DDL it
+    executes to the catalog, so a second plan sees the first apply.
+
+    Every call to the server is counted by method, and takes "latency"
+    seconds, to model the round trip to a real server. inject_failure() makes
+    calls fail, to exercise the error handling.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+
+        self.databases: set[str] = { 'heavyai', 'information_schema' }
+        self.tables: dict[str, dict[str, list]] = {}       # db -> table name -> [(column name, type)]
+        self.dashboards: dict[str, dict[int, TDashboard]] = {} # db -> dashboard id -> dashboard
+        self.roles: set[str] = set()
+        self.users: set[str] = { 'admin' }
+        self.servers: dict[str, dict[str, dict]] = {}      # db -> server name -> SHOW SERVERS row
+        self.policies: dict[str, dict[str, set]] = {}      # db -> user/role -> 'TAB.COL'
+
+        self.calls = Counter()
+        self.statements: list[tuple[str, str]] = []        # (db, DDL) in execution order
+
+        self._sessions: dict[str, str] = {}                # session -> db
+        self._session_ids = itertools.count()
+        self._failures: list[list] = []                    # [method, pattern, error, count]
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def call(self, method: str, arg: str = None) -> None:
+        """Counts a call, waits out the latency and raises any failure injected for it."""
+
+        with self._lock:
+            self.calls[method] += 1
+
+            failure = next((f for f in self._failures if f[0] == method and (f[1] is None or re.search(f[1], arg or ''))), None)
+            if failure is not None:
+                failure[3] -= 1
+                if failure[3] == 0:
+                    self._failures.remove(failure)
+
+        if self.latency:
+            time.sleep(self.latency)
+
+        if failure is not None:
+            raise RuntimeError(failure[2])
+
+    def inject_failure(self, method: str, error: str = 'Injected failure', count: int = 1, pattern: str = None) -> None:
+        """
+        Makes the next "count" calls of the method (-1: all of them) fail with
+        the error. With a pattern, only the calls whose query, DDL or object
+        name matches it fail.
+        """
+
+        with self._lock:
+            self._failures.append([method, pattern, error, count])
+
+    def open_session(self, db: str) -> str:
+        with self._lock:
+            if db not in self.databases:
+                raise RuntimeError(f'Database "{db}" does not exist')
+
+            session = f'{db}:{next(self._session_ids)}'
+            self._sessions[session] = db
+
+        return session
+
+    def close_session(self, session: str) -> None:
+        with self._lock:
+            self._sessions.pop(session, None)
+
+    def connect(self, url: str) -> 'FakeConnection':
+        """Stands in for heavyai.connect()."""
+
+        db = urlparse(url).path.lstrip('/')
+        self.call('connect', db)
+
+        return FakeConnection(self, self.open_session(db))
+
+    def reset_counts(self) -> None:
+        with self._lock:
+            self.calls = Counter()
+            self.statements = []
+
+    def add_table(self, db: str, tab: str, columns: list) -> None:
+        self.tables.setdefault(db, {})[tab] = list(columns)
+
+    def add_dashboard(self, db: str, name: str, state: str, metadata: str) -> int:
+        with self._lock:
+            dash_id = self._next_id
+            self._next_id += 1
+
+        self.dashboards.setdefault(db, {})[dash_id] = TDashboard(
+            dashboard_name=name, dashboard_state=base64.b64encode(state.encode()).decode(),
+            dashboard_metadata=metadata, dashboard_id=dash_id, dashboard_owner='admin', update_time=f'{time.time_ns()}'
+        )
+
+        return dash_id
+
+    def db(self, session: str) -> str:
+        return self._sessions[session]
+
+    def query(self, db: str, sql: str) -> tuple[list[str], list[tuple]]:
+        """Answers the catalog queries, returning the column names and rows."""
+
+        sql = ' '.join(sql.split())
+
+        if sql == 'SELECT database_name, table_name FROM tables':
+            return ['database_name', 'table_name'], [ (d, t) for d, tabs in self.tables.items() for t in tabs ]
+
+        if sql == 'SELECT database_name, dashboard_name, dashboard_id FROM dashboards':
+            return ['database_name', 'dashboard_name', 'dashboard_id'], \
+                   [ (d, dash.dashboard_name, i) for d, dashes in self.dashboards.items() for i, dash in dashes.items() ]
+
+        if sql == 'SELECT role_name FROM roles':
+            return ['role_name'], [ (r,) for r in self.roles ]
+
+        if sql == 'SELECT user_name FROM users':
+            return ['user_name'], [ (u,) for u in self.users ]
+
+        if sql == 'SHOW SERVERS':
+            return ['server_name', 'data_wrapper', 'options'], \
+                   [ (s['server_name'], s['data_wrapper'], s['options']) for s in self.servers.get(db, {}).values() ]
+
+        if m := re.match(r'(?i)^SHOW POLICIES "?([^"\s]+)"?$', sql):
+            return ['COLUMN'], [ (c,) for c in self.policies.get(db, {}).get(m.group(1), ()) ]
+
+        raise RuntimeError(f'Unsupported query: {sql}')
+
+    def execute(self, db: str, ddl: str) -> None:
+        """Runs a DDL statement, applying its effect on the catalog (if any.)"""
+
+        with self._lock:
+            self.statements.append((db, ddl))
+
+        for pattern, effect in _DDL_EFFECTS:
+            if m := re.match(pattern, ddl, re.IGNORECASE | re.DOTALL):
+                effect(self, db, m)
+                return
+
+
+class FakeClient:
+    """The Thrift client of a FakeConnection."""
+
+    def __init__(self, server: FakeServer):
+        self._server = server
+
+    def get_databases(self, session: str) -> list[TDBInfo]:
+        self._server.call('get_databases')
+        return [ TDBInfo(db_name=db, db_owner='admin') for db in sorted(self._server.databases) ]
+
+    def switch_database(self, session: str, db: str) -> None:
+        self._server.call('switch_database', db)
+        self._server._sessions[session] = db
+
+    def get_dashboards(self, session: str) -> list[TDashboard]:
+        self._server.call('get_dashboards')
+
+        # the list doesn't carry the dashboard states.
+        #
+        return [ TDashboard(dashboard_name=d.dashboard_name, dashboard_id=d.dashboard_id, update_time=d.update_time,
+                            dashboard_metadata=d.dashboard_metadata, dashboard_owner=d.dashboard_owner)
+                 for d in self._server.dashboards.get(self._server.db(session), {}).values() ]
+
+    def get_dashboard(self, session: str, dashboard_id: int) -> TDashboard:
+        self._server.call('get_dashboard', str(dashboard_id))
+
+        dash = self._server.dashboards.get(self._server.db(session), {}).get(dashboard_id)
+        if dash is None:
+            raise RuntimeError(f'Dashboard {dashboard_id} does not exist')
+
+        return copy.copy(dash)
+
+    def create_dashboard(self, session: str, dashboard_name: str, dashboard_state, image_hash: str, dashboard_metadata: str) -> int:
+        self._server.call('create_dashboard', dashboard_name)
+
+        state = dashboard_state.decode() if isinstance(dashboard_state, bytes) else dashboard_state
+        return self._server.add_dashboard(self._server.db(session), dashboard_name, base64.b64decode(state).decode(), dashboard_metadata)
+
+    def replace_dashboard(self, session: str, dashboard_id: int, dashboard_name: str, dashboard_owner: str, dashboard_state,
+                          image_hash: str, dashboard_metadata: str) -> None:
+        self._server.call('replace_dashboard', str(dashboard_id))
+
+        dash = self._server.dashboards.get(self._server.db(session), {}).get(dashboard_id)
+        if dash is None:
+            raise RuntimeError(f'Dashboard {dashboard_id} does not exist')
+
+        state = dashboard_state.decode() if isinstance(dashboard_state, bytes) else dashboard_state
+        dash.dashboard_name = dashboard_name
+        dash.dashboard_owner = dashboard_owner
+        dash.dashboard_state = state
+        dash.dashboard_metadata = dashboard_metadata
+        dash.update_time = f'{time.time_ns()}'
+
+    def delete_dashboard(self, session: str, dashboard_id: int) -> None:
+        self._server.call('delete_dashboard', str(dashboard_id))
+        self._server.dashboards.get(self._server.db(session), {}).pop(dashboard_id, None)
+
+    def get_table_details(self, session: str, table_name: str) -> list[ColumnDetails]:
+        self._server.call('get_table_details', table_name)
+
+        columns = self._server.tables.get(self._server.db(session), {}).get(table_name)
+        if columns is None:
+            raise RuntimeError(f'Table {table_name} does not exist')
+
+        return [ ColumnDetails(n, t) for n, t in columns ]
+
+    def sql_execute(self, session: str, query: str) -> tuple[list[str], list[tuple]]:
+        self._server.call('sql_execute', query)
+
+        db = self._server.db(session)
+        if re.match(r'(?i)^\s*(SELECT|SHOW)\s', query):
+            return self._server.query(db, query)
+
+        self._server.execute(db, query)
+        return [], []
+
+
+class FakeConnection:
+    """Stands in for a heavyai.Connection: the DB-API cursor and the few Connection methods the deployment uses."""
+
+    def __init__(self, server: FakeServer, session: str):
+        self._client = FakeClient(server)
+        self._session = session
+        self.closed = 0
+
+    def cursor(self) -> 'FakeCursor':
+        return FakeCursor(self)
+
+    def execute(self, operation: str) -> 'FakeCursor':
+        cursor = self.cursor()
+        cursor.execute(operation)
+        return cursor
+
+    def get_column_details(self, table_name: str) -> list[ColumnDetails]:
+        return self._client.get_table_details(self._session, table_name)
+
+    def duplicate_dashboard(self, dashboard_id: int, new_name: str = None) -> int:
+        d = self._client.get_dashboard(self._session, dashboard_id)
+        return self._client.create_dashboard(self._session, new_name, d.dashboard_state, None, d.dashboard_metadata)
+
+    def commit(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self._client._server.close_session(self._session)
+        self.closed = 1
+
+
+class FakeCursor:
+    """A DB-API cursor, enough for pandas.read_sql_query()."""
+
+    def __init__(self, con: FakeConnection):
+        self._con = con
+        self.description = None
+        self.rowcount = -1
+        self._rows: list[tuple] = []
+
+    def execute(self, operation: str, parameters=None) -> 'FakeCursor':
+        columns, self._rows = self._con._client.sql_execute(self._con._session, operation)
+        self.description = [ (c, None, None, None, None, None, True) for c in columns ] if columns else None
+        self.rowcount = len(self._rows)
+        return self
+
+    def fetchall(self) -> list[tuple]:
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchone(self) -> tuple:
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchmany(self, size: int = 1) -> list[tuple]:
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def close(self) -> None:
+        pass
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+
+def _create_table(server: FakeServer, db: str, m: re.Match) -> None:
+    columns = re.findall(r'[(,]\s*(\w+)\s+(\w+)', m.group(2) or '')
+    server.add_table(db, m.group(1), columns)
+
+
+def _rename_table(server: FakeServer, db: str, m: re.Match) -> None:
+    tables = server.tables.get(db, {})
+    if m.group(1) in tables:
+        tables[m.group(2)] = tables.pop(m.group(1))
+
+
+def _create_server(server: FakeServer, db: str, m: re.Match) -> None:
+    options = { k.upper(): v for k, v in re.findall(r"(\w+)='([^']*)'", m.group(3)) }
+    server.servers.setdefault(db, {})[m.group(1)] = { 'server_name': m.group(1), 'data_wrapper': m.group(2).upper(),
+                                                     'options': json.dumps(options) }
+
+
+_DDL_EFFECTS = (
+    (r'^\s*CREATE DATABASE (\w+)', lambda s, db, m: s.databases.add(m.group(1))),
+    (r'^\s*CREATE (?:FOREIGN )?TABLE (?:IF NOT EXISTS )?(\w+)\s*(\(.*\))?', _create_table),
+    (r'^\s*RESTORE TABLE (\w+)', lambda s, db, m: s.add_table(db, m.group(1), [])),
+    (r'^\s*DROP (?:FOREIGN )?TABLE (?:IF EXISTS )?(\w+)', lambda s, db, m: s.tables.get(db, {}).pop(m.group(1), None)),
+    (r'^\s*ALTER (?:FOREIGN )?TABLE (\w+) RENAME TO (\w+)', _rename_table),
+    (r'^\s*CREATE SERVER (?:IF NOT EXISTS )?(\w+) FOREIGN DATA WRAPPER (\w+) WITH \((.*)\)', _create_server),
+    (r'^\s*CREATE ROLE (\w+)', lambda s, db, m: s.roles.add(m.group(1))),
+    (r'^\s*DROP ROLE (\w+)', lambda s, db, m: s.roles.discard(m.group(1))),
+    (r'^\s*CREATE USER "?([^"\s(]+)"?', lambda s, db, m: s.users.add(m.group(1))),
+    (r'^\s*CREATE POLICY ON COLUMN (\w+\.\w+) TO "?([^"\s]+)"?',
+     lambda s, db, m: s.policies.setdefault(db, {}).setdefault(m.group(2), set()).add(m.group(1).upper())),
+    (r'^\s*DROP POLICY ON COLUMN (\w+\.\w+) FROM "?([^"\s]+)"?',
+     lambda s, db, m: s.policies.get(db, {}).get(m.group(2), set()).discard(m.group(1).upper())),
+)
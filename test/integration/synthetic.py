@@ -0,0 +1,131 @@
+import json
+import os
+
+from .fake_heavydb import FakeServer
+
+
+BENCH_DB = 'bench'
+
+
+def generate_artifacts(directory: str, size: int, server: FakeServer, existing: float = 0.5,
+                       host: str = 'bench', port: int = 6274, dashboard_bytes: int = 0) -> str:
+    """
+    Writes a synthetic artifacts file (and its dashboard files) to the
+    directory, returning its path, and adds the artifacts that already exist
+    to the server's catalog.
+
+    "size" is the number of static tables. There's a foreign table, a
+    dashboard and a policy for every 10 tables, a role for every 20, a user
+    for every 10 and a foreign server for every 100. The first "existing"
+    fraction of each kind of artifact is already on the server (and up to
+    date), the rest need creating. The dashboards are padded to about
+    "dashboard_bytes" each, to model large dashboards.
+    """
+
+    n_servers = max(size // 100, 1)
+    n_foreign = max(size // 10, 1)
+    n_dashes = max(size // 10, 1)
+    n_roles = max(size // 20, 1)
+    n_users = max(size // 10, 1)
+    n_policies = max(size // 10, 1)
+
+    exists = lambda i, n: i < int(n * existing)
+
+    server.databases.add(BENCH_DB)
+
+    artifacts = {
+        'connection_info': { 'host': host, 'port': str(port), 'user': 'admin', 'password': 'bench', 'database': 'heavyai' },
+        'databases': ['heavyai', BENCH_DB],
+        'static_tables': { BENCH_DB: {} },
+        'foreign_servers': { BENCH_DB: {} },
+        'foreign_tables': { BENCH_DB: {} },
+        'dashboards': { BENCH_DB: {} },
+        'roles': {},
+        'policies': { BENCH_DB: {} },
+        'users': {}
+    }
+
+    columns = [('id', 'BIGINT'), ('region', 'TEXT'), ('value', 'DOUBLE')]
+
+    for i in range(size):
+        tab = f'table_{i:06d}'
+        artifacts['static_tables'][BENCH_DB][tab] = {
+            'ddl_cmd': f'CREATE TABLE {tab} (id BIGINT, region TEXT ENCODING DICT(32), value DOUBLE)',
+            'if_exists': 'skip'
+        }
+
+        if exists(i, size):
+            server.add_table(BENCH_DB, tab, columns)
+
+    for i in range(n_servers):
+        fs = f'server_{i:04d}'
+        artifacts['foreign_servers'][BENCH_DB][fs] = { 'wrapper': 'PARQUET_FILE', 'storage_type': 'AWS_S3',
+                                                       's3_bucket': 'bench-bucket', 'aws_region': 'us-east-1' }
+
+        if exists(i, n_servers):
+            server.servers.setdefault(BENCH_DB, {})[fs] = {
+                'server_name': fs, 'data_wrapper': 'PARQUET_FILE',
+                'options': json.dumps({ 'STORAGE_TYPE': 'AWS_S3', 'S3_BUCKET': 'bench-bucket', 'AWS_REGION': 'us-east-1' })
+            }
+
+    for i in range(n_foreign):
+        tab = f'foreign_{i:06d}'
+        artifacts['foreign_tables'][BENCH_DB][tab] = {
+            'ddl_cmd': f"CREATE FOREIGN TABLE {tab} (id BIGINT, region TEXT) SERVER server_{i % n_servers:04d} WITH (FILE_PATH='{tab}/')",
+            'server': f'server_{i % n_servers:04d}',
+            'if_exists': 'skip'
+        }
+
+        if exists(i, n_foreign):
+            server.add_table(BENCH_DB, tab, columns[:2])
+
+    dash_dir = os.path.join(directory, 'dashboards')
+    os.makedirs(dash_dir, exist_ok=True)
+
+    for i in range(n_dashes):
+        dash = f'Dashboard {i:05d}'
+        tabs = [ f'table_{(i * 10 + j) % size:06d}' for j in range(2) ]
+        metadata = json.dumps({ 'table': ', '.join(tabs), 'version': 'v2' })
+        state = json.dumps({ 'tabs': { 'tab1': { 'dashboard': { 'title': dash, 'dataSources': { t: {} for t in tabs },
+                                                                'layout': f'{i:x}' * (dashboard_bytes // len(f'{i:x}')) } } },
+                             'parameters': { 'definitions': {} } })
+
+        uri = os.path.join(dash_dir, f'dashboard_{i:05d}.json')
+        with open(uri, 'w') as f:
+            f.write(f'{dash}\n{metadata}\n{state}\n')
+
+        artifacts['dashboards'][BENCH_DB][dash] = { 'dashboard_uri': uri, 'if_exists': 'replace' }
+
+        if exists(i, n_dashes):
+            server.add_dashboard(BENCH_DB, dash, state, metadata)
+
+    for i in range(n_roles):
+        r = f'role_{i:05d}'
+        artifacts['roles'][r] = {
+            'databases': { BENCH_DB: ['ACCESS', 'SELECT'] },
+            'dashboards': { BENCH_DB: { f'Dashboard {j:05d}': ['VIEW'] for j in range(2 * i, min(2 * i + 2, n_dashes)) } }
+        }
+
+        if exists(i, n_roles):
+            server.roles.add(r)
+
+    for i in range(n_users):
+        u = f'user_{i:05d}'
+        artifacts['users'][u] = { 'password': 'bench', 'default_db': BENCH_DB, 'roles': [f'role_{i % n_roles:05d}'] }
+
+        if exists(i, n_users):
+            server.users.add(u)
+
+    for i in range(n_policies):
+        tab = f'table_{i:06d}'
+        r = f'role_{i % n_roles:05d}'
+        artifacts['policies'][BENCH_DB][tab] = { 'region': { r: f'region_{i}, region_{i + 1}' } }
+
+        if exists(i, n_policies) and exists(i % n_roles, n_roles):
+            server.policies.setdefault(BENCH_DB, {}).setdefault(r, set()).add(f'{tab}.REGION')
+
+    path = os.path.join(directory, 'heavyai_artifacts.json')
+    with open(path, 'w') as f:
+        json.dump(artifacts, f, indent=2)
+
+    return path
@@ -0,0 +1,154 @@
+import base64
+import copy
+import io
+import json
+import tempfile
+import unittest
+
+from contextlib import redirect_stdout
+from unittest.mock import patch
+
+from src.deployment.apply import apply_ddl
+from src.deployment.constants import *
+from src.deployment.plan import generate_plan, generate_ddl
+from src.deployment.target import parse_target
+from src.deployment.util import SessionPool
+from src.deployment.validate import validate
+
+from . import dashboard_benchmark
+from .benchmark import growth, run
+from .fake_heavydb import FakeServer
+from .synthetic import generate_artifacts
+
+class BenchmarkTestCase(unittest.TestCase):
+
+    def test_calls_scale_linearly(self):
+        results = [ run(size) for size in (40, 160) ]
+
+        for r in results:
+            self.assertGreater(r['statements'], 0)
+            self.assertGreater(r['apply_calls']['create_dashboard'], 0)
+
+        # the calls per artifact must not grow with the size of the catalog.
+        #
+        self.assertLessEqual(growth(results, 'plan_rpcs')[1], 1.0)
+        self.assertLessEqual(growth(results, 'apply_rpcs')[1], 1.1)
+
+    def test_apply_converges(self):
+        server = FakeServer()
+
+        with tempfile.TemporaryDirectory() as directory, patch('src.deployment.util.connect', server.connect):
+            path = generate_artifacts(directory, 40, server)
+            conf = validate(path)
+
+            pool = SessionPool(conf['connection_url'])
+            with redirect_stdout(io.StringIO()):
+                apply_ddl(pool, generate_ddl(generate_plan(conf, pool)))
+            pool.close()
+
+            # everything the first apply created is on the server now.
+            #
+            conf = validate(path)
+            plan = generate_plan(conf, SessionPool(conf['connection_url']))
+
+        self.assertTrue(all(t['state'] == RESOURCE_STATES.EXISTS for t in plan['static_tables']['bench'].values()))
+        self.assertTrue(all(d['state'] == RESOURCE_STATES.UP_TO_DATE for d in plan['dashboards']['bench'].values()))
+        self.assertTrue(all(u['state'] == RESOURCE_STATES.EXISTS for u in plan['users'].values()))
+
+    def test_changed_dashboard_replaced_in_place(self):
+        server = FakeServer()
+
+        with tempfile.TemporaryDirectory() as directory, patch('src.deployment.util.connect', server.connect):
+            path = generate_artifacts(directory, 40, server)
+            conf = validate(path)
+
+            pool = SessionPool(conf['connection_url'])
+            with redirect_stdout(io.StringIO()):
+                apply_ddl(pool, generate_ddl(generate_plan(conf, pool)))
+            pool.close()
+
+            dash = 'Dashboard 00000'
+            dash_id = next(i for i, d in server.dashboards['bench'].items() if d.dashboard_name == dash)
+
+            # only whitespace and key order changed: still up to date.
+            #
+            uri = conf['dashboards']['bench'][dash]['dashboard_uri']
+            with open(uri) as f:
+                name, metadata, state = f.read().splitlines()
+            with open(uri, 'w') as f:
+                f.write(f'{name}\n{metadata}\n{json.dumps(json.loads(state), indent=2, sort_keys=True).replace(chr(10), "")}\n')
+
+            pool = SessionPool(conf['connection_url'])
+            self.assertEqual(generate_plan(conf, pool)['dashboards']['bench'][dash]['state'], RESOURCE_STATES.UP_TO_DATE)
+            pool.close()
+
+            # a real change is replaced in place, keeping the id.
+            #
+            state = json.loads(state)
+            state['tabs']['tab1']['dashboard']['title'] = 'Changed'
+            with open(uri, 'w') as f:
+                f.write(f'{name}\n{metadata}\n{json.dumps(state)}\n')
+
+            server.reset_counts()
+            pool = SessionPool(conf['connection_url'])
+            plan = generate_plan(conf, pool)
+            with redirect_stdout(io.StringIO()):
+                apply_ddl(pool, generate_ddl(plan))
+            pool.close()
+
+        self.assertEqual(plan['dashboards']['bench'][dash]['state'], RESOURCE_STATES.NEEDS_UPDATE)
+        self.assertEqual(server.calls['replace_dashboard'], 1)
+        self.assertEqual(server.calls['create_dashboard'], 0)
+        self.assertEqual(server.calls['delete_dashboard'], 0)
+        self.assertIn('Changed', base64.b64decode(server.dashboards['bench'][dash_id].dashboard_state).decode())
+
+    def test_targeted_plan_shared_role(self):
+        server = FakeServer()
+
+        with tempfile.TemporaryDirectory() as directory, patch('src.deployment.util.connect', server.connect):
+            conf = validate(generate_artifacts(directory, 40, server))
+
+            # role_00000 exists, is granted to user_00000 and user_00002 and
+            # has policies.
+            #
+            def plan_ddl(target: str) -> tuple[dict, list[str]]:
+                pool = SessionPool(conf['connection_url'])
+                plan = generate_plan(copy.deepcopy(conf), pool, targets=[ parse_target(target) ])
+                pool.close()
+                return plan, [ op.ddl for op in generate_ddl(plan).ops if not op.is_note ]
+
+            # a user only needs its role to exist: the role, the other user
+            # and the policies are left alone.
+            #
+            plan, ddl = plan_ddl('users.user_00000')
+            self.assertEqual(ddl, ['ALTER USER "user_00000" (is_super=\'false\', can_login=\'true\', default_db=\'bench\')', 'GRANT role_00000 TO "user_00000"'])
+            self.assertIn(('roles', 'role_00000'), plan['required'])
+            self.assertNotIn(('roles', 'role_00000'), plan['config_hashes'])
+
+            # recreating the role revokes it from both users and drops its
+            # policies, so they're applied again, but the tables are not.
+            #
+            _, ddl = plan_ddl('roles.role_00000')
+            self.assertIn('DROP ROLE role_00000', ddl)
+            self.assertIn('GRANT role_00000 TO "user_00000"', ddl)
+            self.assertIn('GRANT role_00000 TO "user_00002"', ddl)
+            self.assertTrue(any(d.startswith('CREATE POLICY ON COLUMN table_000000.region TO "role_00000"') for d in ddl))
+            self.assertFalse(any(d.startswith(('DROP TABLE', 'ALTER TABLE', '\\replace_dashboard')) for d in ddl))
+
+    def test_dashboard_dependencies(self):
+        r = dashboard_benchmark.run(dashboard_benchmark.DEFAULT_DASHBOARD, repeat=1)
+
+        # the extraction only holds the data sources and parameters, not the
+        # decoded view state.
+        #
+        self.assertTrue(r['same_tables'])
+        self.assertLess(r['extract_peak'] * 20, r['json_loads_peak'])
+
+    def test_dashboard_process_pool(self):
+        results = dashboard_benchmark.scaling(dashboard_benchmark.DEFAULT_DASHBOARD, 4, [2], threads=2)
+
+        # the processes find the same tables as the planner threads.
+        #
+        self.assertEqual([r['processes'] for r in results], [0, 2])
+        self.assertTrue(all(r['same_tables'] and r['tables'] == results[0]['tables'] for r in results))
+        self.assertGreater(len(results[0]['tables']), 0)
@@ -0,0 +1,100 @@
+import base64
+import io
+import json
+import tempfile
+import unittest
+
+from contextlib import redirect_stdout
+
+from src.deployment.apply import apply_ddl
+from src.deployment.plan import generate_plan, generate_ddl
+from src.deployment.util import SessionPool, get_file_content
+from src.deployment.validate import validate
+
+from .fake_heavydb import FakeServer
+from .synthetic import BENCH_DB, generate_artifacts
+from .thrift_server import ThriftServer
+
+class ThriftServerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeServer()
+        self.thrift_server = ThriftServer(self.server).start()
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.thrift_server.stop()
+        self.tmpdir.cleanup()
+
+    def test_plan_and_apply(self):
+        conf = validate(generate_artifacts(self.tmpdir.name, 20, self.server, host=self.thrift_server.host,
+                                           port=self.thrift_server.port, dashboard_bytes=100000))
+
+        pool = SessionPool(conf['connection_url'])
+        plan = generate_plan(conf, pool, workers=2)
+        with redirect_stdout(io.StringIO()):
+            apply_ddl(pool, generate_ddl(plan), parallelism=2)
+
+        self.assertIn(('heavyai', 'CREATE ROLE role_00000'), self.server.statements)
+        self.assertIn('table_000019', self.server.tables[BENCH_DB])
+
+        # the imported dashboards made the round trip intact.
+        #
+        dash = plan['dashboards'][BENCH_DB]['Dashboard 00001']
+        dash_id = pool.dashboards.get_id(BENCH_DB, 'Dashboard 00001')
+        con = pool.get(BENCH_DB)
+
+        state = base64.b64decode(con._client.get_dashboard(con._session, dash_id).dashboard_state).decode()
+        self.assertEqual(state.rstrip(), get_file_content(dash['dashboard_uri']).split('\n')[2])
+
+        pool.close()
+        self.assertEqual(self.server.calls['disconnect'], self.server.calls['connect'])
+
+    def test_replace_changed_dashboard(self):
+        conf = validate(generate_artifacts(self.tmpdir.name, 20, self.server, host=self.thrift_server.host,
+                                           port=self.thrift_server.port))
+
+        pool = SessionPool(conf['connection_url'])
+        with redirect_stdout(io.StringIO()):
+            apply_ddl(pool, generate_ddl(generate_plan(conf, pool)))
+        pool.close()
+
+        dash = 'Dashboard 00000'
+        dash_id, owner = next((i, d.dashboard_owner) for i, d in self.server.dashboards[BENCH_DB].items() if d.dashboard_name == dash)
+
+        uri = conf['dashboards'][BENCH_DB][dash]['dashboard_uri']
+        with open(uri) as f:
+            name, metadata, state = f.read().splitlines()
+
+        state = json.loads(state)
+        state['tabs']['tab1']['dashboard']['title'] = 'Changed'
+        with open(uri, 'w') as f:
+            f.write(f'{name}\n{metadata}\n{json.dumps(state)}\n')
+
+        # the changed dashboard is replaced in place over the socket, keeping
+        # its id and owner.
+        #
+        self.server.reset_counts()
+        pool = SessionPool(conf['connection_url'])
+        with redirect_stdout(io.StringIO()):
+            apply_ddl(pool, generate_ddl(generate_plan(conf, pool)))
+        pool.close()
+
+        self.assertEqual(self.server.calls['replace_dashboard'], 1)
+        self.assertEqual(self.server.calls['create_dashboard'], 0)
+
+        replaced = self.server.dashboards[BENCH_DB][dash_id]
+        self.assertEqual(replaced.dashboard_owner, owner)
+        self.assertIn('Changed', base64.b64decode(replaced.dashboard_state).decode())
+
+    def test_injected_failure(self):
+        self.server.inject_failure('sql_execute', 'role creation failed', pattern='^CREATE ROLE')
+
+        pool = SessionPool(self.thrift_server.url())
+        with self.assertRaises(Exception) as cm:
+            pool.get().execute('CREATE ROLE r1')
+        self.assertIn('role creation failed', str(cm.exception))
+
+        pool.get().execute('CREATE ROLE r1')
+        self.assertEqual(self.server.roles, { 'r1' })
+        pool.close()
@@ -0,0 +1,266 @@
+"""
+A local stand-in HeavyDB server: the subset of the HeavyDB Thrift service
+the deployment uses, over a real socket with the binary protocol, backed by
+a FakeServer catalog. Unlike the in-process fake, it exercises heavyai.connect,
+the Thrift serialization of the payloads (dashboards in particular) and the
+session handling.
+
+To run the CLI against a synthetic catalog:
+
+    python -m test.integration.thrift_server --size 1000 --latency 0.001
+    python src/deploy_heavyai_artifacts.py --file <the artifacts file it prints> plan
+"""
+
+import argparse
+import functools
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+from heavydb.common.ttypes import TDatumType, TEncodingType, TTypeInfo
+from heavydb.thrift import Heavy
+from heavydb.thrift.ttypes import TColumn, TColumnData, TColumnType, TDBException, TQueryResult, TRowSet, TSessionInfo, TTableDetails
+from thrift.protocol import TBinaryProtocol
+from thrift.transport import TSocket, TTransport
+
+from .fake_heavydb import FakeClient, FakeServer
+from .synthetic import generate_artifacts
+
+
+SERVER_VERSION = '8.0.0'
+
+
+def _thrift_errors(fn):
+    """Raises the errors of a call as TDBExceptions, as the server does."""
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        except TDBException:
+            raise
+        except Exception as e:
+            raise TDBException(error_msg=f'Exception: {e}')
+
+    return wrapper
+
+
+class HeavyHandler:
+    """The HeavyDB service calls, translating the FakeServer's answers to the Thrift types."""
+
+    def __init__(self, server: FakeServer):
+        self._server = server
+        self._client = FakeClient(server)
+        self._started: dict[str, int] = {} # session -> start time
+
+    @_thrift_errors
+    def connect(self, user: str, passwd: str, dbname: str) -> str:
+        self._server.call('connect', dbname)
+
+        if user not in self._server.users:
+            raise RuntimeError(f'User {user} does not exist.')
+
+        session = self._server.open_session(dbname or 'heavyai')
+        self._started[session] = int(time.time())
+        return session
+
+    @_thrift_errors
+    def disconnect(self, session: str) -> None:
+        self._server.call('disconnect')
+        self._server.close_session(session)
+        self._started.pop(session, None)
+
+    @_thrift_errors
+    def get_version(self) -> str:
+        self._server.call('get_version')
+        return SERVER_VERSION
+
+    @_thrift_errors
+    def get_session_info(self, session: str) -> TSessionInfo:
+        self._server.call('get_session_info')
+        return TSessionInfo(user='admin', database=self._server.db(session), start_time=self._started.get(session, 0), is_super=True)
+
+    @_thrift_errors
+    def get_databases(self, session: str) -> list:
+        return self._client.get_databases(session)
+
+    @_thrift_errors
+    def switch_database(self, session: str, dbname: str) -> None:
+        self._client.switch_database(session, dbname)
+
+    @_thrift_errors
+    def get_dashboards(self, session: str) -> list:
+        return self._client.get_dashboards(session)
+
+    @_thrift_errors
+    def get_dashboard(self, session: str, dashboard_id: int):
+        return self._client.get_dashboard(session, dashboard_id)
+
+    @_thrift_errors
+    def create_dashboard(self, session: str, dashboard_name: str, dashboard_state: str, image_hash: str, dashboard_metadata: str) -> int:
+        return self._client.create_dashboard(session, dashboard_name, dashboard_state, image_hash, dashboard_metadata)
+
+    @_thrift_errors
+    def replace_dashboard(self, session: str, dashboard_id: int, dashboard_name: str, dashboard_owner: str, dashboard_state: str,
+                          image_hash: str, dashboard_metadata: str) -> None:
+        self._client.replace_dashboard(session, dashboard_id, dashboard_name, dashboard_owner, dashboard_state, image_hash, dashboard_metadata)
+
+    @_thrift_errors
+    def delete_dashboard(self, session: str, dashboard_id: int) -> None:
+        self._client.delete_dashboard(session, dashboard_id)
+
+    @_thrift_errors
+    def get_table_details(self, session: str, table_name: str) -> TTableDetails:
+        columns = self._client.get_table_details(session, table_name)
+        return TTableDetails(row_desc=[ TColumnType(col_name=c.name, col_type=_type_info(c.type)) for c in columns ])
+
+    @_thrift_errors
+    def sql_execute(self, session: str, query: str, column_format: bool, nonce: str, first_n: int, at_most_n: int) -> TQueryResult:
+        start = time.perf_counter()
+        names, rows = self._client.sql_execute(session, query)
+
+        row_desc = []
+        columns = []
+        for i, name in enumerate(names):
+            values = [ r[i] for r in rows ]
+            is_int = len(values) != 0 and all(isinstance(v, int) for v in values)
+
+            row_desc.append(TColumnType(col_name=name, col_type=_type_info('BIGINT' if is_int else 'STR')))
+            columns.append(TColumn(data=TColumnData(int_col=values) if is_int else TColumnData(str_col=[ str(v) for v in values ]),
+                                   nulls=[False] * len(values)))
+
+        elapsed = int((time.perf_counter() - start) * 1000)
+        return TQueryResult(row_set=TRowSet(row_desc=row_desc, rows=[], columns=columns, is_columnar=True),
+                            execution_time_ms=elapsed, total_time_ms=elapsed, nonce=nonce)
+
+
+def _type_info(type_name: str) -> TTypeInfo:
+    type_name = { 'TEXT': 'STR' }.get(type_name.upper(), type_name.upper())
+    datum_type = TDatumType._NAMES_TO_VALUES.get(type_name, TDatumType.STR)
+    encoding = TEncodingType.DICT if datum_type == TDatumType.STR else TEncodingType.NONE
+
+    return TTypeInfo(type=datum_type, encoding=encoding, nullable=True, is_array=False, precision=0, scale=0, comp_param=0)
+
+
+class ThriftServer:
+    """
+    Serves a FakeServer over Thrift on a local port (port 0: any free port),
+    a thread per connection, until stopped.
+    """
+
+    def __init__(self, server: FakeServer, host: str = '127.0.0.1', port: int = 0):
+        self.server = server
+        self._processor = Heavy.Processor(HeavyHandler(server))
+
+        self._sock = socket.create_server((host, port))
+        self.host, self.port = self._sock.getsockname()[:2]
+
+        self._clients: set[socket.socket] = set()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._serve, name='thrift_server', daemon=True)
+
+    def url(self, db: str = 'heavyai', user: str = 'admin', password: str = 'bench') -> str:
+        return f'heavyai://{user}:{password}@{self.host}:{self.port}/{db}'
+
+    def start(self) -> 'ThriftServer':
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+        self._sock.close()
+        self._thread.join()
+
+        with self._lock:
+            for client in self._clients:
+                client.close()
+
+    def __enter__(self) -> 'ThriftServer':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _serve(self) -> None:
+        while True:
+            try:
+                client, _ = self._sock.accept()
+            except OSError:
+                return
+
+            with self._lock:
+                self._clients.add(client)
+
+            threading.Thread(target=self._handle, args=(client,), name='thrift_client', daemon=True).start()
+
+    def _handle(self, client: socket.socket) -> None:
+        sock = TSocket.TSocket()
+        sock.setHandle(client)
+        transport = TTransport.TBufferedTransport(sock)
+        protocol = TBinaryProtocol.TBinaryProtocolAccelerated(transport)
+
+        try:
+            while True:
+                self._processor.process(protocol, protocol)
+        except (TTransport.TTransportException, OSError):
+            pass
+        finally:
+            transport.close()
+            with self._lock:
+                self._clients.discard(client)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Serve a synthetic catalog from a local stand-in HeavyDB Thrift server.')
+    parser.add_argument('--size', type=int, default=1000,
+                        help='The catalog size (number of static tables). (Default: 1000)')
+    parser.add_argument('--existing', type=float, default=0.5,
+                        help='Fraction of the artifacts already on the server. (Default: 0.5)')
+    parser.add_argument('--dashboard-bytes', type=int, default=0,
+                        help='Pad the dashboards to about this size, e.g. 2500000 for large dashboards. (Default: no padding)')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds each call takes. (Default: 0)')
+    parser.add_argument('--fail', metavar='<method>[:<count>[:<pattern>]]', action='append', default=[],
+                        help='Fail the next <count> calls (default: 1, -1: all) of a Thrift method, e.g. sql_execute:1:^CREATE ROLE. (Repeatable)')
+    parser.add_argument('--port', type=int, default=6274,
+                        help='The port to serve on. (Default: 6274)')
+    parser.add_argument('--dir', metavar='<directory>',
+                        help='Where to write the artifacts file and dashboards. (Default: a temporary directory)')
+    args = parser.parse_args()
+
+    server = FakeServer(args.latency)
+
+    directory = args.dir or tempfile.mkdtemp(prefix='heavyai_bench_')
+    os.makedirs(directory, exist_ok=True)
+
+    with ThriftServer(server, port=args.port) as thrift_server:
+        path = generate_artifacts(directory, args.size, server, args.existing,
+                                  host=thrift_server.host, port=thrift_server.port, dashboard_bytes=args.dashboard_bytes)
+
+        for f in args.fail:
+            method, count, pattern = (f.split(':', 2) + [None, None])[:3]
+            server.inject_failure(method, count=int(count or 1), pattern=pattern)
+
+        print(f'Serving a synthetic catalog of {args.size} tables on {thrift_server.host}:{thrift_server.port}.')
+        print(f'Artifacts file: {path}', flush=True)
+
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+
+        print(f'Calls: {dict(server.calls)}')
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
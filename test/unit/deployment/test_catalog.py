@@ -0,0 +1,60 @@
+import unittest
+
+from unittest.mock import MagicMock
+
+from heavydb.thrift.ttypes import TDBInfo
+
+from src.deployment.catalog import *
+
+class FakeCursor(list):
+    def __init__(self, columns: list[str], rows: list[tuple]):
+        super().__init__(rows)
+        self.description = [ (c, None, None, None, None, None, True) for c in columns ]
+
+QUERIES = {
+    'SELECT database_name, table_name FROM tables': (['database_name', 'table_name'], [('db1', 'tab1'), ('db1', 'tab2'), ('db2', 'tab1')]),
+    'SELECT database_name, dashboard_name, dashboard_id FROM dashboards': (['database_name', 'dashboard_name', 'dashboard_id'], [('db1', 'dash1', 7)]),
+    'SELECT role_name FROM roles': (['role_name'], [('role1',)]),
+    'SELECT user_name FROM users': (['user_name'], [('admin',), ('user1',)]),
+    'SHOW SERVERS': (['server_name', 'data_wrapper'], [('fs1', 'PARQUET_FILE')]),
+    'SHOW POLICIES role1': (['TABLE', 'COLUMN'], [('tab1', 'region')])
+}
+
+class CatalogTestCase(unittest.TestCase):
+
+    def test_snapshot(self):
+        con = MagicMock()
+        con._client.get_databases.return_value = [ TDBInfo(db_name='db1'), TDBInfo(db_name='db2') ]
+        con.execute.side_effect = lambda query: FakeCursor(*QUERIES[query])
+
+        pool = MagicMock()
+        pool.get.return_value = con
+
+        pool.dashboards.get_update_time.return_value = '2026-01-01 00:00:00'
+
+        server_conf = { 'foreign_servers': { 'db1': { 'fs1': {} } }, 'policies': { 'db1': { 'tab1': { 'region': { 'role1': '' } } } },
+                        'dashboards': { 'db1': { 'dash1': {}, 'dash2': {} } } }
+        catalog = CatalogSnapshot(pool, server_conf)
+
+        self.assertEqual(catalog.tables, { 'db1': { 'tab1', 'tab2' }, 'db2': { 'tab1' } })
+        self.assertEqual(catalog.get_dashboard_id('db1', 'dash1'), 7)
+        self.assertEqual(catalog.get_dashboard_id('db2', 'dash1'), -1)
+        self.assertEqual(catalog.roles, { 'role1' })
+        self.assertEqual(catalog.users, { 'admin', 'user1' })
+        self.assertEqual(catalog.servers['db1']['fs1'], { 'server_name': 'fs1', 'data_wrapper': 'PARQUET_FILE' })
+        self.assertEqual(catalog.policies['db1']['role1'], { 'REGION' })
+        self.assertTrue(catalog.has_server('db1', 'fs1'))
+        self.assertEqual(catalog.dashboard_times, { 'db1': { 'dash1': '2026-01-01 00:00:00' } })
+        pool.dashboards.get_update_time.assert_called_once_with('db1', 7)
+
+        # the fingerprint covers the per-database facts too.
+        #
+        fingerprint = catalog.fingerprint()
+        self.assertEqual(CatalogSnapshot(pool, server_conf).fingerprint(), fingerprint)
+
+        pool.dashboards.get_update_time.return_value = '2026-01-02 00:00:00'
+        self.assertNotEqual(CatalogSnapshot(pool, server_conf).fingerprint(), fingerprint)
+
+        catalog.dashboard_times['db1']['dash1'] = '2026-01-01 00:00:00'
+        catalog.policies['db1']['role1'].add('OTHER')
+        self.assertNotEqual(catalog.fingerprint(), fingerprint)
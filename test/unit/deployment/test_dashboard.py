@@ -0,0 +1,105 @@
+import base64
+import glob
+import hashlib
+import json
+import os
+import tempfile
+import unittest
+
+from src.deployment.dashboard import *
+from src.deployment.util import get_dash_table_deps
+
+DASHBOARDS_DIR = os.path.join(os.path.dirname(__file__), '..', '..', '..', 'test_assets', 'dashboards')
+
+STATE = '{"tabs": {"tab1": {"dashboard": {"title": "Flood – Saint Louis", "dataSources": {"tab1": {}}}}}}'
+
+class DashboardTestCase(unittest.TestCase):
+
+    def test_dashboard_export(self):
+        export = DashboardExport(f'My Dashboard\n{{"table": "tab1"}}\n{STATE}\n'.encode('utf-8'))
+
+        self.assertEqual(export.name, 'My Dashboard')
+        self.assertEqual(export.metadata, '{"table": "tab1"}')
+        self.assertEqual(export.state, STATE)
+        self.assertEqual(bytes(export.state_bytes), STATE.encode('utf-8'))
+        self.assertEqual(export.parse_state()['tabs']['tab1']['dashboard']['title'], 'Flood – Saint Louis')
+
+        # the hash is the one of the server copy of the state, however it ends
+        self.assertEqual(export.state_hash(), hashlib.md5(STATE.encode('utf-8')).hexdigest())
+        self.assertEqual(DashboardExport(f'dash\r\n{{}}\r\n{STATE}  \r\n'.encode('utf-8')).state_hash(), export.state_hash())
+        self.assertEqual(DashboardExport(f'dash\n{{}}\n{STATE}'.encode('utf-8')).state, STATE)
+
+        self.assertEqual(base64.b64encode(export.state_bytes), base64.b64encode(STATE.encode('utf-8')))
+
+        self.assertRaises(RuntimeError, DashboardExport, b'dash\n{}')
+
+    def test_from_file(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'dash.json')
+            with open(path, 'w') as f:
+                f.write(f'My Dashboard\n{{}}\n{STATE}\n')
+
+            export = DashboardExport.from_file(path)
+            self.assertEqual(export.name, 'My Dashboard')
+            self.assertEqual(export.state, STATE)
+
+            # closing it unmaps the file
+            with DashboardExport.from_file(path) as export:
+                self.assertEqual(export.state_hash(), hashlib.md5(STATE.encode('utf-8')).hexdigest())
+            self.assertTrue(export._buffer.closed)
+            self.assertRaises(ValueError, lambda: export.state_bytes)
+
+            with open(path, 'w') as f:
+                pass
+
+            self.assertRaises(RuntimeError, DashboardExport.from_file, path)
+
+    def test_parse_state_dependencies(self):
+        state = {
+            'tabs': {
+                'tab1': { 'charts': [{ 'sql': 'SELECT "}]" FROM x', 'escaped': 'a\\"{b' }], 'dashboard': { 'title': 'T', 'dataSources': { 'tab1': {}, '${join1}': { 'x': [1, 2] } } } },
+                'tab2': { 'dashboard': { 'dataSources': { 'db2.tab2': None } }, 'tabName': 'Tab 2' }
+            },
+            'parameters': { 'definitions': { 'join1': { 'type': 'JOIN', 'defaultValue': '"tab3" LEFT JOIN "tab4"' } }, 'values': {} },
+            'chartAddons': [True, False, None, -1.5e3]
+        }
+
+        deps = parse_state_dependencies(json.dumps(state).encode('utf-8'))
+        self.assertEqual(deps['tabs']['tab1']['dashboard'], { 'dataSources': { 'tab1': None, '${join1}': None } })
+        self.assertEqual(deps['parameters']['definitions'], state['parameters']['definitions'])
+        self.assertEqual(get_dash_table_deps(deps), ['db2.tab2', 'tab1', 'tab3', 'tab4'])
+
+        self.assertEqual(parse_state_dependencies(b' { } '), {})
+        self.assertRaises(ValueError, parse_state_dependencies, b'{"tabs": {"tab1": ')
+        self.assertRaises(ValueError, parse_state_dependencies, b'{"tabs" {}}')
+
+    def test_parse_dependencies_of_test_assets(self):
+        for path in glob.glob(os.path.join(DASHBOARDS_DIR, '*.json')):
+            export = DashboardExport.from_file(path)
+            self.assertEqual(get_dash_table_deps(export.parse_dependencies()), get_dash_table_deps(export.parse_state()), path)
+
+    def test_fingerprint_state(self):
+        state = {
+            'tabs': { 'tab1': { 'dashboard': { 'id': 26, 'version': '8.0.0', 'owner': 'admin', 'title': 'T', 'selectedTabId': 'tab1',
+                                               'saveState': { 'isSaved': False }, 'streaming': { 'interval': 0, 'last_request': 1666810981215 } },
+                                'charts': [{ 'sql': 'SELECT 1', 'title': 'Flood – Saint Louis' }] } },
+            'parameters': {}
+        }
+        fp = fingerprint_state(json.dumps(state).encode('utf-8'))
+
+        # key order, whitespace and the volatile fields don't matter
+        other = json.loads(json.dumps(state))
+        other['tabs']['tab1']['dashboard'].update(id=3, version='8.1.0', owner='etl', saveState={ 'isSaved': True })
+        other['tabs']['tab1']['dashboard']['streaming']['last_request'] = 0
+        del other['tabs']['tab1']['dashboard']['selectedTabId']
+        self.assertEqual(fingerprint_state(json.dumps(other, indent=4, sort_keys=True, ensure_ascii=False).encode('utf-8')), fp)
+        self.assertEqual(fingerprint_state(json.dumps(dict(reversed(state.items()))).encode('utf-8')), fp)
+
+        # but the rest does
+        other['tabs']['tab1']['dashboard']['title'] = 'U'
+        self.assertNotEqual(fingerprint_state(json.dumps(other).encode('utf-8')), fp)
+        other['tabs']['tab1']['dashboard']['title'] = 'T'
+        other['tabs']['tab1']['charts'][0]['id'] = 1
+        self.assertNotEqual(fingerprint_state(json.dumps(other).encode('utf-8')), fp)
+
+        self.assertEqual(DashboardExport(f'dash\n{{}}\n{json.dumps(state)}\n'.encode('utf-8')).state_fingerprint(), fp)
@@ -0,0 +1,170 @@
+import unittest
+
+from unittest.mock import MagicMock, patch
+
+from src.deployment.apply import *
+from src.deployment.constants import *
+from src.deployment.graph import *
+from src.deployment.plan import generate_ddl
+
+class GraphTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.plan = {
+            'default_database': 'heavyai',
+            'databases': {
+                'other_db': { 'state': RESOURCE_STATES.NEEDS_CREATION }
+            },
+            'static_tables': {
+                'other_db': {
+                    'tab1': { 'state': RESOURCE_STATES.NEEDS_CREATION, 'if_exists': RESOURCE_IF_EXISTS_ACTIONS.SKIP,
+                              'import': { 'is_dump': True, 'source_uri': 's3://bucket/tab1.tgz' } },
+                    'tab2': { 'state': RESOURCE_STATES.EXISTS, 'if_exists': RESOURCE_IF_EXISTS_ACTIONS.REPLACE,
+                              'ddl_cmd': 'CREATE TABLE tab2 (a INT)',
+                              'import': { 'is_dump': False, 'source_uri': 's3://bucket/tab2.csv' } }
+                }
+            },
+            'dashboards': {
+                'other_db': {
+                    'dash1': { 'state': RESOURCE_STATES.NEEDS_CREATION, 'if_exists': RESOURCE_IF_EXISTS_ACTIONS.RENAME,
+                               'dashboard_uri': 'dash1.json', 'table_deps': [('other_db', 'tab1')] }
+                }
+            },
+            'roles': {
+                'r1': { 'state': RESOURCE_STATES.NEEDS_CREATION, 'databases': { 'other_db': ['ACCESS'] },
+                        'dashboards': { 'other_db': { f"'{DASH_ID_TBD_PREFIX}dash1'": ['VIEW'] } } }
+            }
+        }
+
+    def get_op(self, graph, prefix):
+        return next(op for op in graph.ops if op.ddl.startswith(prefix))
+
+    def test_generate_ddl_dependencies(self):
+        graph = generate_ddl(self.plan)
+
+        create_db = self.get_op(graph, 'CREATE DATABASE other_db')
+        restore = self.get_op(graph, 'RESTORE TABLE tab1')
+        rename = self.get_op(graph, 'ALTER TABLE tab2')
+        create_tab2 = self.get_op(graph, 'CREATE TABLE tab2')
+        copy = self.get_op(graph, 'COPY tab2')
+        drop = self.get_op(graph, 'DROP TABLE tab2_replaced_on_')
+        dash = self.get_op(graph, '\\import_dashboard "dash1"')
+        role = self.get_op(graph, 'CREATE ROLE r1')
+        grant_db = self.get_op(graph, 'GRANT ACCESS ON DATABASE other_db')
+        grant_dash = self.get_op(graph, 'GRANT VIEW ON DASHBOARD')
+
+        self.assertEqual(restore.deps, { create_db.op_id })
+        self.assertEqual(create_tab2.deps, { create_db.op_id, rename.op_id })
+        self.assertEqual(copy.deps, { create_db.op_id, create_tab2.op_id })
+        self.assertEqual(drop.deps, { create_db.op_id, copy.op_id })
+        self.assertEqual(dash.deps, { create_db.op_id, restore.op_id })
+        self.assertEqual(role.deps, set())
+        self.assertEqual(grant_db.deps, { role.op_id, create_db.op_id })
+        self.assertEqual(grant_dash.deps, { role.op_id, dash.op_id, create_db.op_id })
+
+        # the printed listing is unchanged
+        #
+        ddls = graph.ddls()
+        self.assertEqual(ddls[:3], ['-- (databases) --', '\\db heavyai', 'CREATE DATABASE other_db'])
+        self.assertIn('-- (static_tables) --', ddls)
+        self.assertLess(ddls.index('RESTORE TABLE tab1 FROM \'s3://bucket/tab1.tgz\''), ddls.index('CREATE TABLE tab2 (a INT)'))
+
+    def test_policy_waits_for_replaced_table(self):
+        self.plan['policies'] = {
+            'other_db': { 'tab2': { 'col1': { 'r2': { 'state': RESOURCE_STATES.EXISTS, 'values': "'a'" } } } }
+        }
+        graph = generate_ddl(self.plan)
+
+        copy = self.get_op(graph, 'COPY tab2')
+        drop_policy = self.get_op(graph, 'DROP POLICY ON COLUMN tab2.col1')
+        create_policy = self.get_op(graph, 'CREATE POLICY ON COLUMN tab2.col1')
+
+        # the old policy is dropped once the replacement table is in place
+        #
+        self.assertIn(copy.op_id, drop_policy.deps)
+        self.assertIn(drop_policy.op_id, create_policy.deps)
+
+    def test_apply_ddl_failure_skips_downstream(self):
+        graph = generate_ddl(self.plan)
+
+        executed = []
+        def execute(ddl):
+            executed.append(ddl)
+            if ddl.startswith('RESTORE TABLE') or ddl.startswith('CREATE ROLE'):
+                raise Exception('boom')
+
+        pool = MagicMock()
+        pool.get.return_value.execute.side_effect = execute
+
+        with patch('src.deployment.apply.exec_dash_ddl') as mock_exec_dash_ddl, \
+             patch('src.deployment.apply.get_file_size', return_value=1024):
+            with self.assertRaises(RuntimeError) as cm:
+                apply_ddl(pool, graph, parallelism=4)
+
+        # the failed import stops the dashboard, the failed role stops its
+        # grants, but the other table is still replaced.
+        #
+        self.assertIn('CREATE ROLE r1', str(cm.exception))
+        self.assertNotIn('RESTORE TABLE', str(cm.exception))
+        mock_exec_dash_ddl.assert_not_called()
+        self.assertFalse(any(ddl.startswith('GRANT') for ddl in executed))
+        self.assertIn('COPY tab2 FROM \'s3://bucket/tab2.csv\'', executed)
+        self.assertEqual(self.get_op(graph, 'DROP TABLE tab2_replaced_on_').state, OPERATION_STATES.DONE)
+        self.assertEqual(self.get_op(graph, '\\import_dashboard').state, OPERATION_STATES.SKIPPED)
+
+    def test_apply_ddl_label(self):
+        graph = OperationGraph('heavyai')
+        graph.add('roles', 'heavyai', 'CREATE ROLE r1')
+        graph.add('roles', 'heavyai', 'CREATE ROLE r2')
+
+        with patch('src.deployment.apply.print') as mock_print:
+            apply_ddl(MagicMock(), graph, label='host1:6274')
+
+        lines = [ line for c in mock_print.call_args_list for line in c[0][0].split('\n') ]
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(all(line.startswith('[host1:6274]     [heavyai] CREATE ROLE') for line in lines))
+
+    def test_resolve_cycle(self):
+        graph = OperationGraph('heavyai')
+        a = graph.add('roles', 'heavyai', 'CREATE ROLE a', needs=(('role', 'b'),), provides=('role', 'a'))
+        graph.add('roles', 'heavyai', 'CREATE ROLE b', after=(a,), provides=('role', 'b'))
+
+        with self.assertRaises(RuntimeError):
+            graph.resolve()
+
+    def test_import_scheduler(self):
+        graph = OperationGraph('heavyai')
+        small = graph.add('static_tables', 'heavyai', "RESTORE TABLE small FROM 's3://bucket/small.tgz'")
+        big = graph.add('static_tables', 'heavyai', "RESTORE TABLE big FROM 's3://bucket/big.tgz'")
+        other = graph.add('roles', 'heavyai', 'CREATE ROLE r1')
+        graph.resolve()
+
+        with patch('src.deployment.apply.get_s3_client'), \
+             patch('src.deployment.apply.get_file_size', side_effect=lambda uri, s3_client: 10 if 'small' in uri else 1000):
+            sizes = get_import_sizes(graph)
+
+        self.assertEqual(sizes, { small.op_id: 10, big.op_id: 1000 })
+
+        # imports share the single slot, largest first
+        #
+        scheduler = ImportScheduler(graph, 1, None, sizes)
+        for op in graph.ops:
+            scheduler.push(op)
+
+        self.assertIs(scheduler.pop(), big)
+        self.assertIsNone(scheduler.pop())
+        scheduler.finished(big, True)
+        self.assertIs(scheduler.pop(), small)
+        scheduler.finished(small, True)
+        self.assertIs(scheduler.pop(), other)
+        self.assertEqual(scheduler.imported_bytes, 1010)
+
+        # imports in their own slots, one at a time
+        #
+        scheduler = ImportScheduler(graph, 1, 1, sizes)
+        for op in graph.ops:
+            scheduler.push(op)
+
+        self.assertIs(scheduler.pop(), big)
+        self.assertIs(scheduler.pop(), other)
+        self.assertIsNone(scheduler.pop())
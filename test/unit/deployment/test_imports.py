@@ -0,0 +1,46 @@
+import os
+import subprocess
+import sys
+import unittest
+
+PROJECT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..'))
+
+# the DB and cloud stacks (and their dependencies) validate must not import.
+#
+HEAVY_MODULES = { 'boto3', 'botocore', 'heavyai', 'heavydb', 'icecream', 'pandas', 'pyarrow', 'requests', 'sqlalchemy', 'thrift' }
+
+# seconds of imports allowed for validate. It's about 0.1s, and was over 2s
+# with the heavy modules imported at startup.
+#
+VALIDATE_IMPORT_BUDGET = 1.0
+
+class ImportTimeTestCase(unittest.TestCase):
+
+    def importtime(self, *args: str) -> dict[str, float]:
+        """Runs the CLI under -X importtime, returning the seconds spent importing each module (excluding submodules.)"""
+
+        env = dict(os.environ, HEAVYAI_HOST='localhost', HEAVYAI_DB_PORT='6274', APP_DB_USER='admin', APP_DB_PASS='password',
+                   APP_DB='heavyai', HC_AWS_ACCESS_KEY_ID='key', HC_AWS_SECRET_ACCESS_KEY='secret', PROJECT_DIR=PROJECT_DIR)
+
+        result = subprocess.run([sys.executable, '-X', 'importtime', os.path.join('src', 'deploy_heavyai_artifacts.py'), *args],
+                                cwd=PROJECT_DIR, env=env, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+
+        # import time: self [us] | cumulative | imported package
+        #
+        retval = {}
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'imported package' in line:
+                continue
+
+            self_us, _, name = line[len('import time:'):].split('|')
+            retval[name.strip()] = int(self_us) / 1e6
+
+        return retval
+
+    def test_validate(self):
+        imports = self.importtime('--file', os.path.join('test_assets', 'heavyai_artifacts.json'), 'validate')
+
+        self.assertIn('deployment.validate', imports)
+        self.assertEqual(sorted({ m.split('.')[0] for m in imports } & HEAVY_MODULES), [])
+        self.assertLess(sum(imports.values()), VALIDATE_IMPORT_BUDGET)
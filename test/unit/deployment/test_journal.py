@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+
+from unittest.mock import MagicMock, patch
+
+from src.deployment.apply import apply_ddl
+from src.deployment.constants import *
+from src.deployment.graph import OperationGraph
+from src.deployment.journal import *
+
+class JournalTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'test.journal')
+        os.environ['JOURNAL_TEST_PW'] = 'a_secret_password'
+
+        self.graph = OperationGraph('heavyai')
+        create = self.graph.add('users', 'heavyai', "CREATE USER u1 (password='a_secret_password')", provides=('user', 'u1'))
+        self.graph.add('users', 'heavyai', "CREATE USER u2 (password='Xy7-random-pw')")
+        self.graph.add('users', 'heavyai', 'GRANT r1 TO u1', after=(create,))
+        self.graph.secrets['Xy7-random-pw'] = DEFAULT_USER_INIT_PASSWORD
+        self.graph.resolve()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_resume(self):
+        executed = []
+        fail_grants = True
+        def execute(ddl):
+            executed.append(ddl)
+            if ddl.startswith('GRANT') and fail_grants:
+                raise Exception('boom')
+
+        pool = MagicMock()
+        pool.get.return_value.execute.side_effect = execute
+
+        journal = Journal.create(self.path, self.graph, ['JOURNAL_TEST_PW'])
+        with self.assertRaises(RuntimeError):
+            apply_ddl(pool, self.graph, journal=journal)
+        journal.close()
+
+        # no secrets in the journal
+        #
+        with open(self.path) as f:
+            text = f.read()
+        self.assertNotIn('a_secret_password', text)
+        self.assertNotIn('Xy7-random-pw', text)
+        self.assertIn('${JOURNAL_TEST_PW}', text)
+
+        self.assertTrue(Journal.unfinished(self.path))
+        self.assertRaises(RuntimeError, Journal.create, self.path, self.graph, [])
+
+        # only the failed grant runs again
+        #
+        journal, graph = Journal.resume(self.path)
+        self.assertEqual(graph.ops[0].ddl, "CREATE USER u1 (password='a_secret_password')")
+        self.assertEqual([ op.state for op in graph.ops ],
+                         [ OPERATION_STATES.DONE, OPERATION_STATES.DONE, OPERATION_STATES.PENDING ])
+
+        executed.clear()
+        fail_grants = False
+        apply_ddl(pool, graph, journal=journal)
+        journal.close()
+
+        self.assertEqual(executed, ['GRANT r1 TO u1'])
+        self.assertFalse(Journal.unfinished(self.path))
+        self.assertRaises(RuntimeError, Journal.resume, self.path)
+
+    def test_failed_import(self):
+        def execute(ddl):
+            if ddl.startswith('COPY'):
+                raise Exception('boom')
+
+        pool = MagicMock()
+        pool.get.return_value.execute.side_effect = execute
+
+        graph = OperationGraph('heavyai')
+        create = graph.add('static_tables', 'heavyai', 'CREATE TABLE t1 (c1 INTEGER)', provides=('table', 'heavyai', 't1'))
+        graph.add('static_tables', 'heavyai', f"COPY t1 FROM '{os.path.join(self.tmpdir.name, 't1.csv')}'", after=(create,))
+        graph.resolve()
+
+        # a failed import doesn't fail the apply, so it's not left unfinished
+        #
+        journal = Journal.create(self.path, graph, [])
+        apply_ddl(pool, graph, journal=journal)
+        journal.close()
+
+        self.assertEqual(graph.ops[1].state, OPERATION_STATES.FAILED)
+        self.assertFalse(Journal.unfinished(self.path))
@@ -0,0 +1,91 @@
+import os
+import tempfile
+import unittest
+
+from unittest.mock import MagicMock, patch
+
+from src.deployment.constants import *
+from src.deployment.graph import OperationGraph
+from src.deployment.planfile import *
+from src.deployment.state import hash_config
+
+class PlanFileTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'deploy.plan')
+        self.dash_uri = os.path.join(self.tmpdir.name, 'dash1.json')
+        with open(self.dash_uri, 'w') as f:
+            f.write('{}\n')
+
+        os.environ['PLANFILE_TEST_PW'] = 'a_secret_password'
+
+        self.conf = {
+            'databases': ['heavyai'],
+            'dashboards': { 'heavyai': { 'dash1': { 'dashboard_uri': self.dash_uri, 'if_exists': 'replace' } } },
+            'users': { 'u1': { 'password': 'a_secret_password', 'default_db': 'heavyai' } }
+        }
+
+        self.plan = {
+            'default_database': 'heavyai',
+            'catalog_fingerprint': 'abc',
+            'config_hashes': hash_config(self.conf),
+            'databases': { 'heavyai': { 'state': RESOURCE_STATES.EXISTS } },
+            'dashboards': { 'heavyai': { 'dash1': dict(self.conf['dashboards']['heavyai']['dash1'], state=RESOURCE_STATES.NEEDS_CREATION) } },
+            'users': { 'u1': { 'state': RESOURCE_STATES.NEEDS_CREATION } }
+        }
+
+        self.graph = OperationGraph('heavyai')
+        self.graph.add('dashboards', 'heavyai', f'\\import_dashboard "dash1" "{self.dash_uri}"', artifact=('dashboards', 'heavyai', 'dash1'))
+        self.graph.add('users', 'heavyai', "CREATE USER u1 (password='a_secret_password')", artifact=('users', 'u1'))
+        self.graph.resolve()
+
+        self.pool = MagicMock()
+        self.pool.server = 'localhost:6274'
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def load(self, fingerprint: str = 'abc'):
+        with patch('src.deployment.planfile.CatalogSnapshot') as mock_catalog:
+            mock_catalog.return_value.fingerprint.return_value = fingerprint
+            result = load_plan(self.path, self.conf, self.pool)
+
+        self.catalog_conf = mock_catalog.call_args[0][1]
+        return result
+
+    def test_save_and_load(self):
+        save_plan(self.path, self.plan, self.graph, 'localhost:6274', ['PLANFILE_TEST_PW'])
+
+        with open(self.path) as f:
+            self.assertNotIn('a_secret_password', f.read())
+
+        plan, graph = self.load()
+        self.assertEqual([ op.ddl for op in graph.ops ], [ op.ddl for op in self.graph.ops ])
+        self.assertEqual(graph.ops[0].artifact, ('dashboards', 'heavyai', 'dash1'))
+        self.assertEqual(plan['config_hashes'], self.plan['config_hashes'])
+        self.assertIn('dash1', plan['dashboards']['heavyai'])
+
+        # the catalog is checked for the artifacts that were planned.
+        #
+        self.assertEqual(self.catalog_conf['dashboards'], self.conf['dashboards'])
+
+    def test_stale(self):
+        save_plan(self.path, self.plan, self.graph, 'localhost:6274', ['PLANFILE_TEST_PW'])
+
+        # the server changed
+        #
+        with self.assertRaises(RuntimeError) as cm:
+            self.load('def')
+        self.assertIn('on the server changed', str(cm.exception))
+
+        # the artifacts file and a dashboard file changed
+        #
+        self.conf['users']['u1']['default_db'] = 'another_db'
+        with open(self.dash_uri, 'w') as f:
+            f.write('{ "changed": true }\n')
+
+        with self.assertRaises(RuntimeError) as cm:
+            self.load()
+        self.assertIn('"users.u1" changed', str(cm.exception))
+        self.assertIn(f'"{self.dash_uri}" changed', str(cm.exception))
@@ -0,0 +1,74 @@
+import unittest
+
+from unittest.mock import MagicMock
+
+from src.deployment import profile
+from src.deployment.profile import *
+
+class ProfileTestCase(unittest.TestCase):
+
+    def tearDown(self):
+        profile.disable()
+
+    def test_disabled(self):
+        self.assertFalse(is_enabled())
+
+        with span('phase', 'plan'):
+            pass
+
+        profiler = enable()
+        self.assertEqual(profiler.spans, [])
+
+    def test_report(self):
+        profiler = enable()
+
+        @profiled('io')
+        def get_file_content(uri):
+            return uri
+
+        client = MagicMock()
+        client.get_dashboards.return_value = []
+        profiled_client = ProfiledClient(client)
+
+        with span('phase', 'plan'):
+            for _ in range(3):
+                self.assertEqual(get_file_content('dash.json'), 'dash.json')
+                self.assertEqual(profiled_client.get_dashboards('session'), [])
+
+            with span('artifact', '_plan_dashboard', 'heavyai', ('dashboards', 'heavyai', 'dash1')):
+                pass
+
+        with span('phase', 'apply'):
+            with span('ddl', '\\import_dashboard', 'heavyai', ('dashboards', 'heavyai', 'dash1')):
+                pass
+            with span('ddl', 'CREATE ROLE', 'heavyai', ('roles', 'r1')):
+                pass
+
+        client.get_dashboards.assert_called_with('session')
+
+        report = profiler.report(top_n=1)
+        self.assertEqual([ (p['name'], p['count']) for p in report['phases'] ], [('plan', 1), ('apply', 1)])
+        self.assertEqual([ (r['name'], r['count']) for r in report['rpc'] ], [('get_dashboards', 3)])
+        self.assertEqual([ (r['name'], r['count']) for r in report['io'] ], [('get_file_content', 3)])
+        self.assertEqual(len(report['artifacts']), 1)
+
+        lines = format_report(profiler.report())
+        self.assertTrue(lines[0].startswith('Profile (wall time'))
+        self.assertIn('  Thrift calls:', lines)
+        self.assertTrue(any('dashboards.heavyai.dash1' in line for line in lines))
+
+    def test_trace_events(self):
+        profiler = enable()
+
+        with span('section', 'dashboards'):
+            with span('artifact', '_plan_dashboard', 'heavyai', ('dashboards', 'heavyai', 'dash1')):
+                pass
+
+        events = profiler.trace_events()
+        self.assertEqual([ e['ph'] for e in events ], ['M', 'M', 'X', 'X'])
+
+        artifact, section = events[2], events[3]
+        self.assertEqual(artifact['args'], { 'db': 'heavyai', 'artifact': 'dashboards.heavyai.dash1' })
+        self.assertEqual(artifact['tid'], section['tid'])
+        self.assertLessEqual(section['ts'], artifact['ts'])
+        self.assertGreaterEqual(section['ts'] + section['dur'], artifact['ts'] + artifact['dur'])
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import tempfile
+import unittest
+
+from unittest.mock import MagicMock, patch
+
+from src.deployment.constants import *
+from src.deployment.graph import OperationGraph
+from src.deployment.plan import _plan_dashboard
+from src.deployment.state import *
+
+class StateTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, 'state.json')
+        self.dash_uri = os.path.join(self.tmpdir.name, 'dash1.json')
+        with open(self.dash_uri, 'w') as f:
+            f.write('dash1\n{}\n{}\n')
+
+        self.conf = {
+            'databases': ['heavyai'],
+            'dashboards': { 'heavyai': { '_comment': 'x', 'dash1': { 'dashboard_uri': self.dash_uri, 'if_exists': 'replace' } } },
+            'roles': { 'r1': {} }
+        }
+
+        self.pool = MagicMock()
+        self.pool.dashboards.get_id.return_value = 7
+        self.pool.dashboards.get_update_time.return_value = '2024-01-01 00:00:00'
+        self.pool.dashboards.get_fingerprint.return_value = None
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_hash_config(self):
+        hashes = hash_config(self.conf)
+        self.assertEqual(set(hashes), { ('databases', 'heavyai'), ('dashboards', 'heavyai', 'dash1'), ('roles', 'r1') })
+
+        self.conf['dashboards']['heavyai']['dash1']['if_exists'] = 'skip'
+        self.assertNotEqual(hash_config(self.conf)[('dashboards', 'heavyai', 'dash1')], hashes[('dashboards', 'heavyai', 'dash1')])
+        self.assertEqual(hash_config(self.conf)[('roles', 'r1')], hashes[('roles', 'r1')])
+
+        # passwords aren't hashed, so they can't be recovered from the state.
+        #
+        users = { 'users': { 'u1': { 'password': 'a_secret_password', 'default_db': 'heavyai' } } }
+        user_hash = hash_config(users)[('users', 'u1')]
+        self.assertEqual(user_hash, hashlib.md5(json.dumps({ 'default_db': 'heavyai' }).encode()).hexdigest())
+
+        users['users']['u1']['password'] = 'another_password'
+        self.assertEqual(hash_config(users)[('users', 'u1')], user_hash)
+
+    def test_update_and_plan(self):
+        plan = { 'config_hashes': hash_config(self.conf), 'databases': { 'heavyai': {} }, 'roles': { 'r1': {} },
+                 'dashboards': { 'heavyai': { 'dash1': dict(self.conf['dashboards']['heavyai']['dash1'], fingerprint='md5:abc', state_fingerprint='fp1') } } }
+
+        graph = OperationGraph('heavyai')
+        graph.add('dashboards', 'heavyai', '\\import_dashboard "dash1"', artifact=('dashboards', 'heavyai', 'dash1'))
+        role = graph.add('roles', 'heavyai', 'CREATE ROLE r1', artifact=('roles', 'r1'))
+        graph.resolve()
+        graph.ops[0].state = OPERATION_STATES.DONE
+        role.state = OPERATION_STATES.FAILED
+
+        state = State('localhost:6274')
+        state.update(plan, graph, self.pool)
+        state.save(self.path)
+
+        # the failed role isn't recorded, and the state is only for its server
+        #
+        state = State.load(self.path, 'localhost:6274')
+        self.assertIsNone(state.get(('roles', 'r1')))
+        self.assertEqual(state.get(('dashboards', 'heavyai', 'dash1'))['dashboard_id'], 7)
+        self.assertEqual(state.get(('dashboards', 'heavyai', 'dash1'))['state_fingerprint'], 'fp1')
+        self.assertEqual(State.load(self.path, 'otherhost:6274').artifacts, {})
+
+        # an unchanged dashboard is up to date without comparing it
+        #
+        plan['dashboards']['heavyai']['dash1']['fingerprint'] = get_file_fingerprint(self.dash_uri)
+        state.set(('dashboards', 'heavyai', 'dash1'), dict(state.get(('dashboards', 'heavyai', 'dash1')),
+                                                           fingerprint=get_file_fingerprint(self.dash_uri)))
+
+        dash_plan = dict(self.conf['dashboards']['heavyai']['dash1'], state=RESOURCE_STATES.EXISTS, dashboard_id=7)
+        with patch('src.deployment.plan.analyze_dashboard') as mock_analyze_dashboard:
+            self.assertEqual(_plan_dashboard(self.pool, 'heavyai', 'dash1', dash_plan, MagicMock(), plan, state), '')
+
+        mock_analyze_dashboard.assert_not_called()
+        self.assertEqual(dash_plan['state'], RESOURCE_STATES.UP_TO_DATE)
+
+        # but one updated on the server since is compared
+        #
+        self.pool.dashboards.get_update_time.return_value = '2024-02-01 00:00:00'
+        dash_plan = dict(self.conf['dashboards']['heavyai']['dash1'], state=RESOURCE_STATES.EXISTS, dashboard_id=7)
+        with patch('src.deployment.plan.analyze_dashboard', return_value=('fp1', 'fp1', None)) as mock_analyze_dashboard:
+            _plan_dashboard(self.pool, 'heavyai', 'dash1', dash_plan, MagicMock(), plan, state)
+
+        mock_analyze_dashboard.assert_called_once()
+        self.pool.get.return_value._client.get_dashboard.assert_called_once()
+        self.assertEqual(dash_plan['state'], RESOURCE_STATES.UP_TO_DATE)
+
+        # a changed file is compared with the fingerprint recorded for the
+        # server copy, without downloading it again
+        #
+        self.pool.dashboards.get_update_time.return_value = '2024-01-01 00:00:00'
+        self.pool.get.return_value._client.get_dashboard.reset_mock()
+        state.set(('dashboards', 'heavyai', 'dash1'), dict(state.get(('dashboards', 'heavyai', 'dash1')), fingerprint='md5:old'))
+
+        dash_plan = dict(self.conf['dashboards']['heavyai']['dash1'], state=RESOURCE_STATES.EXISTS, dashboard_id=7)
+        with patch('src.deployment.plan.analyze_dashboard', return_value=('fp2', 'fp1', [])) as mock_analyze_dashboard:
+            _plan_dashboard(self.pool, 'heavyai', 'dash1', dash_plan, MagicMock(), plan, state)
+
+        self.assertEqual(mock_analyze_dashboard.call_args[0][1:], (None, 'fp1'))
+        self.pool.get.return_value._client.get_dashboard.assert_not_called()
+        self.assertEqual(dash_plan['state'], RESOURCE_STATES.NEEDS_UPDATE)
+        self.assertEqual(dash_plan['state_fingerprint'], 'fp2')
+
+    def test_changed_artifacts(self):
+        conf = {
+            'databases': ['db1'],
+            'static_tables': { 'db1': { 'tab1': { 'ddl_uri': self.dash_uri }, 'tab2': {} } },
+            'policies': { 'db1': { 'tab1': { 'col1': { 'r1': '1, 2' } } } },
+            'roles': { 'r1': { 'databases': { 'db1': ['ACCESS'] } }, 'r2': {} },
+            'users': { 'u1': { 'default_db': 'heavyai', 'roles': ['r1'] } }
+        }
+        hashes = hash_config(conf)
+
+        state = State('localhost:6274')
+        for a, h in hashes.items():
+            state.set(a, { 'config_hash': h, 'fingerprints': {} })
+        state.set(('static_tables', 'db1', 'tab1'), { 'config_hash': hashes[('static_tables', 'db1', 'tab1')],
+                                                      'fingerprints': { self.dash_uri: get_file_fingerprint(self.dash_uri) } })
+
+        self.assertEqual(get_changed_artifacts(conf, hashes, state), set())
+
+        # a changed role is recreated, so its policies and grants go too
+        #
+        conf['roles']['r1']['databases']['db1'].append('SELECT')
+        hashes = hash_config(conf)
+        changed = get_changed_artifacts(conf, hashes, state)
+        self.assertEqual(changed, { ('roles', 'r1'), ('policies', 'db1', 'tab1', 'col1', 'r1'), ('users', 'u1') })
+
+        filtered = filter_config(conf, [ a for a in hashes if a in changed ])
+        self.assertEqual(set(filtered), { 'policies', 'roles', 'users' })
+        self.assertEqual(list(filtered['roles']), ['r1'])
+
+        # so is a table whose DDL file changed
+        #
+        with open(self.dash_uri, 'w') as f:
+            f.write('{ "changed": true }\n')
+
+        self.assertIn(('static_tables', 'db1', 'tab1'), get_changed_artifacts(conf, hashes, state))
+        self.assertNotIn(('static_tables', 'db1', 'tab2'), get_changed_artifacts(conf, hashes, state))
@@ -0,0 +1,63 @@
+import unittest
+
+from src.deployment.constants import *
+from src.deployment.state import hash_config
+from src.deployment.target import *
+
+class TargetTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.conf = {
+            'databases': ['db1'],
+            'static_tables': { 'db1': { 'tab1': {}, 'tab2': {} } },
+            'foreign_servers': { 'db1': { 'fs1': {}, 'fs2': {} } },
+            'foreign_tables': { 'db1': { 'ftab1': { 'server': 'fs1' } } },
+            'policies': { 'db1': { 'tab1': { 'col1': { 'r1': '1, 2' } } } },
+            'roles': { 'r1': {}, 'r2': {} },
+            'users': { 'u1': { 'default_db': 'heavyai', 'roles': ['r2'] } }
+        }
+        self.artifacts = list(hash_config(self.conf))
+
+    def test_parse_target(self):
+        self.assertEqual(parse_target('dashboards.heavyai."Flood St Louis"'), ('dashboards', 'heavyai', 'Flood St Louis'))
+        self.assertEqual(parse_target('static_tables.heavyai.*'), ('static_tables', 'heavyai', '*'))
+        self.assertEqual(parse_target('dashboards.db1."a \\"b\\".c"'), ('dashboards', 'db1', 'a "b".c'))
+
+        for address in ('', 'tables.db1', 'roles.r1.x', 'static_tables..tab1', 'static_tables.db1"tab1"'):
+            self.assertRaises(RuntimeError, parse_target, address)
+
+    def test_select_targets(self):
+        select = lambda *targets: select_targets(self.conf, self.artifacts, [ parse_target(t) for t in targets ])
+
+        self.assertEqual(select('foreign_tables.db1.ftab1'),
+                         ({ ('foreign_tables', 'db1', 'ftab1') }, { ('foreign_servers', 'db1', 'fs1'), ('databases', 'db1') }))
+        self.assertEqual(select('policies'),
+                         ({ ('policies', 'db1', 'tab1', 'col1', 'r1') }, { ('static_tables', 'db1', 'tab1'), ('roles', 'r1'), ('databases', 'db1') }))
+
+        # replacing a table loses its policies, so they're applied again.
+        #
+        self.assertEqual(select('users.u1', 'static_tables.db1.tab*'),
+                         ({ ('users', 'u1'), ('static_tables', 'db1', 'tab1'), ('static_tables', 'db1', 'tab2'), ('policies', 'db1', 'tab1', 'col1', 'r1') },
+                          { ('roles', 'r1'), ('roles', 'r2'), ('databases', 'db1') }))
+
+        self.conf['static_tables']['db1']['tab1']['if_exists'] = RESOURCE_IF_EXISTS_ACTIONS.SKIP
+        self.assertEqual(select('static_tables.db1.tab1'), ({ ('static_tables', 'db1', 'tab1') }, { ('databases', 'db1') }))
+
+        self.assertRaises(RuntimeError, select, 'roles.r3')
+
+    def test_select_shared_role(self):
+        self.conf['users'] = { 'u1': { 'roles': ['r1'] }, 'u2': { 'roles': ['r1'] } }
+        self.artifacts = list(hash_config(self.conf))
+        select = lambda *targets: select_targets(self.conf, self.artifacts, [ parse_target(t) for t in targets ])
+
+        # a user only needs its role to exist, so the role (and with it the
+        # other user's grant and the policy) is left alone.
+        #
+        self.assertEqual(select('users.u1'), ({ ('users', 'u1') }, { ('roles', 'r1') }))
+
+        # a role is recreated, which revokes it from both users and drops its
+        # policy, so they're applied again.
+        #
+        self.assertEqual(select('roles.r1'),
+                         ({ ('roles', 'r1'), ('users', 'u1'), ('users', 'u2'), ('policies', 'db1', 'tab1', 'col1', 'r1') },
+                          { ('static_tables', 'db1', 'tab1'), ('databases', 'db1') }))